@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Compares two results files of run.py, e.g. of two todb versions, run by run"""
+import argparse
+import json
+from typing import Dict, Any, Tuple
+
+RunKey = Tuple[str, int, int]
+
+
+def _runs_by_key(results_path: str) -> Dict[RunKey, Dict[str, Any]]:
+    with open(results_path) as results_file:
+        results = json.load(results_file)
+    return {(run["target"], run["chunk_kB"], run["proc"]): run for run in results["runs"]}
+
+
+def compare(baseline_path: str, current_path: str, threshold: float) -> int:
+    """Prints throughput change of runs present in both files; returns number of runs slower by more than
+    threshold (fraction)"""
+    baseline, current = _runs_by_key(baseline_path), _runs_by_key(current_path)
+    regressions = 0
+    for key in sorted(set(baseline) & set(current)):
+        before, after = baseline[key]["rows_per_sec"], current[key]["rows_per_sec"]
+        change = (after - before) / before if before else 0.
+        is_regression = change < -threshold
+        regressions += int(is_regression)
+        print("{:>8} | chunk {:>5} kB | proc {:>2} | {:>10.1f} -> {:>10.1f} rows/s ({:+.1%}){}".format(
+            key[0], key[1], key[2], before, after, change, "  REGRESSION" if is_regression else ""))
+    for key in sorted(set(baseline) ^ set(current)):
+        print("{:>8} | chunk {:>5} kB | proc {:>2} | present in one of files only".format(*key))
+    return regressions
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Compares throughput of two todb benchmark results')
+    parser.add_argument('baseline', type=str, help='Results JSON file of baseline version')
+    parser.add_argument('current', type=str, help='Results JSON file of compared version')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Fraction of throughput drop reported as regression; default: 0.1')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    exit(1 if compare(args.baseline, args.current, args.threshold) else 0)
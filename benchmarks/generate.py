@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Generates synthetic CSV file of given size and column mix, together with todb model file of it"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Callable, Tuple
+
+COLUMN_TYPES = ["datetime", "float", "latlon", "bool", "string", "int"]
+DEFAULT_COLUMNS = "datetime:1,float:3,latlon:2,bool:1,string:2"
+_START_TIME = datetime(2018, 8, 30)
+_WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+_INVALID_VALUES = {
+    "datetime": "not a date",
+    "float": "1.2.3.4x",
+    "latlon": "",
+    "bool": "maybe",
+    "int": "12.5x"
+}  # values failing to cast; strings can not fail, so rows with only string columns are broken by missing cells
+
+CellGenerator = Callable[[random.Random, int], str]
+
+
+def _datetime_cell(rand: random.Random, row_number: int) -> str:
+    return (_START_TIME + timedelta(seconds=row_number)).strftime("%d %b %Y %H:%M:%S")
+
+
+def _float_cell(rand: random.Random, row_number: int) -> str:
+    return "{:.4f}".format(rand.uniform(-1000, 1000))
+
+
+def _latlon_cell(rand: random.Random, row_number: int) -> str:
+    return "{}-{:02d}-{:02d}{}".format(rand.randint(0, 89), rand.randint(0, 59), rand.randint(0, 59),
+                                       rand.choice("NS"))
+
+
+def _bool_cell(rand: random.Random, row_number: int) -> str:
+    return rand.choice(["true", "false"])
+
+
+def _string_cell(rand: random.Random, row_number: int) -> str:
+    return "{}_{}".format(rand.choice(_WORDS), rand.randint(0, 9999))
+
+
+def _int_cell(rand: random.Random, row_number: int) -> str:
+    return str(rand.randint(-10 ** 9, 10 ** 9))
+
+
+_CELL_GENERATORS = {
+    "datetime": _datetime_cell,
+    "float": _float_cell,
+    "latlon": _latlon_cell,
+    "bool": _bool_cell,
+    "string": _string_cell,
+    "int": _int_cell
+}  # type: Dict[str, CellGenerator]
+
+
+def parse_column_mix(column_mix: str) -> List[str]:
+    """Parses column mix like 'datetime:1,float:3' into list of column types"""
+    column_types = []  # type: List[str]
+    for part in column_mix.split(","):
+        column_type, _, count = part.strip().partition(":")
+        if column_type not in COLUMN_TYPES:
+            raise ValueError("Unknown column type {}; known ones: {}".format(column_type, COLUMN_TYPES))
+        column_types.extend([column_type] * int(count or 1))
+    if not column_types:
+        raise ValueError("Column mix {} does not contain any column".format(column_mix))
+    return column_types
+
+
+def build_model(column_types: List[str]) -> Dict[str, Any]:
+    columns = {"{}_{}".format(column_type, i): {"input_file_column": i, "type": column_type, "nullable": False,
+                                                 "index": False, "unique": False}
+               for i, column_type in enumerate(column_types)}
+    return {"file": {"encoding": "utf-8", "has_header": True, "row_delimiter": "\n", "cell_delimiter": ","},
+            "columns": columns,
+            "primary_key": "autoincrement"}
+
+
+def _broken_row(rand: random.Random, cells: List[str], column_types: List[str]) -> List[str]:
+    castable = [i for i, column_type in enumerate(column_types) if column_type in _INVALID_VALUES]
+    if castable:
+        i = rand.choice(castable)
+        cells[i] = _INVALID_VALUES[column_types[i]]
+        return cells
+    return cells[:-1]
+
+
+def generate(output_path: str, size_MB: float, column_types: List[str], error_rate: float,
+             seed: int = 0) -> Tuple[int, int]:
+    """Writes CSV of approximately given size (header row included) and its model next to it (+ .json);
+    returns number of rows and number of them that should fail to import"""
+    rand = random.Random(seed)
+    generators = [_CELL_GENERATORS[column_type] for column_type in column_types]
+    size_bytes = int(size_MB * 1000 * 1000)
+    rows, broken_rows, written_bytes = 0, 0, 0
+    with open(output_path, "w", encoding="utf-8", newline="") as output_file:
+        header = ",".join(build_model(column_types)["columns"].keys()) + "\n"
+        output_file.write(header)
+        written_bytes += len(header)
+        while written_bytes < size_bytes:
+            cells = [generator(rand, rows) for generator in generators]
+            if rand.random() < error_rate:
+                cells = _broken_row(rand, cells, column_types)
+                broken_rows += 1
+            line = ",".join(cells) + "\n"
+            output_file.write(line)
+            written_bytes += len(line)
+            rows += 1
+    with open(output_path + ".json", "w", encoding="utf-8") as model_file:
+        json.dump(build_model(column_types), model_file, indent=2)
+    return rows, broken_rows
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Generates synthetic CSV file and todb model for benchmarks')
+    parser.add_argument('output', type=str, help='Path to CSV file to write; model is written to the same path + .json')
+    parser.add_argument('--size', type=float, default=10., help='Approximate size of CSV file in MB; default: 10')
+    parser.add_argument('--columns', type=str, default=DEFAULT_COLUMNS,
+                        help='Column types and their counts, from: {}; default: {}'.format(COLUMN_TYPES,
+                                                                                           DEFAULT_COLUMNS))
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help='Fraction of rows that fail to import (having a value that can not be cast); default: 0')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of random generator; default: 0')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    rows, broken_rows = generate(args.output, args.size, parse_column_mix(args.columns), args.error_rate, args.seed)
+    print("Generated {} rows ({} of them broken) into {}".format(rows, broken_rows, args.output))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Runs todb import of synthetic CSV file across matrix of chunk sizes and process counts against SQLite
+(and PostgreSQL, when available); stores results as JSON, to be compared between versions with compare.py"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from os import path
+from typing import Dict, Any, List, Optional
+
+from generate import generate, parse_column_mix, DEFAULT_COLUMNS
+
+REPO_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+POSTGRES_URL_ENV = "TODB_BENCH_POSTGRES_URL"
+TARGET_SQLITE = "sqlite"
+TARGET_POSTGRES = "postgres"
+BENCHMARK_TABLE = "todb_benchmark"
+_TODB_CLI = "import sys; from todb.main import cli_main; sys.argv = ['todb'] + sys.argv[1:]; cli_main()"
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _todb_version() -> str:
+    with open(path.join(REPO_DIR, "version.txt")) as version_file:
+        return version_file.read().strip()
+
+
+def _postgres_available(postgres_url: str) -> bool:
+    from sqlalchemy import create_engine
+    try:
+        engine = create_engine(postgres_url)
+        engine.connect().close()
+        engine.dispose()
+        return True
+    except Exception as e:
+        print("PostgreSQL at {} is not available, skipping it: {}".format(postgres_url, e))
+        return False
+
+
+def _drop_benchmark_table(db_url: str) -> None:
+    from sqlalchemy import create_engine
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        connection.execute("DROP TABLE IF EXISTS {}".format(BENCHMARK_TABLE))
+    engine.dispose()
+
+
+def run_todb(input_path: str, db_url: str, chunk_kB: int, processes: int, work_dir: str,
+             extra_args: List[str]) -> Dict[str, Any]:
+    """Imports input file into fresh benchmark table using todb CLI in separate process; returns its timing
+    together with per-stage stats taken from todb run report"""
+    report_path = path.join(work_dir, "report.json")
+    failures_path = path.join(work_dir, "failed.csv")
+    command = [sys.executable, "-c", _TODB_CLI, input_path, input_path + ".json", db_url,
+               "--table", BENCHMARK_TABLE, "--chunk", str(chunk_kB), "--proc", str(processes),
+               "--failures", failures_path, "--report", report_path] + extra_args
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, os.environ.get("PYTHONPATH", "")]))
+    start = time.perf_counter()
+    completed = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    took_seconds = time.perf_counter() - start
+    if completed.returncode != 0 or not path.exists(report_path):
+        raise RuntimeError("todb failed with exit code {}: {}".format(completed.returncode,
+                                                                      completed.stdout.decode("utf-8")[-2000:]))
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    os.remove(report_path)
+    rows = report["counters"].get("rows", 0)
+    failed_rows = report["counters"].get("failed_rows", 0)
+    size_MB = path.getsize(input_path) / 1000 / 1000
+    return {"seconds": round(took_seconds, 3),
+            "rows": rows,
+            "failed_rows": failed_rows,
+            "rows_per_sec": round(rows / took_seconds, 1),
+            "MB_per_sec": round(size_MB / took_seconds, 3),
+            "stages": {stage: round(timer["total_sec"], 3) for stage, timer in report["stages"].items()}}
+
+
+def run_matrix(input_path: str, targets: Dict[str, str], chunks: List[int], processes: List[int], repeat: int,
+               extra_args: List[str]) -> List[Dict[str, Any]]:
+    runs = []  # type: List[Dict[str, Any]]
+    with tempfile.TemporaryDirectory(prefix="todb-benchmark-") as work_dir:
+        for target, db_url in targets.items():
+            for chunk_kB in chunks:
+                for proc in processes:
+                    results = []  # type: List[Dict[str, Any]]
+                    for _ in range(repeat):
+                        if target == TARGET_SQLITE:
+                            sqlite_path = path.join(work_dir, "benchmark.db")
+                            if path.exists(sqlite_path):
+                                os.remove(sqlite_path)  # each run starts with empty DB file
+                            db_url = "sqlite:///{}".format(sqlite_path)
+                        else:
+                            _drop_benchmark_table(db_url)
+                        results.append(run_todb(input_path, db_url, chunk_kB, proc, work_dir, extra_args))
+                    best = min(results, key=lambda r: r["seconds"])
+                    run = {"target": target, "chunk_kB": chunk_kB, "proc": proc, "repeats": repeat,
+                           "all_seconds": [r["seconds"] for r in results]}
+                    run.update(best)
+                    print("{:>8} | chunk {:>5} kB | proc {:>2} | {:>8.2f}s | {:>10.1f} rows/s | {} failed".format(
+                        target, chunk_kB, proc, best["seconds"], best["rows_per_sec"], best["failed_rows"]))
+                    runs.append(run)
+            if target != TARGET_SQLITE:
+                _drop_benchmark_table(db_url)
+    return runs
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmarks todb across matrix of --chunk and --proc values')
+    parser.add_argument('--output', type=str,
+                        help='Path to JSON file with results; default: benchmarks/results/<version>-<time>.json')
+    parser.add_argument('--input', type=str,
+                        help='Existing CSV file (with model in the same path + .json) to import instead of generating '
+                             'synthetic one')
+    parser.add_argument('--size', type=float, default=10., help='Size of generated CSV file in MB; default: 10')
+    parser.add_argument('--columns', type=str, default=DEFAULT_COLUMNS,
+                        help='Column mix of generated CSV file; default: {}'.format(DEFAULT_COLUMNS))
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help='Fraction of rows of generated CSV file that fail to import; default: 0')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of generated CSV file; default: 0')
+    parser.add_argument('--chunks', type=_int_list, default=[128, 512, 2048],
+                        help='Comma-separated chunk sizes in kB; default: 128,512,2048')
+    parser.add_argument('--procs', type=_int_list, default=[1, os.cpu_count() or 1],
+                        help='Comma-separated numbers of processes; default: 1 and number of CPUs')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of runs of each combination, the fastest one is stored; default: 1')
+    parser.add_argument('--postgres', type=str, default=os.environ.get(POSTGRES_URL_ENV),
+                        help='PostgreSQL URL to benchmark against as well (table {} is dropped before each run); '
+                             'default: {} environment variable'.format(BENCHMARK_TABLE, POSTGRES_URL_ENV))
+    parser.add_argument('--no-sqlite', action='store_true', help='Does not benchmark against SQLite')
+    parser.add_argument('--todb-args', type=str, default="",
+                        help='Additional arguments passed to each todb run, e.g. "--parse-in-workers"')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    targets = {}  # type: Dict[str, str]
+    if not args.no_sqlite:
+        targets[TARGET_SQLITE] = "sqlite://"  # DB file is created in temporary directory for each run
+    if args.postgres and _postgres_available(args.postgres):
+        targets[TARGET_POSTGRES] = args.postgres
+    if not targets:
+        raise SystemExit("No DB to benchmark against")
+
+    with tempfile.TemporaryDirectory(prefix="todb-benchmark-data-") as data_dir:
+        if args.input:
+            input_path = args.input
+            dataset = {"input": path.abspath(input_path)}  # type: Dict[str, Any]
+        else:
+            input_path = path.join(data_dir, "benchmark.csv")
+            rows, broken_rows = generate(input_path, args.size, parse_column_mix(args.columns), args.error_rate,
+                                         args.seed)
+            dataset = {"size_MB": args.size, "columns": args.columns, "error_rate": args.error_rate,
+                       "seed": args.seed, "rows": rows, "broken_rows": broken_rows}
+        dataset["file_size_bytes"] = path.getsize(input_path)
+        runs = run_matrix(input_path, targets, args.chunks, args.procs, args.repeat, args.todb_args.split())
+
+    results = {"todb_version": _todb_version(),
+               "git_commit": _git_commit(),
+               "date": datetime.utcnow().isoformat(timespec="seconds"),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "cpus": os.cpu_count(),
+               "todb_args": args.todb_args,
+               "dataset": dataset,
+               "runs": runs}
+    output_path = args.output or path.join(REPO_DIR, "benchmarks", "results", "{}-{}.json".format(
+        results["todb_version"], datetime.utcnow().strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(path.dirname(path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+    print("Results written to {}".format(output_path))
+
+
+if __name__ == "__main__":
+    main()
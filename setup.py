@@ -23,6 +23,7 @@ setup(
     packages=find_packages(exclude=("test", "test.*")),
     install_requires=REQUIREMENTS,
     tests_require=REQUIREMENTS_DEV,
+    extras_require={"columnar": ["numpy"]},
     entry_points={
         'console_scripts': [
             'todb = todb.main:cli_main'
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+from todb.checkpoint import CheckpointJournal, merge_ranges
+from todb.parsing import ByteRange
+
+
+class CheckpointJournalTest(unittest.TestCase):
+    def setUp(self):
+        file_descriptor, self.journal_path = tempfile.mkstemp(suffix=".journal")
+        os.close(file_descriptor)
+
+    def tearDown(self):
+        os.remove(self.journal_path)
+
+    def test_should_merge_overlapping_and_adjacent_ranges(self):
+        self.assertEqual(merge_ranges([(30, 40), (0, 10), (10, 20), (35, 50), (60, 70)]),
+                         [(0, 20), (30, 50), (60, 70)])
+
+    def test_should_tell_ranges_committed_by_previous_import(self):
+        journal = CheckpointJournal(self.journal_path)
+        journal.reset()
+        journal.record([ByteRange("input.csv", 0, 100), ByteRange("input.csv", 200, 100)], "worker-1")
+        journal.record([ByteRange("input.csv", 100, 100)], "worker-2")
+        journal.record([ByteRange("other.csv", 400, 100)], "worker-2")
+        journal.close()
+
+        resumed_journal = CheckpointJournal(self.journal_path)
+        self.assertEqual(resumed_journal.load(), 4)
+        self.assertTrue(resumed_journal.is_committed(ByteRange("input.csv", 0, 300)))
+        self.assertTrue(resumed_journal.is_committed(ByteRange(os.path.abspath("input.csv"), 150, 50)))
+        self.assertFalse(resumed_journal.is_committed(ByteRange("input.csv", 250, 100)))
+        self.assertFalse(resumed_journal.is_committed(ByteRange("input.csv", 400, 100)))
+
+    def test_should_forget_committed_ranges_on_reset(self):
+        journal = CheckpointJournal(self.journal_path)
+        journal.record([ByteRange("input.csv", 0, 100)], "worker-1")
+        journal.close()
+        journal.reset()
+        self.assertEqual(journal.load(), 0)
+        self.assertFalse(journal.is_committed(ByteRange("input.csv", 0, 100)))
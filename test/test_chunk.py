@@ -0,0 +1,49 @@
+import pickle
+import unittest
+
+from todb.chunk import Chunk
+
+
+class ChunkTest(unittest.TestCase):
+    def setUp(self):
+        self.text = "a,1,x\nb,2,y,extra\n\nc,3,z"
+        self.rows = [r.split(",") for r in self.text.split("\n")]
+
+    def test_should_give_same_rows_as_splitting_text(self):
+        chunk = Chunk(self.text, "\n", ",")
+        self.assertEqual(len(chunk), len(self.rows))
+        self.assertEqual(list(chunk), self.rows)
+        self.assertEqual([chunk[i] for i in range(len(chunk))], self.rows)
+        self.assertEqual(chunk[-1], self.rows[-1])
+        self.assertEqual(chunk[1:3], self.rows[1:3])
+        self.assertEqual(chunk[::-2], self.rows[::-2])
+        self.assertEqual(chunk, self.rows)
+        with self.assertRaises(IndexError):
+            chunk[len(self.rows)]
+
+    def test_should_split_rows_by_multi_char_delimiter(self):
+        chunk = Chunk(self.text.replace("\n", "\r\n"), "\r\n", ",")
+        self.assertEqual([chunk[i] for i in reversed(range(len(chunk)))], list(reversed(self.rows)))
+        self.assertEqual(chunk.row_text(1), "b,2,y,extra")
+
+    def test_should_leave_cells_over_max_cells_in_last_cell(self):
+        chunk = Chunk(self.text, "\n", ",", max_cells=2)
+        self.assertEqual(chunk[1], ["b", "2,y,extra"])
+        self.assertEqual(list(chunk), [r.split(",", 1) for r in self.text.split("\n")])
+        self.assertEqual("\n".join(",".join(cells) for cells in chunk), self.text)
+
+    def test_should_pickle_only_text(self):
+        chunk = Chunk("\n".join("row {},{},{}".format(i, i * 2, i * 3) for i in range(100)), "\n", ",", 3)
+        pickled_size = len(pickle.dumps(chunk))
+        chunk[5]  # builds offsets, which should not be pickled
+        self.assertEqual(len(pickle.dumps(chunk)), pickled_size)
+        self.assertLess(pickled_size, len(pickle.dumps(list(chunk))))
+        unpickled_chunk = pickle.loads(pickle.dumps(chunk))
+        self.assertEqual(unpickled_chunk, chunk)
+        self.assertEqual(unpickled_chunk.max_cells, 3)
+
+    def test_should_have_no_rows_if_empty(self):
+        chunk = Chunk("", "\n", ",")
+        self.assertEqual(len(chunk), 0)
+        self.assertEqual(list(chunk), [])
+        self.assertEqual(chunk[:], [])
@@ -0,0 +1,45 @@
+import math
+import unittest
+
+from todb.chunk_sizing import ChunkSizer, ChunkTiming
+from todb.parsing import ByteRange
+
+
+class ChunkSizerTest(unittest.TestCase):
+    def setUp(self):
+        self.offset = 0
+
+    def _import_chunks(self, sizer, seconds_per_kB, chunks=3, retry_round_trips=0):
+        for _ in range(chunks):
+            size_kB = sizer.chunk_size_kB()
+            length = int(size_kB * 1000)
+            sizer.issue(ByteRange("input.csv", self.offset, length), size_kB)
+            sizer.add_timing(ChunkTiming("input.csv", self.offset, length, rows=100,
+                                         seconds=size_kB * seconds_per_kB(size_kB),
+                                         retry_round_trips=retry_round_trips))
+            self.offset += length
+
+    def test_should_converge_on_chunk_size_with_best_throughput(self):
+        sizer = ChunkSizer(initial_kB=64)
+        for _ in range(50):
+            self._import_chunks(sizer, lambda size_kB: 1 + abs(math.log2(size_kB / 1000)))
+        self.assertTrue(sizer.converged)
+        self.assertAlmostEqual(sizer.chunk_size_kB(), 1024, delta=1)
+
+    def test_should_decrease_chunk_size_when_chunks_need_bisection(self):
+        sizer = ChunkSizer(initial_kB=1024)
+        self._import_chunks(sizer, lambda size_kB: 1., retry_round_trips=4)
+        self.assertEqual(sizer.chunk_size_kB(), 512)
+        for _ in range(20):
+            self._import_chunks(sizer, lambda size_kB: 1 / size_kB)  # bigger chunks would be faster
+        self.assertLessEqual(sizer.chunk_size_kB(), 512)
+
+    def test_should_ignore_timings_of_chunks_cut_with_other_size_and_of_file_ends(self):
+        sizer = ChunkSizer(initial_kB=512)
+        sizer.issue(ByteRange("input.csv", 0, 100000), 256)
+        sizer.issue(ByteRange("input.csv", 100000, 1000), 512)
+        for offset, length in [(0, 100000), (100000, 1000), (200000, 100000)]:
+            sizer.add_timing(ChunkTiming("input.csv", offset, length, rows=10, seconds=1., retry_round_trips=0))
+        self.assertEqual(sizer.chunk_size_kB(), 512)
+        self._import_chunks(sizer, lambda size_kB: 1., chunks=3)
+        self.assertEqual(sizer.chunk_size_kB(), 1024)
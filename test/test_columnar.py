@@ -0,0 +1,62 @@
+import pickle
+import unittest
+from unittest import mock
+
+from todb.columnar import ColumnarEntityBuilder, cast_int_column, numpy_available
+from todb.data_model import ConfColumn
+from todb.entity_builder import EntityBuilder
+from todb.temporal_parsing import TemporalParser
+
+
+class ColumnarEntityBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.columns = [
+            ConfColumn("test_string", 0, "string", nullable=True, indexed=False, unique=False),
+            ConfColumn("test_int", 1, "int", nullable=False, indexed=False, unique=False),
+            ConfColumn("test_bigint", 2, "bigint", nullable=True, indexed=False, unique=False),
+            ConfColumn("test_float", 3, "float", nullable=True, indexed=False, unique=False),
+            ConfColumn("test_bool", 4, "bool", nullable=False, indexed=False, unique=False),
+            ConfColumn("test_datetime", 5, "datetime", nullable=True, indexed=False, unique=False),
+            ConfColumn("test_missing", None, "int", nullable=True, indexed=False, unique=False)
+        ]
+        self.clean_rows = [["text {}".format(i), str(i - 50), str(i * 10 ** 11), "{}.25".format(i),
+                            "yes" if i % 2 else "0", "2016-04-21 10:{:02d}:21".format(i % 60)] for i in range(100)]
+        self.dirty_rows = [
+            ["", "-120", "null", "1.000,5", "TRUE", "NULL"],
+            ["text", "", "1", "1", "true", "2016-04-21"],
+            ["text", "7", "99999999999999999999", "nonParseableAsFloat", "n", "not a date"],
+            ["text", "1.5", "1", "1", "true", "2016-04-21"],
+            ["text", " 8", "0x10", "inf", "maybe", "2016-04-21"],
+            ["too", "short"]
+        ]
+
+    def test_should_build_same_entities_as_row_by_row_builder_from_clean_rows(self):
+        self._assert_same_as_row_by_row(self.clean_rows)
+
+    def test_should_build_same_entities_and_fail_same_rows_as_row_by_row_builder(self):
+        self._assert_same_as_row_by_row(self.clean_rows + self.dirty_rows + self.clean_rows[:10])
+
+    def test_should_build_same_entities_without_numpy(self):
+        with mock.patch("todb.columnar.np", None):
+            self._assert_same_as_row_by_row(self.dirty_rows + self.clean_rows)
+
+    def test_should_create_parser_of_temporal_column_once(self):
+        with mock.patch("todb.entity_builder.TemporalParser", wraps=TemporalParser) as parser_class:
+            builder = ColumnarEntityBuilder(self.columns)
+            self.assertEqual(parser_class.call_count, 1)
+            pickle.loads(pickle.dumps(builder))
+            self.assertEqual(parser_class.call_count, 2)
+
+    @unittest.skipUnless(numpy_available(), "NumPy is not installed")
+    def test_should_cast_int_column_with_numpy_or_fail_if_result_would_differ(self):
+        self.assertEqual(cast_int_column(["1", "+5", "-0", "007", " 3"]), [1, 5, 0, 7, 3])
+        for cells in [["1", ""], ["1 2"], ["1", "2x"], ["1.5"], ["0x10"], ["99999999999999999999"],
+                      ["-9223372036854775809"]]:
+            with self.assertRaises(ValueError):
+                cast_int_column(cells)
+
+    def _assert_same_as_row_by_row(self, rows):
+        expected_entities, expected_failed_rows = EntityBuilder(self.columns).to_entities(rows)
+        actual_entities, actual_failed_rows = ColumnarEntityBuilder(self.columns).to_entities(rows)
+        self.assertEqual(actual_entities, expected_entities)
+        self.assertEqual(sorted(map(id, actual_failed_rows)), sorted(map(id, expected_failed_rows)))
@@ -8,7 +8,9 @@ INPUT_FILE_CONFIG = """
     "encoding": "ascii",
     "has_header": false,
     "row_delimiter": "\\t",
-    "cell_delimiter": ";"
+    "cell_delimiter": ";",
+    "quote_char": "'",
+    "escape_char": "\\\\"
 }
 """
 
@@ -20,6 +22,8 @@ class InputFileConfigParsingTest(unittest.TestCase):
         self.assertEqual(default_config.has_header_row(), True)
         self.assertEqual(default_config.row_delimiter(), "\n")
         self.assertEqual(default_config.cell_delimiter(), ",")
+        self.assertEqual(default_config.quote_char(), None)
+        self.assertEqual(default_config.escape_char(), None)
 
     def test_should_return_custom_config_on_custom_input(self):
         custom_config = InputFileConfig(conf_dict=json.loads(INPUT_FILE_CONFIG))
@@ -27,3 +31,5 @@ class InputFileConfigParsingTest(unittest.TestCase):
         self.assertEqual(custom_config.has_header_row(), False)
         self.assertEqual(custom_config.row_delimiter(), "\t")
         self.assertEqual(custom_config.cell_delimiter(), ";")
+        self.assertEqual(custom_config.quote_char(), "'")
+        self.assertEqual(custom_config.escape_char(), "\\")
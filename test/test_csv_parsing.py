@@ -1,11 +1,28 @@
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+import shutil
+import tempfile
 import unittest
+from datetime import datetime
+from typing import Union
+from unittest import mock
 
 from todb.data_model import InputFileConfig
-from todb.parsing import CsvParser
-from todb.util import proj_path_to_abs
+from todb.parsing import CsvParser, detect_compression, count_quotes
+from todb.util import proj_path_to_abs, seconds_between
 
 
 class CsvParsingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_files = []
+
+    def tearDown(self):
+        for tmp_file in self.tmp_files:
+            os.remove(tmp_file)
+
     def test_should_parse_example_csv_file(self):
         abs_csv_path = proj_path_to_abs("resources/example_input.csv")
         in_file_config = InputFileConfig({"has_header": True})
@@ -21,3 +38,126 @@ class CsvParsingTest(unittest.TestCase):
                       all_lines)
         self.assertNotIn(["Artist", "Album", "Title", "Date"], all_lines)
         self.assertEqual(len(all_lines), 25)
+
+    def test_should_parse_quoted_cells_with_delimiters_spanning_many_chunks(self):
+        expected_rows = [["Artist {}, feat. \"Someone\"".format(i), "Title\n" * (i % 7), str(i)] for i in range(300)]
+        csv_content = "Artist,Title,Number\n" + "\n".join(
+            ['"{}","{}",{}'.format(a.replace('"', '""'), t, n) for a, t, n in expected_rows])
+        parser = CsvParser(InputFileConfig({"has_header": True, "quote_char": '"'}), chunk_size_kB=1)
+
+        all_rows = []
+        for rows in parser.read_rows_in_chunks(self._write_tmp_file(csv_content)):
+            all_rows.extend(rows)
+        self.assertEqual(all_rows, expected_rows)
+
+    def test_should_parse_cells_with_escaped_quotes(self):
+        csv_content = "a;'It\\'s; quoted';c\n'x';y;'z\nz'\n"
+        in_file_config = InputFileConfig({"has_header": False, "cell_delimiter": ";",
+                                          "quote_char": "'", "escape_char": "\\"})
+        parser = CsvParser(in_file_config, chunk_size_kB=1)
+        all_rows = [r for rows in parser.read_rows_in_chunks(self._write_tmp_file(csv_content)) for r in rows]
+        self.assertEqual(all_rows, [["a", "It's; quoted", "c"], ["x", "y", "z\nz"]])
+
+    def test_should_read_same_rows_from_byte_ranges_as_from_chunks(self):
+        example_csv_path = proj_path_to_abs("resources/example_input.csv")
+        quoted_csv_path = self._write_tmp_file("Artist,Title\n" + "\n".join(
+            ['"Artist\n{}","Title, {}"'.format(i, i) for i in range(300)]))
+        for csv_path, file_config in [(example_csv_path, InputFileConfig({"has_header": True})),
+                                      (quoted_csv_path, InputFileConfig({"has_header": True, "quote_char": '"'}))]:
+            parser = CsvParser(file_config, chunk_size_kB=1)
+            rows_from_chunks = [r for rows in parser.read_rows_in_chunks(csv_path) for r in rows]
+            byte_ranges = list(parser.read_byte_ranges(csv_path))
+            rows_from_ranges = [r for byte_range in byte_ranges for r in parser.read_rows_in_range(byte_range)]
+            self.assertGreater(len(byte_ranges), 1)
+            self.assertEqual(rows_from_ranges, rows_from_chunks)
+
+    def test_should_report_throughput_of_split_and_quote_aware_parsing(self):
+        csv_content = "\n".join(["Artist {},Album {},Title {},30 Aug 2018 12:16".format(i, i, i) for i in range(100000)])
+        csv_file = self._write_tmp_file(csv_content)
+        size_MB = os.path.getsize(csv_file) / 1000000
+        rows_per_mode = {}
+        for mode, quote_char in [("split-based", None), ("quote-aware", '"')]:
+            parser = CsvParser(InputFileConfig({"has_header": False, "quote_char": quote_char}), chunk_size_kB=512)
+            start_time = datetime.utcnow()
+            rows_per_mode[mode] = [r for rows in parser.read_rows_in_chunks(csv_file) for r in rows]
+            took_seconds = max(seconds_between(start_time, precision=6), 1e-6)
+            print("CsvParser ({}): {:.1f} MB in {:.3f}s ({:.1f} MB/s)".format(mode, size_MB, took_seconds,
+                                                                             size_MB / took_seconds))
+        self.assertEqual(rows_per_mode["split-based"], rows_per_mode["quote-aware"])
+
+    def test_should_read_same_rows_from_compressed_files_as_from_plain_one(self):
+        csv_content = "Artist,Title\n" + "\n".join(['"Artist\n{}","Title, {}"'.format(i, i) for i in range(300)])
+        plain_csv_path = self._write_tmp_file(csv_content)
+        parser = CsvParser(InputFileConfig({"has_header": True, "quote_char": '"'}), chunk_size_kB=1)
+        expected_ranges_with_rows = list(parser.read_ranges_with_rows(plain_csv_path))
+        for compress in [gzip.compress, bz2.compress, lzma.compress]:
+            compressed_csv_path = self._write_tmp_file(compress(csv_content.encode("utf-8")), suffix=".csv.z")
+            self.assertTrue(parser.is_compressed(compressed_csv_path))
+            with mock.patch("todb.parsing.DECOMPRESSED_BLOCK_SIZE", 100):
+                ranges_with_rows = list(parser.read_ranges_with_rows(compressed_csv_path))
+            self.assertEqual([(r.offset, r.length, rows) for r, rows in ranges_with_rows],
+                             [(r.offset, r.length, rows) for r, rows in expected_ranges_with_rows])
+
+    def test_should_report_wall_time_of_streaming_decompression_vs_decompressing_to_file(self):
+        csv_content = "\n".join(["Artist {},Album {},Title {},30 Aug 2018 12:16".format(i, i, i) for i in range(200000)])
+        gzip_file = self._write_tmp_file(gzip.compress(csv_content.encode("utf-8")), suffix=".csv.gz")
+        parser = CsvParser(InputFileConfig({"has_header": False}), chunk_size_kB=512)
+
+        decompress_then_parse_seconds, streaming_seconds = [], []
+        for _ in range(3):
+            start_time = datetime.utcnow()
+            decompressed_file = self._write_tmp_file("")
+            with gzip.open(gzip_file, "rb") as compressed, open(decompressed_file, "wb") as decompressed:
+                shutil.copyfileobj(compressed, decompressed)
+            rows_from_file = sum([len(rows) for rows in parser.read_rows_in_chunks(decompressed_file)])
+            decompress_then_parse_seconds.append(seconds_between(start_time, precision=6))
+
+            start_time = datetime.utcnow()
+            streamed_rows = sum([len(rows) for rows in parser.read_rows_in_chunks(gzip_file)])
+            streaming_seconds.append(seconds_between(start_time, precision=6))
+
+        print("CsvParser (gzip, {:.1f} MB): decompress to file then parse in {:.3f}s, streaming decompression and "
+              "parsing in {:.3f}s (best of 3)".format(len(csv_content) / 1000000, min(decompress_then_parse_seconds),
+                                         min(streaming_seconds)))
+        self.assertEqual(streamed_rows, rows_from_file)
+        self.assertEqual(streamed_rows, 200000)
+
+    def test_should_locate_rows_of_byte_ranges_in_input_file(self):
+        expected_rows = [["Artist {}".format(i), "Title\n" * (i % 3), str(i)] for i in range(100)]
+        csv_content = "Artist,Title,Number\n" + "".join(
+            ['"{}","{}",{}\n'.format(a, t, n) for a, t, n in expected_rows])
+        csv_path = self._write_tmp_file(csv_content)
+        parser = CsvParser(InputFileConfig({"has_header": True, "quote_char": '"'}), chunk_size_kB=0.5)
+
+        with mock.patch("todb.parsing.detect_compression", wraps=detect_compression) as detect:
+            for byte_range, rows in parser.read_ranges_with_rows(csv_path):
+                indexes = [0, len(rows) - 1]
+                for (line, offset), i in zip(parser.locate_rows(byte_range, indexes), indexes):
+                    number = rows[i][2]
+                    self.assertTrue(csv_content.encode()[offset:].startswith('"Artist {}"'.format(number).encode()))
+                    self.assertEqual(csv_content.split("\n")[line - 1], '"Artist {}","'.format(number) +
+                                     ("Title" if int(number) % 3 else '",{}'.format(number)))
+        self.assertEqual(detect.call_count, 1)  # compression is detected once per file
+
+    def test_should_count_quotes_of_mapped_file_range_in_place(self):
+        content = b"a;'It\\'s; quoted';c\n'x';y;'z\nz'\n" * 3
+        with open(self._write_tmp_file(content), "rb") as csv_file:
+            with mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start, end in [(0, len(content)), (2, 20), (9, 9), (20, len(content) - 3)]:
+                    for escape_char in [None, b"'", b"\\"]:
+                        expected = content[start:end].count(b"'")
+                        if escape_char == b"\\":
+                            expected -= content[start:end].count(b"\\'")
+                        self.assertEqual(count_quotes(mm, b"'", escape_char, start, end), expected)
+                        self.assertEqual(count_quotes(bytearray(content), b"'", escape_char, start, end), expected)
+
+    def _write_tmp_file(self, content: Union[str, bytes], suffix: str = ".csv") -> str:
+        file_descriptor, file_path = tempfile.mkstemp(suffix=suffix)
+        if isinstance(content, bytes):
+            with os.fdopen(file_descriptor, "wb") as tmp_binary_file:
+                tmp_binary_file.write(content)
+        else:
+            with os.fdopen(file_descriptor, "w", encoding="utf-8", newline="") as tmp_file:
+                tmp_file.write(content)
+        self.tmp_files.append(file_path)
+        return file_path
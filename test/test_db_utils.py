@@ -4,6 +4,8 @@ from unittest import TestCase
 from sqlalchemy.engine import Engine, create_engine
 from sqlalchemy.pool import StaticPool
 
+from todb.sql_client import enable_sqlite_savepoints
+
 TEST_SQL_DB_URL = 'sqlite:///'
 
 
@@ -14,4 +16,6 @@ def setup_db_repository_test_class(cls: Type[TestCase]) -> None:
 
 def get_test_db_engine(debug: bool = False) -> Engine:
     """Snippet for in-memory DB: http://www.sameratiani.com/2013/09/17/flask-unittests-with-in-memory-sqlite.html"""
-    return create_engine(TEST_SQL_DB_URL, echo=debug, poolclass=StaticPool)
+    engine = create_engine(TEST_SQL_DB_URL, echo=debug, poolclass=StaticPool)
+    enable_sqlite_savepoints(engine)
+    return engine
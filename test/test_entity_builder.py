@@ -1,8 +1,10 @@
 import unittest
 from datetime import datetime, date, time
 
-from todb.data_model import ConfColumn
+from todb.data_model import ConfColumn, parse_model_file
 from todb.entity_builder import EntityBuilder
+from todb.parsing import CsvParser
+from todb.util import proj_path_to_abs, seconds_between
 
 
 class EntityBuilderTest(unittest.TestCase):
@@ -103,3 +105,35 @@ class EntityBuilderTest(unittest.TestCase):
             "test_datetime": datetime(2016, 4, 21, 10, 45, 21)
         }
         self.assertEqual(actual_entity, expected_entity)
+
+
+class EntityBuilderBenchmarkTest(unittest.TestCase):
+    REPEAT_ROWS = 200
+
+    def test_should_report_cells_per_second_on_example_model(self):
+        columns, _, file_config = parse_model_file(proj_path_to_abs("resources/example_model.json"))
+        parser = CsvParser(file_config, chunk_size_kB=64)
+        rows = [r for chunk in parser.read_rows_in_chunks(proj_path_to_abs("resources/example_input.csv"))
+                for r in chunk]
+        self._measure_to_entity("example model", columns, rows * self.REPEAT_ROWS)
+
+    def test_should_report_cells_per_second_on_non_temporal_model(self):
+        columns = [ConfColumn("test_string", 0, "string", nullable=True, indexed=False, unique=False),
+                   ConfColumn("test_int", 1, "int", nullable=False, indexed=False, unique=False),
+                   ConfColumn("test_float", 2, "float", nullable=True, indexed=False, unique=False),
+                   ConfColumn("test_bool", 3, "bool", nullable=False, indexed=False, unique=False),
+                   ConfColumn("test_latlon", 4, "latlon", nullable=True, indexed=False, unique=False),
+                   ConfColumn("test_missing", None, "int", nullable=True, indexed=False, unique=False)]
+        rows = [["Some text", str(i), "-4.60", "yes", "20-55-70.010N"] for i in range(250)]
+        self._measure_to_entity("non-temporal model", columns, rows * self.REPEAT_ROWS)
+
+    def _measure_to_entity(self, model_name, columns, rows):
+        builder = EntityBuilder(columns)
+        start_time = datetime.utcnow()
+        entities = [builder.to_entity(r) for r in rows]
+        took_seconds = max(seconds_between(start_time, precision=6), 1e-6)
+
+        cells = len(rows) * len(columns)
+        print("EntityBuilder.to_entity on {}: {} cells in {:.3f}s ({:.0f} cells/s)".format(
+            model_name, cells, took_seconds, cells / took_seconds))
+        self.assertTrue(all(e is not None for e in entities))
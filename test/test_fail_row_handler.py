@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from todb.data_model import InputFileConfig
+from todb.fail_row_handler import FailRowHandler, FailedRowsBatch, encode_failed_rows
+
+
+class FailRowHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.tmp_dir.name, "input_failed.csv")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_should_store_failed_rows_with_their_positions_and_reasons(self):
+        config = InputFileConfig({"cell_delimiter": ";", "quote_char": '"'})
+        handler = FailRowHandler(config, self.output_path)
+        handler.write_batch(FailedRowsBatch("input.csv", encode_failed_rows(config, [["a", "b;c"], ["d", "e"]]),
+                                            [(2, 10, "cast"), (5, 40, "db")]))
+        handler.handle_failed_rows([["f", "g\nh"]])
+        handler.close()
+
+        with open(self.output_path, encoding="utf-8") as output_file:
+            self.assertEqual(output_file.read(), 'a;"b;c"\nd;e\nf;"g\nh"\n')
+        with open(handler.reasons_file_path, encoding="utf-8") as reasons_file:
+            self.assertEqual(reasons_file.read(), "input_line,input_offset,reason\n2,10,cast\n5,40,db\n,,unknown\n")
+        self.assertEqual(handler.failed_rows, 3)
+
+    def test_should_append_to_files_of_previous_import(self):
+        config = InputFileConfig({})
+        for rows in [[["a", "b"]], [["c", "d"]]]:
+            handler = FailRowHandler(config, self.output_path)
+            handler.handle_failed_rows(rows, [(1, 0, "constraint")])
+            handler.close()
+
+        with open(self.output_path, encoding="utf-8") as output_file:
+            self.assertEqual(output_file.read(), "a,b\nc,d\n")
+        with open(handler.reasons_file_path, encoding="utf-8") as reasons_file:
+            self.assertEqual(reasons_file.read(), "input_line,input_offset,reason\n1,0,constraint\n1,0,constraint\n")
+
+    def test_should_raise_error_if_rows_can_not_be_stored(self):
+        handler = FailRowHandler(InputFileConfig({}), os.path.join(self.tmp_dir.name, "missing", "input_failed.csv"))
+        with self.assertRaises(OSError):
+            handler.handle_failed_rows([["a", "b"]])
+        handler.close()
+        self.assertEqual(handler.failed_rows, 0)
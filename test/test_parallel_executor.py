@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from todb.checkpoint import CheckpointJournal
+from todb.data_model import InputFileConfig, ConfColumn, PrimaryKeyConf, PKEY_AUTOINC
+from todb.entity_builder import EntityBuilder
+from todb.fail_row_handler import FailRowHandler, FailedRowsBatch
+from todb.parallel_executor import read_task_rows, CastWorker, UnsuccessfulRowsHandlingWorker, CommittedRanges, \
+    ParallelExecutor, POISON_PILL
+from todb.params import InputParams
+from todb.parsing import CsvParser, ByteRange
+from todb.util import proj_path_to_abs
+
+
+# runs todb with arguments following journal path and number of chunk (counted from 1; 0 for none) at which import is
+# killed, once ranges of earlier chunks are journaled (or 2 seconds have passed)
+INTERRUPTED_IMPORT_SCRIPT = """
+import os, signal, sys, time
+from todb.importer import Importer
+from todb.main import cli_main
+
+journal_path, interrupt_at_chunk = sys.argv[1], int(sys.argv[2])
+import_chunk, imported_chunks = Importer.import_chunk, []
+
+
+def journaled_ranges():
+    if not os.path.exists(journal_path):
+        return 0
+    with open(journal_path) as journal_file:
+        return len(journal_file.readlines())
+
+
+def interrupting_import_chunk(importer, *args, **kwargs):
+    imported_chunks.append(args)
+    if len(imported_chunks) == interrupt_at_chunk:
+        deadline = time.time() + 2
+        while journaled_ranges() < interrupt_at_chunk - 1 and time.time() < deadline:
+            time.sleep(0.01)
+        os.killpg(os.getpgrp(), signal.SIGKILL)
+    return import_chunk(importer, *args, **kwargs)
+
+
+Importer.import_chunk = interrupting_import_chunk
+sys.argv = ["todb"] + sys.argv[3:]
+cli_main()
+"""
+
+
+class FailedRowsCheckingJournal(CheckpointJournal):
+    """Journal remembering content of failed rows file at the time each range is recorded"""
+
+    def __init__(self, journal_path: str, failed_rows_path: str) -> None:
+        super(FailedRowsCheckingJournal, self).__init__(journal_path)
+        self.failed_rows_path = failed_rows_path
+        self.failed_rows_on_record = []
+
+    def record(self, byte_ranges, worker_name):
+        with open(self.failed_rows_path, "rb") as failed_rows_file:
+            self.failed_rows_on_record.append(failed_rows_file.read())
+        super(FailedRowsCheckingJournal, self).record(byte_ranges, worker_name)
+
+
+class ParallelExecutorTest(unittest.TestCase):
+    def setUp(self):
+        file_descriptor, self.csv_path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(file_descriptor, "wb") as tmp_file:
+            tmp_file.write(b"a,b\n1,2\n\xff\xfe,3\n4,5\n")
+        self.parser = CsvParser(InputFileConfig({"has_header": True}), chunk_size_kB=0.001)
+
+    def tearDown(self):
+        os.remove(self.csv_path)
+
+    def test_should_read_no_rows_from_byte_range_which_can_not_be_decoded(self):
+        byte_ranges = list(self.parser.read_byte_ranges(self.csv_path))
+        rows = [read_task_rows(self.parser, None, byte_range)[1] for byte_range in byte_ranges]
+        self.assertEqual(rows, [[["1", "2"]], [], [["4", "5"]]])
+
+    def test_should_pass_on_empty_chunk_of_byte_range_which_can_not_be_decoded_and_keep_casting(self):
+        tasks_queue, cast_queue, results_queue = queue.Queue(), queue.Queue(), queue.Queue()
+        for byte_range in self.parser.read_byte_ranges(self.csv_path):
+            tasks_queue.put(byte_range)
+        tasks_queue.put(POISON_PILL)
+        columns = [ConfColumn("a", 0, "int", nullable=False, indexed=False, unique=False)]
+        CastWorker(tasks_queue, cast_queue, results_queue, EntityBuilder(columns), self.parser, 60.).run()
+        tasks_queue.join()  # every task, including the poison pill, is done
+        chunks = [cast_queue.get_nowait() for _ in range(cast_queue.qsize())]
+        self.assertEqual([chunk.rows for chunk in chunks], [[["1", "2"]], [], [["4", "5"]]])
+        entities = [[entity for _, entity in chunk.cast_rows[0]] for chunk in chunks]
+        self.assertEqual(entities, [[{"a": 1}], [], [{"a": 4}]])
+
+    def test_should_not_leave_unused_trailing_cells_in_cells_of_columns(self):
+        with open(self.csv_path, "w") as csv_file:
+            csv_file.write("a,b,c,d\nx0,0,tail0,more0\nx1,1,tail1\nx2,2\n")
+        config = InputFileConfig({"has_header": True})
+        columns = [ConfColumn("a", 0, "string", nullable=False, indexed=False, unique=False),
+                   ConfColumn("b", 1, "int", nullable=False, indexed=False, unique=False)]
+        params = InputParams(model_path=proj_path_to_abs("resources/example_model.json"), input_path=self.csv_path,
+                             fail_output_path=None, sql_db="sqlite:///", cass_db=None)
+        executor = ParallelExecutor(params, config, columns, PrimaryKeyConf(mode=PKEY_AUTOINC, columns=[]), "t")
+        parser = CsvParser(config, chunk_size_kB=1, max_cells=executor._max_cells())
+        rows = [row for _, chunk_rows in parser.read_ranges_with_rows(self.csv_path) for row in chunk_rows]
+        self.assertEqual(rows, [["x0", "0", "tail0,more0"], ["x1", "1", "tail1"], ["x2", "2"]])
+        rows_with_entities, failed_rows = EntityBuilder(columns).to_entities(rows)
+        self.assertEqual([entity for _, entity in rows_with_entities],
+                         [{"a": "x0", "b": 0}, {"a": "x1", "b": 1}, {"a": "x2", "b": 2}])
+        self.assertEqual(failed_rows, [])
+
+    def test_should_journal_committed_ranges_as_soon_as_failed_rows_of_their_chunks_are_written(self):
+        failed_rows_path = self.csv_path + "_failed"
+        journal = FailedRowsCheckingJournal(self.csv_path + ".journal", failed_rows_path)
+        handler = FailRowHandler(InputFileConfig({}), failed_rows_path, flush_interval_sec=60.)
+        rows_queue, results_queue = queue.Queue(), queue.Queue()
+        byte_ranges = [ByteRange(self.csv_path, 4, 4), ByteRange(self.csv_path, 8, 7)]
+        rows_queue.put(FailedRowsBatch(self.csv_path, b"1,2\n", [(2, 4, "cast")]))
+        rows_queue.put(CommittedRanges(byte_ranges[:1], "writer-1"))
+        rows_queue.put(FailedRowsBatch(self.csv_path, b"4,5\n", [(4, 11, "cast")]))
+        rows_queue.put(CommittedRanges(byte_ranges[1:], "writer-1"))
+        rows_queue.put(POISON_PILL)
+        try:
+            UnsuccessfulRowsHandlingWorker(rows_queue, results_queue, {self.csv_path: handler}, journal, 60.).run()
+            self.assertEqual(journal.failed_rows_on_record, [b"1,2\n", b"1,2\n4,5\n"])
+            journal.load()
+            self.assertTrue(all(journal.is_committed(r) for r in byte_ranges))
+        finally:
+            for file_path in [failed_rows_path, handler.reasons_file_path, journal.journal_path]:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+    def test_should_keep_files_of_least_recently_written_handlers_closed_and_report_errors_on_storing_rows(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        file_paths = [os.path.join(tmp_dir.name, name) for name in ["a.csv", "b.csv", "c.csv"]]
+        handlers = {f: FailRowHandler(InputFileConfig({}), f + "_failed") for f in file_paths}
+        missing_dir_path = os.path.join(tmp_dir.name, "missing", "d.csv")
+        handlers[missing_dir_path] = FailRowHandler(InputFileConfig({}), missing_dir_path + "_failed")
+        rows_queue, results_queue = queue.Queue(), queue.Queue()
+        for n, file_path in enumerate(file_paths + file_paths[:1] + [missing_dir_path]):
+            rows_queue.put(FailedRowsBatch(file_path, "{},x\n".format(n).encode(), [(n + 2, None, "cast")]))
+        rows_queue.put(POISON_PILL)
+        journal = CheckpointJournal(os.path.join(tmp_dir.name, "import.journal"))
+        with tmp_dir, mock.patch("todb.parallel_executor.MAX_OPEN_HANDLERS", 2), \
+                mock.patch.object(FailRowHandler, "_open", autospec=True, side_effect=FailRowHandler._open) as open_:
+            UnsuccessfulRowsHandlingWorker(rows_queue, results_queue, handlers, journal, 60.).run()
+            self.assertEqual(open_.call_count, 5)  # a, b, c (closing a), a again (closing b) and failing d
+            messages = [results_queue.get_nowait() for _ in range(results_queue.qsize())]
+            self.assertEqual(messages[-1][1], ({file_paths[0]: 2, file_paths[1]: 1, file_paths[2]: 1,
+                                                missing_dir_path: 1}, 1))
+            with open(file_paths[0] + "_failed") as failed_rows_file:
+                self.assertEqual(failed_rows_file.read(), "0,x\n3,x\n")
+            with open(file_paths[0] + "_failed.reasons.csv") as reasons_file:
+                self.assertEqual(reasons_file.read(), "input_line,input_offset,reason\n2,,cast\n5,,cast\n")
+
+
+class ResumedImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp_dir.name, "input.csv")
+        self.model_path = os.path.join(self.tmp_dir.name, "model.json")
+        with open(self.model_path, "w") as model_file:
+            json.dump({"file": {"has_header": True, "cell_delimiter": ","}, "primary_key": "autoincrement",
+                       "columns": {"a": {"input_file_column": 0, "type": "int", "nullable": False},
+                                   "b": {"input_file_column": 1, "type": "string"}}}, model_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_should_not_insert_rows_again_when_resuming_interrupted_import(self):
+        self._write_input(["{},row {}".format(i, i) for i in range(20000)])
+        self.assertEqual(self._import("interrupted", interrupt_at_chunk=6), -signal.SIGKILL)
+        self.assertGreater(self._rows("interrupted")[1], 0)
+        self.assertEqual(self._import("interrupted", "--resume"), 0)
+        self.assertEqual(self._rows("interrupted"), (20000, 20000))
+
+    def test_should_import_same_rows_as_clean_import_when_resuming_interrupted_import(self):
+        self._write_input(["{},row {}".format("x" if i % 7 == 0 else i, i) for i in range(20000)])
+        self.assertEqual(self._import("clean"), 0)
+        self.assertEqual(self._import("interrupted", interrupt_at_chunk=6), -signal.SIGKILL)
+        self.assertEqual(self._import("interrupted", "--resume"), 0)
+        self.assertEqual(self._rows("interrupted"), self._rows("clean"))
+        self.assertEqual(self._rows("clean"), (17142, 17142))
+        self.assertEqual(self._failed_rows("interrupted"), self._failed_rows("clean"))
+        self.assertEqual(len(self._failed_rows("clean")), 2858)
+
+    def _write_input(self, lines):
+        with open(self.csv_path, "w") as csv_file:
+            csv_file.write("\n".join(["a,b"] + lines) + "\n")
+
+    def _import(self, name, *args, interrupt_at_chunk=0):
+        """Imports input into SQLite DB of given name with 1 worker process, in chunks of 16 kB; returns exit code"""
+        failures_path = os.path.join(self.tmp_dir.name, name + "_failed.csv")
+        command = [sys.executable, "-c", INTERRUPTED_IMPORT_SCRIPT, failures_path + ".journal", str(interrupt_at_chunk),
+                   self.csv_path, self.model_path, "sqlite:///" + os.path.join(self.tmp_dir.name, name + ".db"),
+                   "--table", "imported", "--failures", failures_path, "--proc", "1", "--chunk", "16"] + list(args)
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60,
+                              start_new_session=True).returncode
+
+    def _failed_rows(self, name):
+        with open(os.path.join(self.tmp_dir.name, name + "_failed.csv")) as failed_rows_file:
+            return sorted(failed_rows_file.readlines())
+
+    def _rows(self, name):
+        """Returns numbers of all and distinct rows in table of SQLite DB of given name"""
+        with sqlite3.connect(os.path.join(self.tmp_dir.name, name + ".db")) as connection:
+            return connection.execute("SELECT count(*), count(DISTINCT a) FROM imported").fetchone()
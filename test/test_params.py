@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from todb.params import resolve_input_paths, InputParams
+from todb.util import proj_path_to_abs
+
+
+class InputParamsTest(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+        for file_name in ["a.csv", "a_failed.csv", "a_failed.csv.reasons.csv", "b.csv", "b.txt", "import.journal"]:
+            with open(os.path.join(self.input_dir, file_name), "w") as f:
+                f.write("x\n")
+        os.mkdir(os.path.join(self.input_dir, "nested"))
+
+    def tearDown(self):
+        shutil.rmtree(self.input_dir)
+
+    def test_should_resolve_files_of_directory_skipping_ones_written_by_previous_imports(self):
+        self.assertEqual(resolve_input_paths(self.input_dir),
+                         [os.path.join(self.input_dir, f) for f in ["a.csv", "b.csv", "b.txt"]])
+
+    def test_should_resolve_glob_pattern_skipping_files_written_by_previous_imports(self):
+        self.assertEqual(resolve_input_paths(os.path.join(self.input_dir, "*.csv")),
+                         [os.path.join(self.input_dir, f) for f in ["a.csv", "b.csv"]])
+        self.assertEqual(resolve_input_paths(os.path.join(self.input_dir, "a_*")), [])
+        self.assertEqual(resolve_input_paths(os.path.join(self.input_dir, "*.*")),
+                         [os.path.join(self.input_dir, f) for f in ["a.csv", "b.csv", "b.txt"]])
+
+    def test_should_store_failed_rows_of_each_input_file_separately(self):
+        params = InputParams(model_path=proj_path_to_abs("resources/example_model.json"), input_path=self.input_dir,
+                             fail_output_path=None, sql_db="sqlite:///", cass_db=None, table_name="daily")
+        self.assertEqual(params.fail_output_path_for(os.path.join(self.input_dir, "b.csv")),
+                         os.path.join(self.input_dir, "b_failed.csv"))
+        self.assertEqual(params.journal_path(), os.path.join(self.input_dir, "daily.journal"))
+
+    def test_should_cast_and_insert_rows_in_separate_processes_only_if_asked_to(self):
+        model_path = proj_path_to_abs("resources/example_model.json")
+        input_path = os.path.join(self.input_dir, "a.csv")
+        params = InputParams(model_path=model_path, input_path=input_path, fail_output_path=None, sql_db="sqlite:///",
+                             cass_db=None, processes=3)
+        self.assertEqual((params.pipelined, params.cast_workers, params.writers), (False, 3, 3))
+        params = InputParams(model_path=model_path, input_path=input_path, fail_output_path=None, sql_db="sqlite:///",
+                             cass_db=None, processes=3, writers=1)
+        self.assertEqual((params.pipelined, params.cast_workers, params.writers), (True, 3, 1))
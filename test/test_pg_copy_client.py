@@ -0,0 +1,19 @@
+import unittest
+from datetime import datetime, date, time
+
+from todb.pg_copy_client import to_copy_text
+
+
+class PgCopyClientTest(unittest.TestCase):
+    def test_should_serialize_entities_to_copy_text_format(self):
+        entities = [
+            {"test_string": "Some\ttext\\with\nescapes", "test_int": -120, "test_float": -4.6, "test_bool": True,
+             "test_date": date(2016, 4, 21), "test_time": time(10, 45, 21),
+             "test_datetime": datetime(2016, 4, 21, 10, 45, 21)},
+            {"test_string": None, "test_int": 0, "test_float": None, "test_bool": False,
+             "test_date": None, "test_time": None, "test_datetime": datetime(2016, 4, 21)}
+        ]
+        columns = ["test_datetime", "test_string", "test_int", "test_float", "test_bool", "test_date", "test_time"]
+        expected_text = "2016-04-21T10:45:21\tSome\\ttext\\\\with\\nescapes\t-120\t-4.6\tt\t2016-04-21\t10:45:21\n" \
+                        "2016-04-21T00:00:00\t\\N\t0\t\\N\tf\t\\N\t\\N\n"
+        self.assertEqual(to_copy_text(entities, columns), expected_text)
@@ -0,0 +1,40 @@
+import queue
+import unittest
+
+from todb.parsing import ByteRange
+from todb.shm_transport import ShmRingBuffer, ShmReader, shm_available
+
+
+@unittest.skipUnless(shm_available(), "multiprocessing.shared_memory requires Python 3.8+")
+class ShmTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.acks_queue = queue.Queue()
+        self.ring_buffer = ShmRingBuffer(1024 * 1024, self.acks_queue)
+        self.reader = ShmReader(self.acks_queue)
+
+    def tearDown(self):
+        self.reader.close()
+        self.ring_buffer.close()
+
+    def test_should_pass_chunks_through_shared_memory_reclaiming_space_acknowledged_in_any_order(self):
+        chunk_size = 300 * 1024
+        chunks = [self.ring_buffer.put(ByteRange("input.csv", i * chunk_size, chunk_size), bytes([i]) * chunk_size)
+                  for i in range(3)]
+        self.assertEqual([c.offset for c in chunks], [0, chunk_size, 2 * chunk_size])
+        for i in [1, 0]:
+            with self.reader.chunk_bytes(chunks[i]) as chunk_bytes:
+                self.assertEqual(bytes(chunk_bytes), bytes([i]) * chunk_size)
+
+        wrapped_chunk = self.ring_buffer.put(ByteRange("input.csv", 3 * chunk_size, chunk_size), b"x" * chunk_size)
+        self.assertEqual(wrapped_chunk.offset, 0)
+        with self.reader.chunk_bytes(wrapped_chunk) as chunk_bytes:
+            self.assertEqual(bytes(chunk_bytes), b"x" * chunk_size)
+        with self.reader.chunk_bytes(chunks[2]) as chunk_bytes:
+            self.assertEqual(bytes(chunk_bytes), bytes([2]) * chunk_size)
+
+    def test_should_pass_chunk_larger_than_segment_inline(self):
+        data = b"a,b\n" * (512 * 1024)
+        chunk = self.ring_buffer.put(ByteRange("input.csv", 0, len(data)), data)
+        self.assertIsNone(chunk.segment_name)
+        with self.reader.chunk_bytes(chunk) as chunk_bytes:
+            self.assertEqual(chunk_bytes, data)
@@ -1,8 +1,20 @@
+import os
+import pickle
+import tempfile
 import unittest
+from unittest import mock
+
+from sqlalchemy import MetaData, Table, Column, String, select, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import QueuePool, NullPool
 
 from test.test_db_utils import setup_db_repository_test_class, get_test_db_engine, TEST_SQL_DB_URL
-from todb.data_model import ConfColumn, PrimaryKeyConf, PKEY_AUTOINC
+from todb.data_model import ConfColumn, PrimaryKeyConf, PKEY_AUTOINC, PKEY_COLS, PKEY_UUID, GENERATED_PKEY_COLUMN
+from todb.db_client import ON_CONFLICT_SKIP, ON_CONFLICT_UPDATE
 from todb.entity_builder import EntityBuilder
+from todb.importer import Importer, FAILURE_CAST, FAILURE_CONSTRAINT, FAILURE_COMMIT
+from todb.parallel_executor import CastChunk
+from todb.parsing import ByteRange
 from todb.sql_client import SqlClient
 
 
@@ -57,3 +69,278 @@ class SqlClientTest(unittest.TestCase):
         self.client.insert_in_batch(self.table_name, self.rows)
         row_count = self.client.count(self.table_name)
         self.assertEqual(row_count, len(self.rows))
+
+    def test_should_reflect_table_only_once_per_import(self):
+        self.client.init_table(self.table_name, self.columns, self.primary_key)
+        reflections_before_import = self.client.reflection_count
+        unique_rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(32)]
+        duplicated_rows = unique_rows[:16] + unique_rows[:1] + [["Other text"] + self.rows[0][1:]]
+        importer = Importer(self.client)
+        failed_rows = importer.parse_and_import(self.table_name, unique_rows[:16])
+        failed_rows += importer.parse_and_import(self.table_name, duplicated_rows)
+        self.assertEqual(len(failed_rows), 17)
+        self.assertEqual(self.client.count(self.table_name), 17)
+        self.assertEqual(self.client.reflection_count - reflections_before_import, 1)
+
+    def test_should_create_pooled_engine_lazily_and_dispose_it_on_close(self):
+        file_descriptor, db_file = tempfile.mkstemp(suffix=".db")
+        os.close(file_descriptor)
+        try:
+            pooled_client = SqlClient("sqlite:///{}".format(db_file), self.entity_builder, pool_size=2)
+            self.assertIsNone(pooled_client._db_engine)
+            pooled_client.init_table(self.table_name, self.columns, self.primary_key)
+            self.assertIsInstance(pooled_client._get_db_engine().pool, QueuePool)
+            pooled_client.insert_in_batch(self.table_name, self.rows)
+            pooled_client.close()
+            self.assertIsNone(pooled_client._db_engine)
+            self.assertEqual(pooled_client.count(self.table_name), len(self.rows))
+            pooled_client.close()
+        finally:
+            os.remove(db_file)
+
+    def test_should_not_pool_connections_by_default(self):
+        client = SqlClient("sqlite://", self.entity_builder)
+        self.assertIsInstance(client._get_db_engine().pool, NullPool)
+        client.close()
+
+    def test_should_commit_every_n_chunks_and_roll_back_only_failed_sub_batches(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), commit_every_chunks=3)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        importer = Importer(client)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(48)]
+
+        failed_rows = importer.parse_and_import(self.table_name, rows[:16])
+        failed_rows += importer.parse_and_import(self.table_name, rows[16:32] + rows[:1])
+        self.assertIsNotNone(client._transaction)
+        failed_rows += importer.parse_and_import(self.table_name, rows[32:])
+        self.assertIsNone(client._transaction)
+
+        self.assertEqual(failed_rows, rows[:1])
+        self.assertEqual(client.count(self.table_name), len(rows))
+        client.drop_table(self.table_name)
+        client.close()
+
+    def test_should_reject_duplicates_within_chunk_without_db_round_trips(self):
+        self.client.init_table(self.table_name, self.columns, self.primary_key)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(32)]
+        importer = Importer(self.client)
+        failed_rows = importer.parse_and_import(self.table_name, rows + rows[3:5])
+        self.assertEqual(failed_rows, rows[3:5])
+        self.assertEqual((importer.invalid_rows, importer.round_trips, importer.retry_round_trips), (2, 1, 0))
+        self.assertEqual(self.client.count(self.table_name), len(rows))
+
+    def test_should_cast_rows_only_once_when_retrying_failed_batch(self):
+        self.client.init_table(self.table_name, self.columns, self.primary_key)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(32)]
+        importer = Importer(self.client)
+        importer.parse_and_import(self.table_name, rows[:1])
+        with mock.patch.object(self.entity_builder, "to_entity", wraps=self.entity_builder.to_entity) as to_entity:
+            failed_rows = importer.parse_and_import(self.table_name, rows)
+        self.assertEqual(failed_rows, rows[:1])
+        self.assertEqual(to_entity.call_count, len(rows))
+        self.assertGreater(importer.retry_round_trips, 0)
+        self.assertEqual(self.client.count(self.table_name), len(rows))
+
+    def test_should_reject_integers_out_of_column_range_without_db_round_trips(self):
+        self.client.init_table(self.table_name, self.columns, self.primary_key)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(16)]
+        rows[7][2] = str(2 ** 63)
+        importer = Importer(self.client)
+        failed_rows = importer.parse_and_import(self.table_name, rows)
+        self.assertEqual(failed_rows, [rows[7]])
+        self.assertEqual((importer.invalid_rows, importer.retry_round_trips), (1, 0))
+
+    def test_should_create_deferred_indexes_after_loading_data(self):
+        self.assertTrue(self.client.init_table(self.table_name, self.columns, self.primary_key, defer_indexes=True))
+        self.assertFalse(self.client.init_table(self.table_name, self.columns, self.primary_key, defer_indexes=True))
+        self.assertEqual(len(self.client._get_table(self.table_name).indexes), 0)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(16)]
+        self.client.insert_in_batch(self.table_name, rows)
+
+        duplicates = self.client.create_deferred_indexes(self.table_name, self.columns)
+
+        self.assertEqual(duplicates, {})
+        actual_indexes = {i.name: i.unique for i in self.client._get_table(self.table_name).indexes}
+        self.assertEqual(actual_indexes, {"uq_test_table_test_string": True, "ix_test_table_test_bool": False,
+                                          "ix_test_table_test_datetime": False})
+        self.assertEqual(self.client.insert_in_batch(self.table_name, rows[:1]), (False, []))
+
+    def test_should_report_values_violating_deferred_unique_constraint(self):
+        self.client.init_table(self.table_name, self.columns, self.primary_key, defer_indexes=True)
+        rows = [["Text {}".format(i % 6)] + self.rows[0][1:] for i in range(16)]
+        self.client.insert_in_batch(self.table_name, rows)
+
+        duplicates = self.client.create_deferred_indexes(self.table_name, self.columns)
+
+        self.assertEqual(duplicates, {"test_string": 6})
+        actual_indexes = {i.name: i.unique for i in self.client._get_table(self.table_name).indexes}
+        self.assertFalse(actual_indexes["ix_test_table_test_string"])
+        self.assertEqual(self.client.count(self.table_name), len(rows))
+
+    def test_should_skip_rows_conflicting_with_existing_ones_in_single_statement(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), on_conflict=ON_CONFLICT_SKIP)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(32)]
+        importer = Importer(client)
+        importer.parse_and_import(self.table_name, rows[:16])
+        failed_rows = importer.parse_and_import(self.table_name, rows + rows[20:22])
+
+        self.assertEqual(failed_rows, [])
+        self.assertEqual((importer.skipped_rows, importer.invalid_rows, importer.retry_round_trips), (18, 0, 0))
+        self.assertEqual(client.count(self.table_name), len(rows))
+        client.drop_table(self.table_name)
+        client.close()
+
+    def test_should_update_rows_conflicting_with_existing_ones(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), on_conflict=ON_CONFLICT_UPDATE)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(16)]
+        updated_rows = [["Text {}".format(i), "{}".format(i)] + self.rows[0][2:] for i in range(8, 24)]
+        importer = Importer(client)
+        importer.parse_and_import(self.table_name, rows)
+        table = client._get_table(self.table_name)
+        ids_query = select([table.c.test_string, table.c[GENERATED_PKEY_COLUMN]])
+        ids_before_update = dict(client._get_connection().execute(ids_query).fetchall())
+        failed_rows = importer.parse_and_import(self.table_name, updated_rows)
+
+        self.assertEqual((failed_rows, importer.retry_round_trips), ([], 0))
+        self.assertEqual(client.count(self.table_name), 24)
+        self.assertEqual(client._get_connection().scalar(select([func.sum(table.c.test_int)])),
+                         8 * -120 + sum(range(8, 24)))
+        ids_after_update = dict(client._get_connection().execute(ids_query).fetchall())
+        self.assertEqual({k: ids_after_update[k] for k in ids_before_update}, ids_before_update)  # updated in place
+        client.drop_table(self.table_name)
+        client.close()
+
+    def test_should_build_postgresql_upsert_on_primary_key(self):
+        client = SqlClient("postgresql://user@localhost/db", self.entity_builder, on_conflict=ON_CONFLICT_UPDATE)
+        table = client._sql_table_from_columns(MetaData(), self.table_name, self.columns[:2],
+                                               PrimaryKeyConf(mode=PKEY_COLS, columns=["test_string"]))
+        statement = str(client._insert_statement(table, ["test_string", "test_int"]).compile(
+            dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (test_string) DO UPDATE SET test_int = excluded.test_int", statement)
+
+    def test_should_build_sqlite_upsert_on_primary_key(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), on_conflict=ON_CONFLICT_UPDATE)
+        table = client._sql_table_from_columns(MetaData(), self.table_name, self.columns[:2],
+                                               PrimaryKeyConf(mode=PKEY_COLS, columns=["test_string"]))
+        statement = str(client._insert_statement(table, ["test_string", "test_int"]).compile(
+            dialect=client._get_db_engine().dialect))
+        self.assertTrue(statement.endswith("ON CONFLICT (test_string) DO UPDATE SET test_int = excluded.test_int"))
+        client.on_conflict = ON_CONFLICT_SKIP
+        statement = str(client._insert_statement(table, ["test_string", "test_int"]).compile(
+            dialect=client._get_db_engine().dialect))
+        self.assertTrue(statement.endswith("ON CONFLICT DO NOTHING"))
+
+    def test_should_generate_same_uuid_keys_when_reloading_rows(self):
+        entity_builder = EntityBuilder(self.columns, uuid_key_column=GENERATED_PKEY_COLUMN)
+        client = SqlClient(TEST_SQL_DB_URL, entity_builder, get_test_db_engine(), on_conflict=ON_CONFLICT_SKIP)
+        client.init_table(self.table_name, self.columns, PrimaryKeyConf(mode=PKEY_UUID, columns=[]))
+        rows = [["Text {}".format(i % 8)] + self.rows[0][1:] for i in range(16)]
+        rows_with_entities, _ = client.build_entities(rows)
+        uuid_keys = [entity[GENERATED_PKEY_COLUMN] for _, entity in rows_with_entities]
+        self.assertEqual((uuid_keys[0] == uuid_keys[8], uuid_keys[0] == uuid_keys[1]), (True, False))
+        importer = Importer(client)
+        importer.parse_and_import(self.table_name, rows[:12])
+        failed_rows = importer.parse_and_import(self.table_name, rows)
+
+        self.assertEqual(failed_rows, [])
+        self.assertEqual(client.count(self.table_name), 8)
+        self.assertEqual(importer.skipped_rows, 20)
+        client.drop_table(self.table_name)
+        client.close()
+
+    def test_should_check_length_of_strings_only_if_db_enforces_it(self):
+        table = Table(self.table_name, MetaData(), Column("test_string", String(4)))
+        table.create(self.client._get_db_engine())
+        rows_with_entities = [(["abcd"], {"test_string": "abcd"}), (["abcde"], {"test_string": "abcde"})]
+        self.assertEqual(self.client.validate_entities(self.table_name, rows_with_entities), (rows_with_entities, []))
+        with mock.patch.object(self.client._get_db_engine().dialect, "name", "postgresql"):
+            self.assertEqual(self.client.validate_entities(self.table_name, rows_with_entities),
+                             (rows_with_entities[:1], [["abcde"]]))
+
+    def test_should_import_rows_cast_by_other_process(self):
+        self.client.init_table(self.table_name, self.columns, self.primary_key)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(16)]
+        rows[3] = ["Text 3", "not a number"] + self.rows[0][2:]
+        rows[5] = list(rows[4])
+        chunk = CastChunk(ByteRange("input.csv", 0, 100), rows, self.entity_builder.build_entities(rows), 0.1)
+        unpickled_chunk = pickle.loads(pickle.dumps(chunk))
+        importer = Importer(self.client)
+        with mock.patch.object(self.entity_builder, "to_entity") as to_entity:
+            failed_rows = importer.import_chunk(self.table_name, unpickled_chunk.rows,
+                                                cast_rows=unpickled_chunk.cast_rows)
+        to_entity.assert_not_called()
+        self.assertEqual(failed_rows, [(3, FAILURE_CAST, rows[3]), (5, FAILURE_CONSTRAINT, rows[5])])
+        self.assertEqual(self.client.count(self.table_name), len(rows) - 2)
+
+    def test_should_return_ids_of_chunks_only_once_they_are_committed(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), commit_every_chunks=2)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        importer = Importer(client)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(48)]
+        importer.parse_and_import(self.table_name, rows[:16], chunk_id=1)
+        self.assertEqual(importer.committed_chunks(), [])
+        importer.parse_and_import(self.table_name, rows[16:32], chunk_id=2)
+        importer.parse_and_import(self.table_name, rows[32:], chunk_id=3)
+        self.assertEqual(importer.committed_chunks(), [1, 2])
+        importer.close()
+        self.assertEqual(importer.committed_chunks(), [3])
+
+    def test_should_return_rows_of_transaction_that_failed_to_commit_as_failed(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), commit_every_chunks=2)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        importer = Importer(client)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(48)]
+        rows[3] = ["Text 3", "not a number"] + self.rows[0][2:]
+        failing_commit = mock.patch("sqlalchemy.engine.base.RootTransaction.commit",
+                                    side_effect=Exception("connection lost"))
+        self.assertEqual(importer.import_chunk(self.table_name, rows[:16], chunk_id=1),
+                         [(3, FAILURE_CAST, rows[3])])
+        with failing_commit:
+            failed_rows = importer.import_chunk(self.table_name, rows[16:32], chunk_id=2)
+        self.assertEqual(failed_rows, [(i, FAILURE_COMMIT, row) for i, row in enumerate(rows[16:32])])
+        self.assertEqual(importer.pop_failed_chunks(),
+                         [(1, [(i, FAILURE_COMMIT, row) for i, row in enumerate(rows[:16]) if i != 3])])
+        self.assertEqual(importer.committed_chunks(), [1, 2])
+        importer.parse_and_import(self.table_name, rows[32:40], chunk_id=3)
+        importer.parse_and_import(self.table_name, rows[40:], chunk_id=4)
+        self.assertEqual(importer.committed_chunks(), [3, 4])
+        importer.parse_and_import(self.table_name, rows[:1], chunk_id=5)
+        with failing_commit:
+            importer.close()
+        self.assertEqual(importer.pop_failed_chunks(), [(5, [(0, FAILURE_COMMIT, rows[0])])])
+        self.assertEqual(importer.committed_chunks(), [5])
+        self.assertEqual(importer.inserted_rows, 16)
+        self.assertEqual(client.count(self.table_name), 16)
+
+    def test_should_count_inserted_rows_reported_by_db_once_they_are_committed(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), commit_every_chunks=2,
+                           on_conflict=ON_CONFLICT_SKIP)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        importer = Importer(client)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(32)]
+        importer.parse_and_import(self.table_name, rows[:16])
+        self.assertEqual(importer.inserted_rows, 0)
+        importer.parse_and_import(self.table_name, rows[8:24])
+        self.assertEqual((importer.inserted_rows, importer.skipped_rows), (24, 8))
+        importer.parse_and_import(self.table_name, rows + [["Text 99", "not a number"] + self.rows[0][2:]])
+        importer.close()
+        self.assertEqual((importer.inserted_rows, importer.skipped_rows), (32, 32))
+        self.assertEqual(client.count(self.table_name), importer.inserted_rows)
+
+    def test_should_count_rows_duplicated_within_chunk_as_skipped_once_they_are_committed(self):
+        client = SqlClient(TEST_SQL_DB_URL, self.entity_builder, get_test_db_engine(), commit_every_chunks=2,
+                           on_conflict=ON_CONFLICT_SKIP)
+        client.init_table(self.table_name, self.columns, self.primary_key)
+        importer = Importer(client)
+        rows = [["Text {}".format(i)] + self.rows[0][1:] for i in range(24)]
+        importer.parse_and_import(self.table_name, rows[:8] + rows[:2])
+        self.assertEqual(importer.skipped_rows, 0)
+        with mock.patch("sqlalchemy.engine.base.RootTransaction.commit", side_effect=Exception("connection lost")):
+            importer.parse_and_import(self.table_name, rows[8:16] + rows[8:9])
+        self.assertEqual((importer.inserted_rows, importer.skipped_rows), (0, 0))
+        importer.parse_and_import(self.table_name, rows[16:] + rows[16:19])
+        importer.close()
+        self.assertEqual((importer.inserted_rows, importer.skipped_rows), (8, 3))
+        self.assertEqual(client.count(self.table_name), importer.inserted_rows)
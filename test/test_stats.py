@@ -0,0 +1,70 @@
+import json
+import os
+import queue
+import tempfile
+import unittest
+
+from todb.stats import Stats, RunReport, StatsCollector, StatsSender, merged_snapshot, to_prometheus_text, \
+    reset_stats, get_stats, STAGE_INSERT, STAGE_PARSE, COUNTER_ROWS, MAXIMUM_PEAK_RSS_kB
+
+
+class StatsTest(unittest.TestCase):
+    def test_should_merge_timers_and_counters_of_processes(self):
+        worker_a, worker_b = Stats(), Stats()
+        worker_a.add_time(STAGE_INSERT, 0.002)
+        worker_a.increment(COUNTER_ROWS, 10)
+        worker_b.add_time(STAGE_INSERT, 2.)
+        worker_b.add_time(STAGE_PARSE, 0.0005)
+        worker_b.increment(COUNTER_ROWS, 5)
+
+        merged = merged_snapshot(worker_a.snapshot(), worker_b.snapshot())
+        insert = merged["stages"][STAGE_INSERT]
+        self.assertEqual(insert["count"], 2)
+        self.assertAlmostEqual(insert["total_sec"], 2.002)
+        self.assertEqual(insert["max_sec"], 2.)
+        self.assertEqual(insert["buckets"], [0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0])
+        self.assertEqual(merged["stages"][STAGE_PARSE]["count"], 1)
+        self.assertEqual(merged["counters"], {COUNTER_ROWS: 15})
+
+    def test_should_merge_maxima_of_processes_as_maximum(self):
+        worker_a, worker_b = Stats(), Stats()
+        worker_a.record_max(MAXIMUM_PEAK_RSS_kB, 2048)
+        worker_b.record_max(MAXIMUM_PEAK_RSS_kB, 4096)
+        worker_b.record_max(MAXIMUM_PEAK_RSS_kB, 1024)
+        merged = merged_snapshot(worker_a.snapshot(), worker_b.snapshot())
+        self.assertEqual(merged["maxima"], {MAXIMUM_PEAK_RSS_kB: 4096})
+        self.assertIn("todb_peak_rss_kB_max 4096\n", to_prometheus_text(merged))
+
+    def test_should_format_cumulative_prometheus_histogram(self):
+        stats = Stats()
+        stats.add_time(STAGE_INSERT, 0.002)
+        stats.add_time(STAGE_INSERT, 100.)
+        stats.increment(COUNTER_ROWS, 3)
+        text = to_prometheus_text(stats.snapshot())
+        self.assertIn('todb_stage_seconds_bucket{stage="insert",le="0.005"} 1\n', text)
+        self.assertIn('todb_stage_seconds_bucket{stage="insert",le="60.0"} 1\n', text)
+        self.assertIn('todb_stage_seconds_bucket{stage="insert",le="+Inf"} 2\n', text)
+        self.assertIn('todb_stage_seconds_count{stage="insert"} 2\n', text)
+        self.assertIn("todb_rows_total 3\n", text)
+
+    def test_should_write_report_of_stats_sent_by_workers(self):
+        reset_stats()
+        messages_queue = queue.Queue()
+        get_stats().add_time(STAGE_PARSE, 0.1)
+        StatsSender(messages_queue).send_result("worker result")
+        reset_stats()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_path = os.path.join(tmp_dir, "report.json")
+            collector = StatsCollector(messages_queue, RunReport(report_path, None, details={"table": "t"}))
+            collector.start()
+            self.assertEqual(collector.wait_for_results(1), ["worker result"])
+            get_stats().increment(COUNTER_ROWS, 7)
+            collector.finish()
+            with open(report_path) as report_file:
+                report = json.load(report_file)
+        self.assertTrue(report["finished"])
+        self.assertEqual(report["table"], "t")
+        self.assertEqual(report["stages"][STAGE_PARSE]["count"], 1)
+        self.assertEqual(report["counters"], {COUNTER_ROWS: 7})
+        reset_stats()
@@ -0,0 +1,56 @@
+import unittest
+from datetime import datetime, timedelta, date
+
+from dateutil.parser import parse
+
+from todb.entity_builder import to_naive_datetime, to_date
+from todb.temporal_parsing import TemporalParser, ISO_FORMAT
+from todb.util import seconds_between
+
+
+class TemporalParserTest(unittest.TestCase):
+    def setUp(self):
+        start = datetime(2018, 8, 30, 11, 1)
+        self.timestamps = [start + timedelta(minutes=5 * i) for i in range(64)]
+
+    def test_should_learn_format_and_parse_same_values_as_dateutil(self):
+        parser = TemporalParser(to_naive_datetime, sample_size=8)
+        values = [t.strftime("%d %b %Y %H:%M") for t in self.timestamps]
+        self.assertEqual([parser(v) for v in values], self.timestamps)
+        self.assertEqual(parser.learned_format, "%d %b %Y %H:%M")
+
+    def test_should_learn_iso_format(self):
+        parser = TemporalParser(to_date, sample_size=8)
+        dates = [date(2018, 8, 30) + timedelta(days=i) for i in range(16)]
+        self.assertEqual([parser(d.isoformat()) for d in dates], dates)
+        self.assertEqual(parser.learned_format, ISO_FORMAT)
+
+    def test_should_fall_back_to_dateutil_on_values_not_matching_learned_format(self):
+        parser = TemporalParser(to_naive_datetime, sample_size=8)
+        [parser(t.strftime("%Y-%m-%d %H:%M:%S")) for t in self.timestamps[:8]]
+        self.assertEqual(parser("30 Aug 2018 17:55"), datetime(2018, 8, 30, 17, 55))
+        self.assertEqual(parser("Aug 30th, 2018"), datetime(2018, 8, 30))
+
+    def test_should_not_learn_format_from_inconsistent_values(self):
+        parser = TemporalParser(to_date, sample_size=4)
+        values = ["2016/04/21", "21 Apr 2016", "04/21/2016", "April 21, 2016", "2016-04-21"]
+        self.assertEqual([parser(v) for v in values], [date(2016, 4, 21)] * len(values))
+        self.assertIsNone(parser.learned_format)
+
+    def test_should_keep_cache_of_parsed_values_bounded(self):
+        parser = TemporalParser(to_naive_datetime, cache_size=16)
+        [parser(str(t)) for t in self.timestamps]
+        self.assertLessEqual(len(parser._cache), 16)
+
+    def test_should_report_values_per_second_compared_to_dateutil(self):
+        values = [str(datetime(2018, 8, 30) + timedelta(seconds=i)) for i in range(20000)]
+        start_time = datetime.utcnow()
+        expected = [parse(v) for v in values]
+        dateutil_seconds = max(seconds_between(start_time, precision=6), 1e-6)
+        parser = TemporalParser(to_naive_datetime)
+        start_time = datetime.utcnow()
+        actual = [parser(v) for v in values]
+        parser_seconds = max(seconds_between(start_time, precision=6), 1e-6)
+        print("Parsing {} unique timestamps: dateutil {:.0f} values/s, TemporalParser {:.0f} values/s".format(
+            len(values), len(values) / dateutil_seconds, len(values) / parser_seconds))
+        self.assertEqual(actual, expected)
@@ -1,7 +1,7 @@
 import unittest
 from datetime import datetime, timedelta
 
-from todb.util import seconds_between
+from todb.util import seconds_between, gen_uuid, gen_uuids, interleave
 
 
 class UtilsTest(unittest.TestCase):
@@ -15,3 +15,11 @@ class UtilsTest(unittest.TestCase):
         start_point = end_point - timedelta(seconds=2.5)
         time_that_passed = seconds_between(start_point, end_point)
         self.assertAlmostEqual(time_that_passed, 2.5, delta=0.05)
+
+    def test_should_generate_same_uuids_in_batch_as_one_by_one(self):
+        contents = ["", "Some text", "2016-04-21 10:45:21\x1f-4.60", "Zażółć gęślą jaźń"] + [str(i) for i in range(64)]
+        self.assertEqual(gen_uuids(contents), [gen_uuid(c) for c in contents])
+
+    def test_should_interleave_iterators_within_window(self):
+        iterators = (iter(items) for items in [[1, 2, 3], [4], [5, 6], [7, 8]])
+        self.assertEqual(list(interleave(iterators, window=2)), [1, 4, 2, 3, 5, 6, 7, 8])
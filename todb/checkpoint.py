@@ -0,0 +1,85 @@
+import json
+import os
+from bisect import bisect_right
+from os import path
+from typing import List, Tuple, Optional, Dict, Any
+
+from todb.logger import get_logger
+from todb.parsing import ByteRange
+
+JOURNAL_FILE_SUFFIX = ".journal"
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merges (start, end) ranges into sorted list of disjoint ones; adjacent ranges are merged as well"""
+    merged = []  # type: List[Tuple[int, int]]
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class CheckpointJournal(object):
+    """Append-only file of byte ranges of input files whose rows are committed to DB, one JSON object per line;
+    process storing failed rows appends to it after transaction commits and failed rows of its chunks are written, so
+    that interrupted import can be resumed"""
+
+    def __init__(self, journal_path: str) -> None:
+        self.journal_path = journal_path
+        self.logger = get_logger()
+        self._journal_file = None  # type: Optional[Any]
+        self._committed_ranges = {}  # type: Dict[str, List[Tuple[int, int]]]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"journal_path": self.journal_path}  # worker processes open journal file on their own
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["journal_path"])  # type: ignore
+
+    def reset(self) -> None:
+        """Starts new journal, forgetting ranges committed by previous imports"""
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+        self._committed_ranges = {}
+
+    def load(self) -> int:
+        """Reads ranges committed by previous imports; returns their number"""
+        if not path.exists(self.journal_path):
+            self._committed_ranges = {}
+            return 0
+        ranges = {}  # type: Dict[str, List[Tuple[int, int]]]
+        with open(self.journal_path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                    start = entry["offset"]
+                    ranges.setdefault(entry["file"], []).append((start, start + entry["length"]))
+                except (ValueError, KeyError) as e:
+                    self.logger.warning("Skipping malformed checkpoint journal entry {!r}: {}".format(line, e))
+        self._committed_ranges = {file_path: merge_ranges(r) for file_path, r in ranges.items()}
+        return sum(len(r) for r in ranges.values())
+
+    def is_committed(self, byte_range: ByteRange) -> bool:
+        """Tells whether all rows of given range were committed according to loaded journal"""
+        ranges = self._committed_ranges.get(path.abspath(byte_range.file_path), [])
+        i = bisect_right(ranges, (byte_range.offset, float("inf"))) - 1
+        return i >= 0 and ranges[i][0] <= byte_range.offset and \
+            byte_range.offset + byte_range.length <= ranges[i][1]
+
+    def record(self, byte_ranges: List[ByteRange], worker_name: str) -> None:
+        """Appends committed ranges to journal with single unbuffered write, synced to disk before returning"""
+        if not byte_ranges:
+            return
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, "ab", buffering=0)
+        lines = [json.dumps({"file": path.abspath(r.file_path), "offset": r.offset, "length": r.length,
+                             "worker": worker_name}) + "\n" for r in byte_ranges]
+        self._journal_file.write("".join(lines).encode("utf-8"))
+        os.fsync(self._journal_file.fileno())
+
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
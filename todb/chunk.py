@@ -0,0 +1,67 @@
+from array import array
+from collections.abc import Sequence as SequenceABC
+from itertools import accumulate, chain
+from typing import List, Sequence, Optional, Any, Union, Iterator, Tuple
+
+Rows = Sequence[List[str]]  # cells of rows: list of them or Chunk
+
+
+class Chunk(SequenceABC):
+    """Rows of a chunk of input file without quoted cells, kept as decoded text; offsets of rows in the text are
+    computed on first access by index and cells are split from text of a row only when the row is accessed, and only
+    up to max_cells (the rest of the row stays in the last cell, so that joining cells gives back the row), so that
+    the chunk takes little more memory than its text and is cheap to pickle"""
+
+    __slots__ = ("text", "row_delimiter", "cell_delimiter", "max_cells", "_rows_count", "_row_offsets")
+
+    def __init__(self, text: str, row_delimiter: str, cell_delimiter: str, max_cells: Optional[int] = None) -> None:
+        self.text = text
+        self.row_delimiter = row_delimiter
+        self.cell_delimiter = cell_delimiter
+        self.max_cells = max_cells
+        self._rows_count = text.count(row_delimiter) + 1 if text else 0
+        self._row_offsets = None  # type: Optional[array]
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return Chunk, (self.text, self.row_delimiter, self.cell_delimiter, self.max_cells)
+
+    def __len__(self) -> int:
+        return self._rows_count
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._rows_count))]
+        return self.row_text(index).split(self.cell_delimiter, self._max_split())
+
+    def __iter__(self) -> Iterator[List[str]]:
+        if not self.text:
+            return iter([])
+        cell_delimiter, max_split = self.cell_delimiter, self._max_split()
+        return (row.split(cell_delimiter, max_split) for row in self.text.split(self.row_delimiter))
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, SequenceABC) and len(self) == len(other) and list(self) == list(other)
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "Chunk({} rows, {} chars)".format(self._rows_count, len(self.text))
+
+    def row_text(self, index: int) -> str:
+        if index < 0:
+            index += self._rows_count
+        if not 0 <= index < self._rows_count:
+            raise IndexError("Row index {} out of range of chunk of {} rows".format(index, self._rows_count))
+        offsets = self._offsets()
+        return self.text[offsets[index]:offsets[index + 1] - len(self.row_delimiter)]
+
+    def _offsets(self) -> array:
+        """Returns offsets of rows in text, with offset of (non-existent) row after the last one"""
+        if self._row_offsets is None:
+            delimiter_length = len(self.row_delimiter)
+            self._row_offsets = array("I", accumulate(chain([0], map(len, self.text.split(self.row_delimiter))),
+                                                      lambda offset, length: offset + length + delimiter_length))
+        return self._row_offsets
+
+    def _max_split(self) -> int:
+        return self.max_cells - 1 if self.max_cells is not None else -1
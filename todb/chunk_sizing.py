@@ -0,0 +1,111 @@
+import math
+from threading import Lock
+from typing import Dict, Tuple, List, Optional
+
+from todb.abstract import Model
+from todb.logger import get_logger
+from todb.parsing import ByteRange
+
+MIN_AUTO_CHUNK_SIZE_kB = 16
+MAX_AUTO_CHUNK_SIZE_kB = 16000
+INITIAL_STEP_FACTOR = 2.
+MIN_STEP_FACTOR = 1.15  # once steps get this small, chunk size is considered converged
+MIN_IMPROVEMENT = 0.05  # throughput gain needed to keep moving in the same direction
+MIN_SAMPLES_PER_STEP = 3
+BISECTED_CHUNKS_TO_BACK_OFF = 0.5  # fraction of chunks needing bisection above which chunk size is decreased
+TAIL_CHUNK_FRACTION = 0.5  # chunks smaller than this fraction of chunk size (ends of files) are not measured
+
+
+class ChunkTiming(Model):
+    """Measurement of a chunk imported by worker process, sent back to main process"""
+
+    def __init__(self, file_path: str, offset: int, length: int, rows: int, seconds: float,
+                 retry_round_trips: int) -> None:
+        self.file_path = file_path
+        self.offset = offset
+        self.length = length
+        self.rows = rows
+        self.seconds = seconds
+        self.retry_round_trips = retry_round_trips
+
+
+class ChunkSizer(object):
+    """Adjusts chunk size while importing: measures throughput (bytes per second of worker time) of chunks cut with
+    current size and climbs towards better one, starting with doubling / halving steps and shrinking them each time
+    direction is reversed, until it converges; if most chunks need bisection because of failing rows, chunk size is
+    decreased and not increased above that size again. Thread-safe: timings are added by stats collector thread"""
+
+    def __init__(self, initial_kB: float, min_kB: float = MIN_AUTO_CHUNK_SIZE_kB,
+                 max_kB: float = MAX_AUTO_CHUNK_SIZE_kB, samples_per_step: int = MIN_SAMPLES_PER_STEP) -> None:
+        self.min_kB = min_kB
+        self.max_kB = max_kB
+        self.samples_per_step = max(samples_per_step, MIN_SAMPLES_PER_STEP)
+        self.logger = get_logger()
+        self._lock = Lock()
+        self._size_kB = min(max(initial_kB, min_kB), max_kB)
+        self._issued = {}  # type: Dict[Tuple[str, int], float]
+        self._samples = []  # type: List[ChunkTiming]
+        self._best = None  # type: Optional[Tuple[float, float]]
+        self._direction = 1
+        self._step_factor = INITIAL_STEP_FACTOR
+        self._ceiling_kB = max_kB
+        self.converged = False
+
+    def chunk_size_kB(self) -> float:
+        with self._lock:
+            return self._size_kB
+
+    def issue(self, byte_range: ByteRange, chunk_size_kB: float) -> None:
+        """Remembers size given range was cut with, so that only timings of chunks of current size are compared"""
+        with self._lock:
+            self._issued[(byte_range.file_path, byte_range.offset)] = chunk_size_kB
+
+    def add_timing(self, timing: ChunkTiming) -> None:
+        with self._lock:
+            size_kB = self._issued.pop((timing.file_path, timing.offset), None)
+            if size_kB != self._size_kB or timing.length < size_kB * 1000 * TAIL_CHUNK_FRACTION:
+                return
+            self._samples.append(timing)
+            if len(self._samples) >= self.samples_per_step:
+                self._step()
+
+    def _step(self) -> None:
+        samples, self._samples = self._samples, []
+        throughput = sum(s.length for s in samples) / max(sum(s.seconds for s in samples), 1e-9)
+        bisected = sum(1 for s in samples if s.retry_round_trips > 0)
+        if bisected > len(samples) * BISECTED_CHUNKS_TO_BACK_OFF and self._size_kB > self.min_kB:
+            self._ceiling_kB = max(self._size_kB / INITIAL_STEP_FACTOR, self.min_kB)
+            self._best, self._direction, self._step_factor = None, -1, INITIAL_STEP_FACTOR
+            self.converged = False
+            self._change_size(self._ceiling_kB, "{} of {} chunks needed bisection".format(bisected, len(samples)))
+        elif self.converged:
+            return
+        elif self._best is None or throughput > self._best[1] * (1 + MIN_IMPROVEMENT):
+            self._best = (self._size_kB, throughput)
+            self._move_from_best(throughput)
+        else:
+            self._direction = -self._direction
+            self._step_factor = math.sqrt(self._step_factor)
+            self._move_from_best(throughput)
+
+    def _move_from_best(self, throughput: float) -> None:
+        assert self._best is not None
+        best_kB, best_throughput = self._best
+        reason = "{:.1f} kB/s with {:.0f} kB chunks".format(throughput / 1000, self._size_kB)
+        while self._step_factor >= MIN_STEP_FACTOR:
+            next_kB = min(max(best_kB * self._step_factor ** self._direction, self.min_kB), self._ceiling_kB)
+            if not math.isclose(next_kB, best_kB):
+                self._change_size(next_kB, reason)
+                return
+            self._direction = -self._direction  # hit a bound; try the other direction with smaller step
+            self._step_factor = math.sqrt(self._step_factor)
+        self.converged = True
+        self._change_size(best_kB, reason)
+        self.logger.info("Chunk size converged to {:.0f} kB ({:.1f} kB/s per process)".format(
+            best_kB, best_throughput / 1000))
+
+    def _change_size(self, size_kB: float, reason: str) -> None:
+        if not math.isclose(size_kB, self._size_kB):
+            self.logger.info("Changing chunk size from {:.0f} kB to {:.0f} kB ({})".format(self._size_kB, size_kB,
+                                                                                           reason))
+        self._size_kB = size_kB
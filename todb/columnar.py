@@ -0,0 +1,140 @@
+import re
+from itertools import product, repeat
+from typing import List, Tuple, Optional, Any, Set, Sequence, Callable
+
+from todb.data_model import ConfColumn
+from todb.db_client import RowWithEntity
+from todb.entity_builder import EntityBuilder, Caster, cast_bool
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; integer columns are then cast cell by cell, like other ones
+    np = None  # type: ignore
+
+NULL_CELLS = frozenset([""] + ["".join(chars) for chars in product(*zip("null", "NULL"))])
+_INT64_BOUNDS = (-2 ** 63, 2 ** 63 - 1)  # numpy saturates overflowing values to these instead of failing
+_INT_TYPES = ("int", "bigint")
+_INT_CELL = re.compile(r"\s*[+-]?[0-9]+\s*")  # numpy only warns about some malformed values in older releases
+_FAILED = object()  # value of cell that could not be cast, failing whole row
+
+ColumnCaster = Callable[[Sequence[str]], List[Any]]
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def cast_int_column(cells: Sequence[str]) -> List[int]:
+    """Casts column of integers at once with NumPy; raises ValueError unless result is exactly what casting each
+    cell with int would give"""
+    if np is None:
+        raise ValueError("NumPy is not available")
+    if not all(map(_INT_CELL.fullmatch, cells)):
+        raise ValueError("Cells are not all decimal integers")
+    values = np.fromstring(" ".join(cells), dtype=np.int64, sep=" ")
+    if len(values) != len(cells):
+        raise ValueError("Cells are empty or contain whitespace")
+    if len(values) and (values.min() == _INT64_BOUNDS[0] or values.max() == _INT64_BOUNDS[1]):
+        raise ValueError("Values may exceed 64-bit integer range")
+    return values.tolist()
+
+
+def cast_float_column(cells: Sequence[str]) -> List[float]:
+    """Casts column of floats at once, unless some cell uses comma as separator (see handle_float)"""
+    if "," in "".join(cells):
+        raise ValueError("Cells contain commas")
+    return list(map(float, cells))
+
+
+def cast_bool_column(cells: Sequence[str]) -> List[bool]:
+    """Casts column of booleans by casting each distinct value once"""
+    mapping = {cell: cast_bool(cell) for cell in set(cells)}
+    return list(map(mapping.__getitem__, cells))
+
+
+class ColumnarEntityBuilder(EntityBuilder):
+    """Builds entities of whole chunk column by column: each column without empty cells is cast at once (integers
+    with NumPy, if available), falling back to casting it cell by cell (exactly like EntityBuilder.to_entity) if
+    that fails; rows with cells which could not be cast are then left out"""
+
+    def __init__(self, columns: List[ConfColumn], uuid_key_column: Optional[str] = None) -> None:
+        super(ColumnarEntityBuilder, self).__init__(columns, uuid_key_column)
+        self._names = [c.name for c in columns]
+        self._column_casters = []  # type: List[Tuple[Optional[int], ColumnCaster, Caster, bool]]
+        for c, base_cast, (_, _, cast, _) in zip(columns, self._base_casters, self._casters):  # cell casters are shared
+            self._column_casters.append((c.col_index, self._bulk_caster(c, base_cast), cast, c.nullable))
+        self._row_width = max([c.col_index + 1 for c in columns if c.col_index is not None] or [0])
+
+    def to_entities(self, rows: List[List[str]]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        width = self._row_width
+        full_rows = [row for row in rows if len(row) >= width]
+        failed_rows = [row for row in rows if len(row) < width] if len(full_rows) != len(rows) else []
+        if failed_rows:
+            self.logger.debug("Can not build entities from {} rows with less than {} cells".format(len(failed_rows),
+                                                                                                 width))
+        if not full_rows:
+            return [], failed_rows
+        cells_in_columns = list(zip(*full_rows))
+        failed_indexes = set()  # type: Set[int]
+        values_in_columns = [self._cast_column(cells_in_columns[col_index] if col_index is not None else None,
+                                               len(full_rows), bulk_cast, cast, nullable, failed_indexes)
+                             for col_index, bulk_cast, cast, nullable in self._column_casters]
+        names = self._names
+        values_in_rows = zip(*values_in_columns) if values_in_columns else ([] for _ in full_rows)
+        if not failed_indexes:
+            return list(zip(full_rows, map(dict, map(zip, repeat(names), values_in_rows)))), failed_rows
+        rows_with_entities = []
+        for i, (row, values) in enumerate(zip(full_rows, values_in_rows)):
+            if i in failed_indexes:
+                failed_rows.append(row)
+            else:
+                rows_with_entities.append((row, dict(zip(names, values))))
+        return rows_with_entities, failed_rows
+
+    def _cast_column(self, cells: Optional[Sequence[str]], rows_count: int, bulk_cast: ColumnCaster, cast: Caster,
+                     nullable: bool, failed_indexes: Set[int]) -> List[Any]:
+        """Returns values of column cast from given cells, with _FAILED for cells that could not be cast, which
+        indexes are added to failed_indexes"""
+        if cells is None:
+            if not nullable:
+                failed_indexes.update(range(rows_count))
+            return [None] * rows_count
+        if NULL_CELLS.isdisjoint(cells):
+            try:
+                return bulk_cast(cells)
+            except Exception:
+                pass
+        values = []  # type: List[Any]
+        for i, cell in enumerate(cells):
+            if not cell or (len(cell) == 4 and cell.lower() == "null"):
+                if nullable:
+                    values.append(None)
+                    continue
+                value = _FAILED  # type: Any
+            else:
+                try:
+                    value = cast(cell)
+                except Exception as e:
+                    self.logger.debug("Can not cast {}: {}".format(cell, e))
+                    value = _FAILED
+            if value is _FAILED:
+                failed_indexes.add(i)
+            values.append(value)
+        return values
+
+    def _bulk_caster(self, column: ConfColumn, base_cast: Caster) -> ColumnCaster:
+        """Returns function casting sequence of non-empty cells of given column at once, raising if any of them
+        can not be cast"""
+        if column.conf_type in _INT_TYPES and np is not None:
+            return cast_int_column
+        elif column.conf_type == "float":
+            return cast_float_column
+        elif column.conf_type == "bool":
+            return cast_bool_column
+        elif base_cast is str:
+            return list
+        else:
+            def cast_column(cells: Sequence[str]) -> List[Any]:
+                return list(map(base_cast, cells))
+
+            return cast_column
@@ -1,7 +1,7 @@
 import json
 import string
 from datetime import date, time, datetime
-from typing import Type, List, Tuple, Dict, Any, Union
+from typing import Type, List, Tuple, Dict, Any, Union, Optional
 
 from sqlalchemy import BigInteger, Integer, Float, Date, Time, DateTime, Boolean, Unicode
 from sqlalchemy.sql.type_api import TypeEngine
@@ -12,6 +12,8 @@ DEFAULT_FILE_ENCODING = "utf-8"
 DEFAULT_HAS_HEADER_ROW = True
 DEFAULT_ROW_DELIMITER = "\n"
 DEFAULT_CELL_DELIMITER = ","
+DEFAULT_QUOTE_CHAR = None
+DEFAULT_ESCAPE_CHAR = None
 
 
 class InputFileConfig(Model):
@@ -30,6 +32,15 @@ class InputFileConfig(Model):
     def cell_delimiter(self) -> str:
         return str(self.conf_dict.get("cell_delimiter", DEFAULT_CELL_DELIMITER))
 
+    def quote_char(self) -> Optional[str]:
+        """If set, cells are parsed as RFC 4180 fields that may be quoted with this character"""
+        quote_char = self.conf_dict.get("quote_char", DEFAULT_QUOTE_CHAR)
+        return str(quote_char) if quote_char is not None else None
+
+    def escape_char(self) -> Optional[str]:
+        escape_char = self.conf_dict.get("escape_char", DEFAULT_ESCAPE_CHAR)
+        return str(escape_char) if escape_char is not None else None
+
 
 _CONF_TYPE_TO_PYTHON_TYPE = {
     "bool": bool,
@@ -68,10 +79,12 @@ _CONF_TYPE_TO_CASS_TYPE = {
 }
 
 
+_PUNCTUATION_TO_DASH = str.maketrans({key: "-" for key in string.punctuation})
+
+
 def handle_lat_lon(lat_or_lon: str) -> float:
     lat_or_lon = lat_or_lon.replace("°", "-")
-    table = str.maketrans({key: "-" for key in string.punctuation})
-    lat_or_lon = lat_or_lon.translate(table)
+    lat_or_lon = lat_or_lon.translate(_PUNCTUATION_TO_DASH)
     multiplier = 1 if lat_or_lon[-1] in ['N', 'E'] else -1
     lat_or_lon_numeric_parts = [p for p in lat_or_lon[:-1].split('-') if p.isdigit()]
     lat_or_lon_value = sum(float(x) / 60 ** n for n, x in enumerate(lat_or_lon_numeric_parts))
@@ -119,6 +132,7 @@ class ConfColumn(Model):
 PKEY_AUTOINC = "autoincrement"
 PKEY_UUID = "uuid"
 PKEY_COLS = "columns"
+GENERATED_PKEY_COLUMN = "ID"
 
 
 class PrimaryKeyConf(Model):
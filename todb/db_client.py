@@ -1,12 +1,25 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Any, Optional
 
 from todb.data_model import ConfColumn, PrimaryKeyConf
 
 ERROR_MSG = "Called method from abstract class: DbClient"
 
+ON_CONFLICT_FAIL = "fail"
+ON_CONFLICT_SKIP = "skip"
+ON_CONFLICT_UPDATE = "update"
+ON_CONFLICT_MODES = [ON_CONFLICT_FAIL, ON_CONFLICT_SKIP, ON_CONFLICT_UPDATE]
+
+RowWithEntity = Tuple[List[str], Dict[str, Any]]
+
 
 class DbClient(object):
-    def init_table(self, name: str, columns: List[ConfColumn], pkey: PrimaryKeyConf) -> None:
+    def init_table(self, name: str, columns: List[ConfColumn], pkey: PrimaryKeyConf,
+                   defer_indexes: bool = False) -> bool:
+        """Creates table if it does not exist, optionally without indexes; returns whether table was created"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def create_deferred_indexes(self, table_name: str, columns: List[ConfColumn],
+                                parallelism: int = 1) -> Dict[str, int]:
         raise NotImplementedError(ERROR_MSG)
 
     def insert_in_batch(self, table_name: str, objects: List[List[str]]) -> Tuple[bool, List[List[str]]]:
@@ -15,6 +28,43 @@ class DbClient(object):
     def insert_one_by_one(self, table_name: str, objects: List[List[str]]) -> List[List[str]]:
         raise NotImplementedError(ERROR_MSG)
 
+    def build_entities(self, rows: List[List[str]]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        """Casts rows into entities; returns rows paired with their entities and rows that could not be cast"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def validate_entities(self, table_name: str,
+                          rows_with_entities: List[RowWithEntity]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        """Checks constraints that can be checked without DB; returns valid entities and rows of invalid ones"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def insert_entities_in_batch(self, table_name: str, rows_with_entities: List[RowWithEntity]) -> bool:
+        raise NotImplementedError(ERROR_MSG)
+
+    def insert_entities_one_by_one(self, table_name: str, rows_with_entities: List[RowWithEntity]) -> List[List[str]]:
+        raise NotImplementedError(ERROR_MSG)
+
+    def inserted_rows_count(self) -> int:
+        """Returns number of committed rows inserted (or, in update mode, inserted or updated), as reported by DB"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def skipped_rows_count(self) -> int:
+        """Returns number of rows skipped so far as conflicting with already existing ones"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def end_chunk(self, chunk_id: Optional[Any] = None) -> bool:
+        """Marks end of importing a chunk; returns whether it caused chunks ended so far (and pending transaction) to
+        be committed; raises if committing failed (see commit)"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def pop_committed_chunk_ids(self) -> List[Any]:
+        """Returns ids of ended chunks that got committed since last call"""
+        raise NotImplementedError(ERROR_MSG)
+
+    def commit(self) -> bool:
+        """Commits pending transaction and ended chunks; returns whether there were any; raises if committing failed,
+        in which case rows inserted since previous commit are not in DB"""
+        raise NotImplementedError(ERROR_MSG)
+
     def drop_table(self, name: str) -> None:
         raise NotImplementedError(ERROR_MSG)
 
@@ -1,10 +1,12 @@
 from datetime import datetime, date, time
-from typing import Dict, List, Any, Optional
-
-from dateutil.parser import parse
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Callable, Tuple
 
 from todb.data_model import ConfColumn, handle_lat_lon, handle_float
+from todb.db_client import RowWithEntity
 from todb.logger import get_logger
+from todb.temporal_parsing import TemporalParser
+from todb.util import gen_uuids
 
 BOOLEAN_MAPPINGS = {
     "true": True,
@@ -18,51 +20,136 @@ BOOLEAN_MAPPINGS = {
     "absent": False
 }
 
+Caster = Callable[[str], Any]
+UUID_CELL_SEPARATOR = "\x1f"
+
+
+def cast_bool(value: str) -> bool:
+    mapping = BOOLEAN_MAPPINGS.get(value.lower(), None)
+    if mapping is not None:
+        return mapping
+    else:
+        return bool(int(value))
+
+
+def to_naive_datetime(parsed_time: datetime) -> datetime:
+    return parsed_time.replace(tzinfo=None)
+
+
+def to_date(parsed_time: datetime) -> date:
+    return parsed_time.date()
+
+
+def to_time(parsed_time: datetime) -> time:
+    return parsed_time.time()
+
+
+_CONF_TYPE_TO_TIME_CONVERTER = {
+    "date": to_date,
+    "time": to_time,
+    "datetime": to_naive_datetime
+}  # type: Dict[str, Callable[[datetime], Any]]
+
+_CONF_TYPE_TO_CASTER = {
+    "bool": cast_bool,
+    "string": str,
+    "int": int,
+    "bigint": int,
+    "float": handle_float,
+    "latlon": handle_lat_lon
+}  # type: Dict[str, Caster]
+
 
 class EntityBuilder(object):
-    def __init__(self, columns: List[ConfColumn]) -> None:
+    def __init__(self, columns: List[ConfColumn], uuid_key_column: Optional[str] = None) -> None:
+        """If uuid_key_column is given, entities get UUIDv5 generated from raw cells of columns as value of it"""
         self.columns = columns
+        self.uuid_key_column = uuid_key_column
         self.logger = get_logger()
+        self._base_casters = tuple(self._base_caster(c) for c in columns)  # type: Tuple[Caster, ...]
+        self._casters = tuple((c.name, c.col_index, self._compile_caster(c, base_cast), c.nullable)
+                              for c, base_cast in zip(columns, self._base_casters)
+                              )  # type: Tuple[Tuple[str, Optional[int], Caster, bool], ...]
+        uuid_cell_indexes = sorted({c.col_index for c in columns if c.col_index is not None})
+        self._uuid_cells = itemgetter(*uuid_cell_indexes) if len(uuid_cell_indexes) > 1 else None
+        self._uuid_cell_index = uuid_cell_indexes[0] if len(uuid_cell_indexes) == 1 else None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # compiled casters are closures; rebuild them after unpickling
+        return {"columns": self.columns, "uuid_key_column": self.uuid_key_column}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["columns"], state["uuid_key_column"])  # type: ignore
 
     def to_entity(self, cells_in_row: List[str]) -> Optional[Dict[str, Any]]:
+        entity = {}  # type: Dict[str, Any]
         try:
-            return {c.name: self._cast_value_to_sql_compatible(c, cells_in_row[
-                c.col_index] if c.col_index is not None else None)
-                    for c in self.columns}
+            for name, col_index, caster, nullable in self._casters:
+                value = cells_in_row[col_index] if col_index is not None else None
+                if not value or (len(value) == 4 and value.lower() == "null"):
+                    if nullable:
+                        entity[name] = None
+                        continue
+                    else:
+                        raise ValueError("Value for column {} is empty!".format(name))
+                entity[name] = caster(value)
+            return entity
         except Exception as e:
             self.logger.debug("Can not build entity from row {}: {}".format(cells_in_row, e))
             return None
 
-    def _cast_value_to_sql_compatible(self, column: ConfColumn, value: Optional[str]) -> Optional[Any]:
-        if not value or value.lower() == "null":
-            if column.nullable:
-                return None
+    def to_entities(self, rows: List[List[str]]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        """Returns rows paired with entities built from them and rows entities could not be built from"""
+        rows_with_entities = []
+        failed_rows = []
+        for row_cells in rows:
+            entity = self.to_entity(row_cells)
+            if entity is not None:
+                rows_with_entities.append((row_cells, entity))
             else:
-                raise ValueError("Value for column {} is empty!".format(column.name))
-        try:
-            if column.conf_type == "latlon":
-                return handle_lat_lon(value)
-            if column.conf_type == "float":
-                return handle_float(value)
-            elif column.python_type in (datetime, date, time):
-                parsed_time = parse(value)
-                if column.python_type == datetime:
-                    return parsed_time.replace(tzinfo=None)
-                elif column.python_type == date:
-                    return parsed_time.date()
-                else:
-                    return parsed_time.time()
-            elif column.python_type == bool:
-                mapping = BOOLEAN_MAPPINGS.get(value.lower(), None)
-                if mapping is not None:
-                    return mapping
-                else:
-                    return bool(int(value))
-            else:
-                return column.python_type(value)
-        except Exception as e:
-            self.logger.warning("WARNING: Could not cast {} for column {}: {}".format(value, column, e))
-            if column.nullable:
+                failed_rows.append(row_cells)
+        return rows_with_entities, failed_rows
+
+    def build_entities(self, rows: List[List[str]]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        """Same as to_entities, with UUID keys set (if builder has UUID key column)"""
+        rows_with_entities, failed_rows = self.to_entities(rows)
+        self.add_uuid_keys(rows_with_entities)
+        return rows_with_entities, failed_rows
+
+    def add_uuid_keys(self, rows_with_entities: List[RowWithEntity]) -> None:
+        """Sets UUID key column of entities built from given rows (if builder has one), generating keys for all
+        of them at once, so that same row content always gets same key"""
+        if self.uuid_key_column is None or not rows_with_entities:
+            return
+        if self._uuid_cells is not None:
+            separator, uuid_cells = UUID_CELL_SEPARATOR, self._uuid_cells
+            contents = [separator.join(uuid_cells(row)) for row, _ in rows_with_entities]
+        elif self._uuid_cell_index is not None:
+            contents = [row[self._uuid_cell_index] for row, _ in rows_with_entities]
+        else:
+            contents = ["" for _ in rows_with_entities]
+        key_column = self.uuid_key_column
+        for (_, entity), uuid in zip(rows_with_entities, gen_uuids(contents)):
+            entity[key_column] = uuid
+
+    def _compile_caster(self, column: ConfColumn, cast: Caster) -> Caster:
+        """Returns function casting non-empty cell value with given base caster of column (or to None, if column is
+        nullable and value can not be cast)"""
+        if not column.nullable or cast is str:
+            return cast
+        logger = self.logger
+
+        def cast_or_none(value: str) -> Optional[Any]:
+            try:
+                return cast(value)
+            except Exception as e:
+                logger.warning("WARNING: Could not cast {} for column {}: {}".format(value, column, e))
                 return None
-            else:
-                raise e
+
+        return cast_or_none
+
+    def _base_caster(self, column: ConfColumn) -> Caster:
+        """Returns function casting non-empty cell value to Python type of given column, raising if it can not"""
+        if column.conf_type in _CONF_TYPE_TO_TIME_CONVERTER:
+            return TemporalParser(_CONF_TYPE_TO_TIME_CONVERTER[column.conf_type])
+        return _CONF_TYPE_TO_CASTER[column.conf_type]
@@ -1,34 +1,138 @@
-from datetime import datetime
+import csv
+import os
+import time
+from io import StringIO
 from os import path
-from typing import List
+from typing import List, Optional, Tuple, Any, Dict
 
+from todb.abstract import Model
 from todb.data_model import InputFileConfig
 from todb.logger import get_logger
-from todb.util import seconds_between
+from todb.stats import get_stats, STAGE_FAILED_ROWS_WRITE
+
+FAILURE_REASONS_FILE_SUFFIX = ".reasons.csv"
+FAILURE_REASONS_HEADER = "input_line,input_offset,reason\n"
+FAILURE_UNKNOWN = "unknown"
+DEFAULT_FLUSH_INTERVAL_SEC = 5.
+WRITE_BUFFER_SIZE = 1024 * 1024
+MAX_OPEN_HANDLERS = 64  # handlers keeping their files open at the same time, 2 files each
+
+FailureReason = Tuple[Optional[int], Optional[int], str]  # line number and byte offset in input file, reason
+
+
+class FailedRowsBatch(Model):
+    """Rows of an input file that failed to import, already encoded the same way as the file, with their positions in
+    it (if known) and failure reasons"""
+
+    def __init__(self, file_path: str, rows_bytes: bytes, reasons: List[FailureReason]) -> None:
+        self.file_path = file_path
+        self.rows_bytes = rows_bytes
+        self.reasons = reasons
+
+    def rows_count(self) -> int:
+        return len(self.reasons)
+
+
+def encode_failed_rows(input_file_config: InputFileConfig, rows: List[List[str]]) -> bytes:
+    """Encodes rows the same way as input file, each of them ended with row delimiter"""
+    row_delimiter = input_file_config.row_delimiter()
+    if input_file_config.quote_char() is None:
+        cell_delimiter = input_file_config.cell_delimiter()
+        out_string = "".join([cell_delimiter.join(cells) + row_delimiter for cells in rows])
+    else:
+        out_buffer = StringIO(newline="")
+        writer = csv.writer(out_buffer, delimiter=input_file_config.cell_delimiter(),
+                            quotechar=input_file_config.quote_char(), escapechar=input_file_config.escape_char(),
+                            lineterminator=row_delimiter)
+        writer.writerows(rows)
+        out_string = out_buffer.getvalue()
+    return out_string.encode(input_file_config.file_encoding())
 
 
 class FailRowHandler(object):
-    def __init__(self, input_file_config: InputFileConfig, output_file_path: str) -> None:
+    """Appends rows that failed to import to output file, keeping it open with buffer flushed (and synced to disk) at
+    most every flush_interval_sec (and on close); n-th row of side file (output file + .reasons.csv) tells position
+    in input file and failure reason of n-th failed row"""
+
+    def __init__(self, input_file_config: InputFileConfig, output_file_path: str,
+                 flush_interval_sec: float = DEFAULT_FLUSH_INTERVAL_SEC) -> None:
         self.input_file_config = input_file_config
         self.output_file_path = output_file_path
+        self.reasons_file_path = output_file_path + FAILURE_REASONS_FILE_SUFFIX
+        self.flush_interval_sec = flush_interval_sec
         self.logger = get_logger()
+        self.failed_rows = 0
+        self._output_file = None  # type: Optional[Any]
+        self._reasons_file = None  # type: Optional[Any]
+        self._last_flush = time.time()
+        self._is_flushed = True
 
-    def handle_failed_rows(self, rows: List[List[str]]):
-        start_time = datetime.utcnow()
-        self.logger.debug("Logging {} unsuccessfully inserted rows...".format(len(rows)))
+    def __getstate__(self) -> Dict[str, Any]:
+        # open files are not passed to other processes
+        return {"input_file_config": self.input_file_config, "output_file_path": self.output_file_path,
+                "flush_interval_sec": self.flush_interval_sec}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)  # type: ignore
+
+    def handle_failed_rows(self, rows: List[List[str]], reasons: Optional[List[FailureReason]] = None) -> None:
+        self.write_batch(FailedRowsBatch(self.output_file_path, encode_failed_rows(self.input_file_config, rows),
+                                         reasons or [(None, None, FAILURE_UNKNOWN)] * len(rows)))
+
+    def write_batch(self, batch: FailedRowsBatch) -> None:
+        """Appends rows and reasons to files, opening them if needed; on failure, logs the rows and raises error"""
         try:
-            out_bytes = self._convert_rows_to_bytes(rows)
-            with open(self.output_file_path, "ab") as out_file:
-                out_file.write(out_bytes)
-            took_seconds = seconds_between(start_time)
-            self.logger.info("Logged {} unsuccessfully inserted rows in {:.2f}s".format(len(rows), took_seconds))
+            with get_stats().timed(STAGE_FAILED_ROWS_WRITE):
+                if self._output_file is None or self._reasons_file is None:
+                    self._open()
+                assert self._output_file is not None and self._reasons_file is not None
+                self._output_file.write(batch.rows_bytes)
+                self._reasons_file.write("".join(["{},{},{}\n".format("" if line is None else line,
+                                                                      "" if offset is None else offset, reason)
+                                                  for line, offset, reason in batch.reasons]))
+                self.failed_rows += batch.rows_count()
+                self._is_flushed = False
+            if time.time() - self._last_flush >= self.flush_interval_sec:
+                self.flush()
+            self.logger.debug("Logged {} unsuccessfully inserted rows".format(batch.rows_count()))
         except Exception as e:
+            rows_text = batch.rows_bytes.decode(self.input_file_config.file_encoding(), "replace")
             self.logger.error("Could not handle storing rows back in file {}: {}; rows: \n{}".format(path.basename(
-                self.output_file_path), e, rows))
-
-    def _convert_rows_to_bytes(self, rows: List[List[str]]) -> bytes:
-        out_string = self.input_file_config.row_delimiter().join(
-            [self.input_file_config.cell_delimiter().join(cells)
-             for cells in rows])
-        out_bytes = ("\n" + out_string).encode(self.input_file_config.file_encoding())
-        return out_bytes
+                self.output_file_path), e, rows_text))
+            raise
+
+    def flush(self) -> None:
+        """Writes rows and reasons buffered since last flush, if any, to files and syncs them to disk"""
+        if not self._is_flushed and self._output_file is not None and self._reasons_file is not None:
+            with get_stats().timed(STAGE_FAILED_ROWS_WRITE):
+                for f in (self._output_file, self._reasons_file):
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._is_flushed = True
+        self._last_flush = time.time()
+
+    def close_files(self) -> None:
+        """Flushes and closes files; they're opened again by next write"""
+        if self._output_file is not None and self._reasons_file is not None:
+            self.flush()
+            self._output_file.close()
+            self._reasons_file.close()
+            self._output_file, self._reasons_file = None, None
+
+    def close(self) -> None:
+        self.close_files()
+        if self.failed_rows:
+            self.logger.info("Logged {} unsuccessfully inserted rows into {} (reasons in {})".format(
+                self.failed_rows, self.output_file_path, self.reasons_file_path))
+
+    def _open(self) -> None:
+        output_file = open(self.output_file_path, "ab", buffering=WRITE_BUFFER_SIZE)
+        try:
+            is_new_reasons_file = not path.exists(self.reasons_file_path) or path.getsize(self.reasons_file_path) == 0
+            reasons_file = open(self.reasons_file_path, "a", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+        except Exception:
+            output_file.close()
+            raise
+        if is_new_reasons_file:
+            reasons_file.write(FAILURE_REASONS_HEADER)
+        self._output_file, self._reasons_file = output_file, reasons_file
@@ -1,40 +1,185 @@
 from datetime import datetime
-from typing import List
+from operator import itemgetter
+from typing import List, Optional, Any, Tuple
 
-from todb.db_client import DbClient
+from todb.chunk import Rows
+from todb.db_client import DbClient, RowWithEntity
 from todb.logger import get_logger
+from todb.stats import get_stats, STAGE_PARSE, STAGE_CAST, STAGE_VALIDATE, STAGE_INSERT, STAGE_RETRY, \
+    STAGE_COMMIT, COUNTER_ROWS, COUNTER_CHUNKS, COUNTER_FAILED_ROWS
 from todb.util import split_in_half, seconds_between
 
+try:
+    from contextlib import nullcontext
+except ImportError:  # Python < 3.7; exit stack without callbacks does nothing as well
+    from contextlib import ExitStack as nullcontext  # type: ignore
+
 INSERT_ONE_BY_ONE_THRESHOLD = 8
 
+FAILURE_CAST = "cast"  # cell value could not be cast to column type
+FAILURE_CONSTRAINT = "constraint"  # entity violates NOT NULL, length, range or uniqueness constraint of table
+FAILURE_DB = "db"  # DB rejected the row on insert
+FAILURE_COMMIT = "commit"  # row was inserted, but transaction it was inserted in failed to commit
+
+FailedRow = Tuple[int, str, List[str]]  # index of row in its chunk, failure reason and cells
+CastRows = Tuple[List[RowWithEntity], List[List[str]]]  # rows with entities built from them, rows that failed to cast
+# id of chunk ended in pending transaction, its rows, rows with entities that were inserted and ones that failed to be
+UncommittedChunk = Tuple[Optional[Any], List[List[str]], List[RowWithEntity], List[List[str]]]
+
 
 class Importer(object):
     def __init__(self, db_client: DbClient) -> None:
         self.db_client = db_client
         self.logger = get_logger()
+        self.stats = get_stats()
+        self.chunks = 0
+        self.round_trips = 0
+        self.retry_round_trips = 0
+        self.invalid_rows = 0
+        self._uncommitted_chunks = []  # type: List[UncommittedChunk]
+        self._failed_chunks = []  # type: List[Tuple[Optional[Any], List[FailedRow]]]
+        self._failed_chunk_ids = []  # type: List[Any]
+
+    @property
+    def inserted_rows(self) -> int:
+        """Number of rows inserted in committed transactions"""
+        return self.db_client.inserted_rows_count()
+
+    @property
+    def skipped_rows(self) -> int:
+        """Number of rows skipped as conflicting, in committed transactions"""
+        return self.db_client.skipped_rows_count()
+
+    def parse_and_import(self, table_name: str, rows: Rows,
+                         chunk_id: Optional[Any] = None) -> List[List[str]]:
+        """Parses rows and tries to inserts them to DB; returns list of rows that failed to import; chunk_id is
+        returned by committed_chunks once rows are committed"""
+        return [cells for _, _, cells in self.import_chunk(table_name, rows, chunk_id)]
+
+    def import_chunk(self, table_name: str, rows: Rows, chunk_id: Optional[Any] = None,
+                     cast_rows: Optional[CastRows] = None) -> List[FailedRow]:
+        """Same as parse_and_import, but returns failed rows together with their index in chunk and failure reason;
+        cast_rows are entities built from (the same objects as) rows and rows they could not be built from, if rows
+        were already cast (e.g. by other process)"""
+        retry_round_trips_before = self.retry_round_trips
+        if not isinstance(rows, list):
+            with self.stats.timed(STAGE_PARSE):
+                rows = list(rows)  # cells of Chunk are split on access; failed rows are told apart by identity
+        if cast_rows is None:
+            with self.stats.timed(STAGE_CAST):
+                cast_rows = self.db_client.build_entities(rows)
+        rows_with_entities, cast_failed_rows = cast_rows
+        with self.stats.timed(STAGE_VALIDATE):
+            rows_with_entities, invalid_rows = self.db_client.validate_entities(table_name, rows_with_entities)
+        self.invalid_rows += len(invalid_rows)
+        db_failed_rows = self._import(table_name, rows_with_entities)
+        self._uncommitted_chunks.append((chunk_id, rows, rows_with_entities, db_failed_rows))
+        commit_failed_rows = []  # type: List[List[str]]
+        with self.stats.timed(STAGE_COMMIT):
+            try:
+                if self.db_client.end_chunk(chunk_id):
+                    self._uncommitted_chunks = []
+            except Exception:
+                commit_failed_rows = self._inserted_rows(*self._uncommitted_chunks[-1][2:])
+                self._fail_uncommitted_chunks(current_chunk=True)
+        self.chunks += 1
+        self.stats.increment(COUNTER_CHUNKS)
+        self.stats.increment(COUNTER_ROWS, len(rows))
+        self.stats.increment(COUNTER_FAILED_ROWS, len(cast_failed_rows) + len(invalid_rows) + len(db_failed_rows) +
+                             len(commit_failed_rows))
+        retry_round_trips = self.retry_round_trips - retry_round_trips_before
+        if retry_round_trips:
+            self.logger.debug("Imported chunk of {} rows with {} retry round trip(s)".format(len(rows),
+                                                                                            retry_round_trips))
+        return self._indexed_failed_rows(rows, [(FAILURE_CAST, cast_failed_rows), (FAILURE_CONSTRAINT, invalid_rows),
+                                                (FAILURE_DB, db_failed_rows), (FAILURE_COMMIT, commit_failed_rows)])
 
-    def parse_and_import(self, table_name: str, rows: List[List[str]]) -> List[List[str]]:
-        """Parses rows and tries to inserts them to DB; returns list of rows that failed to import"""
+    def committed_chunks(self) -> List[Any]:
+        """Returns ids of chunks committed since last call, as well as of ones which rows inserted in transaction that
+        failed to commit were returned as failed (by import_chunk or pop_failed_chunks)"""
+        chunk_ids, self._failed_chunk_ids = self.db_client.pop_committed_chunk_ids() + self._failed_chunk_ids, []
+        return chunk_ids
+
+    def pop_failed_chunks(self) -> List[Tuple[Optional[Any], List[FailedRow]]]:
+        """Returns ids and rows of chunks imported before current one, which rows were inserted in transaction that
+        failed to commit, since last call"""
+        failed_chunks, self._failed_chunks = self._failed_chunks, []
+        return failed_chunks
+
+    def _fail_uncommitted_chunks(self, current_chunk: bool = False) -> None:
+        """Marks rows inserted in chunks of transaction that failed to commit as failed; rows of current chunk, if
+        it's one of them, are returned by import_chunk instead"""
+        uncommitted_chunks, self._uncommitted_chunks = self._uncommitted_chunks, []
+        for n, (chunk_id, rows, rows_with_entities, db_failed_rows) in enumerate(uncommitted_chunks):
+            if chunk_id is not None:
+                self._failed_chunk_ids.append(chunk_id)
+            if current_chunk and n == len(uncommitted_chunks) - 1:
+                continue
+            inserted_rows = self._inserted_rows(rows_with_entities, db_failed_rows)
+            if inserted_rows:
+                self.stats.increment(COUNTER_FAILED_ROWS, len(inserted_rows))
+                self._failed_chunks.append((chunk_id, self._indexed_failed_rows(rows, [(FAILURE_COMMIT,
+                                                                                         inserted_rows)])))
+
+    def _inserted_rows(self, rows_with_entities: List[RowWithEntity],
+                       db_failed_rows: List[List[str]]) -> List[List[str]]:
+        db_failed_ids = set(map(id, db_failed_rows))
+        return [row for row, _ in rows_with_entities if id(row) not in db_failed_ids]
+
+    def _indexed_failed_rows(self, rows: List[List[str]], rows_per_reason: List[Tuple[str, List[List[str]]]]
+                             ) -> List[FailedRow]:
+        """Returns failed rows of given reasons paired with their indexes in chunk (told apart by identity)"""
+        if not any(reason_rows for _, reason_rows in rows_per_reason):
+            return []
+        row_indexes = {id(row): i for i, row in enumerate(rows)}
+        return sorted([(row_indexes.get(id(row), -1), reason, row)
+                       for reason, reason_rows in rows_per_reason for row in reason_rows], key=itemgetter(0))
+
+    def _import(self, table_name: str, rows_with_entities: List[RowWithEntity],
+                is_retry: bool = False) -> List[List[str]]:
+        """Inserts already cast entities, splitting them in halves on failure; returns rows that failed to import;
+        time of first attempt counts as insert stage, time of all retries of failed batch as retry stage"""
+        if not rows_with_entities:
+            return []
         start_time = datetime.utcnow()
-        if len(rows) <= INSERT_ONE_BY_ONE_THRESHOLD:
-            failed_rows = self.db_client.insert_one_by_one(table_name, rows)
+        if len(rows_with_entities) <= INSERT_ONE_BY_ONE_THRESHOLD:
+            self._count_round_trips(len(rows_with_entities), is_retry)
+            with self.stats.timed(STAGE_INSERT) if not is_retry else nullcontext():
+                failed_rows = self.db_client.insert_entities_one_by_one(table_name, rows_with_entities)
             took_seconds = seconds_between(start_time)
             self.logger.debug(
-                "Inserted {} / {} rows (one-by-one) in {:.2f}s".format(len(rows) - len(failed_rows),
-                                                                       len(rows), took_seconds))
+                "Inserted {} / {} rows (one-by-one) in {:.2f}s".format(len(rows_with_entities) - len(failed_rows),
+                                                                       len(rows_with_entities), took_seconds))
             return failed_rows
         else:
-            mass_insert_successful, failed_rows = self.db_client.insert_in_batch(table_name, rows)
-            if mass_insert_successful:
+            self._count_round_trips(1, is_retry)
+            with self.stats.timed(STAGE_INSERT) if not is_retry else nullcontext():
+                inserted = self.db_client.insert_entities_in_batch(table_name, rows_with_entities)
+            if inserted:
                 took_seconds = seconds_between(start_time)
-                self.logger.debug("Inserted {} / {} rows (batch) in {:.2f}s".format(len(rows) - len(failed_rows),
-                                                                                    len(rows), took_seconds))
-                return failed_rows
+                self.logger.debug("Inserted {} rows (batch) in {:.2f}s".format(len(rows_with_entities), took_seconds))
+                return []
             else:
-                rows_a, rows_b = split_in_half(rows)
-                failed_rows_a = self.parse_and_import(table_name, rows_a)
-                failed_rows_b = self.parse_and_import(table_name, rows_b)
-                return failed_rows_a + failed_rows_b
+                half_a, half_b = split_in_half(rows_with_entities)
+                with self.stats.timed(STAGE_RETRY) if not is_retry else nullcontext():
+                    return self._import(table_name, half_a, is_retry=True) + \
+                        self._import(table_name, half_b, is_retry=True)
+
+    def _count_round_trips(self, round_trips: int, is_retry: bool) -> None:
+        self.round_trips += round_trips
+        if is_retry:
+            self.retry_round_trips += round_trips
 
     def close(self) -> None:
+        """Commits pending transaction and closes DB client; if committing fails, rows inserted within transaction
+        are returned by pop_failed_chunks"""
+        try:
+            if self.db_client.commit():
+                self._uncommitted_chunks = []
+        except Exception:
+            self._fail_uncommitted_chunks()
         self.db_client.close()
+        self.logger.debug("Imported {} chunks; {} rows inserted, {} failed validation, {} skipped as conflicting; "
+                          "needed {} DB round trips, {} of them to retry failed batches".format(
+                              self.chunks, self.inserted_rows, self.invalid_rows, self.skipped_rows,
+                              self.round_trips, self.retry_round_trips))
@@ -3,12 +3,14 @@ import logging
 import traceback
 from datetime import datetime
 from os import path
-from typing import Tuple
+from typing import Tuple, Union
 
 from todb.data_model import parse_model_file
+from todb.db_client import ON_CONFLICT_MODES, ON_CONFLICT_FAIL, ON_CONFLICT_UPDATE
 from todb.logger import setup_logger, get_logger
 from todb.parallel_executor import ParallelExecutor
-from todb.params import InputParams
+from todb.params import InputParams, LOADERS, LOADER_INSERT, CHUNK_SIZE_AUTO
+from todb.shm_transport import TRANSPORTS, TRANSPORT_PICKLE
 from todb.util import seconds_between
 
 EXIT_CODE_OK = 0
@@ -16,34 +18,79 @@ EXIT_CODE_USER_ERROR = 1
 EXIT_CODE_FAILURE = 2
 
 
+def _chunk_size(value: str) -> Union[int, str]:
+    if value == CHUNK_SIZE_AUTO:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("chunk size must be integer or {}, got {}".format(CHUNK_SIZE_AUTO, value))
+
+
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Import CSV/TSV files into any SQL DB system')
-    parser.add_argument('input', type=str, help='Path to CSV/TSV file to import into DB')
+    parser.add_argument('input', type=str,
+                        help='Path to CSV/TSV file to import into DB, directory of such files or glob pattern matching them (quoted); all files are imported into the same table')
     parser.add_argument('model', type=str, help='Path to JSON file containing CSV data model')
     parser.add_argument('sql_db', type=str,
                         help='Sqlalchemy-compatible database URL; see https://docs.sqlalchemy.org/en/latest/core/engines.html#database-urls')
     parser.add_argument('--failures', type=str,
-                        help='Path to CSV/TSV file failing rows should be logged; defaults to input file + _failed suffix')
+                        help='Path to CSV/TSV file failing rows should be logged (or, when importing many files, directory for such file per input file); defaults to input file + _failed suffix')
     parser.add_argument('--table', type=str,
                         help='Table name to insert the data to; by default, table name will be generated from input file name and current time')
     parser.add_argument('--proc', type=int,
                         help='Number of processes used to parse rows and insert data into DB; default: number of CPUs on client machine')
-    parser.add_argument('--chunk', type=int,
-                        help='Size (in kB) of chunk of data that is read from input file and inserted into DB in batched SQL statement; default: 512')
+    parser.add_argument('--cast-workers', type=int,
+                        help='Number of processes reading, parsing and casting rows, which pass them to --writers processes inserting them into DB; default: --proc')
+    parser.add_argument('--writers', type=int,
+                        help='Number of processes inserting rows cast by --cast-workers processes into DB, each with its own DB connection(s); default: --proc; by default, each of --proc processes both casts and inserts rows')
+    parser.add_argument('--chunk', type=_chunk_size,
+                        help='Size (in kB) of chunk of data that is read from input file and inserted into DB in batched SQL statement, or "auto" to adjust it while importing, based on measured throughput of workers; default: 512')
+    parser.add_argument('--parse-in-workers', action='store_true',
+                        help='Main process only splits input file into byte ranges of complete rows; reading, decoding and parsing is done by worker processes')
+    parser.add_argument('--columnar', action='store_true',
+                        help='Casts cells of each chunk column by column instead of row by row (integer columns with NumPy, if installed), which is faster for wide files of numbers')
+    parser.add_argument('--transport', type=str, choices=TRANSPORTS, default=TRANSPORT_PICKLE,
+                        help='How chunks read by main process are passed to worker processes: parsed rows pickled through queue, or raw bytes placed in shared memory ring buffer (Python 3.8+), so that workers parse them and only their location goes through queue; default: pickle')
+    parser.add_argument('--loader', type=str, choices=LOADERS, default=LOADER_INSERT,
+                        help='Method of loading batches into DB: batched INSERT statements (any DB) or COPY FROM STDIN (PostgreSQL only); default: insert')
+    parser.add_argument('--on-conflict', type=str, choices=ON_CONFLICT_MODES, default=ON_CONFLICT_FAIL,
+                        help='What to do with rows having the same primary key or unique value as already existing ones: fail them, skip them or update existing rows with them (PostgreSQL and SQLite only); default: fail')
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help='If table does not exist, creates it without indexes and unique constraints and builds them after loading the data')
+    parser.add_argument('--commit-chunks', type=int,
+                        help='Number of chunks each process inserts in single DB transaction; default: 1, or unlimited if --commit-interval is set')
+    parser.add_argument('--commit-interval', type=float,
+                        help='Time (in seconds) after which each process commits its DB transaction; checked after each chunk; default: not used')
+    parser.add_argument('--pool-size', type=int,
+                        help='Size of DB connection pool of each process; 0 disables pooling; default: 1')
+    parser.add_argument('--pool-recycle', type=int,
+                        help='Time (in seconds) after which pooled DB connection is replaced with new one; default: never')
+    parser.add_argument('--pool-pre-ping', action='store_true',
+                        help='Tests pooled DB connection for liveness before using it')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continues interrupted import into --table, skipping parts of input file already committed according to checkpoint journal stored next to --failures file')
+    parser.add_argument('--verify-count', action='store_true',
+                        help='Counts rows of the table (with SELECT count(*), which may take long on large tables) before and after import to verify number of inserted rows reported by DB')
+    parser.add_argument('--report', type=str,
+                        help='Path to JSON file with time spent in each stage of import (reading, parsing, casting, inserting, waiting on queues etc.) and counters, written periodically during import and at its end')
+    parser.add_argument('--prometheus-textfile', type=str,
+                        help='Path to file the same stats are written to in Prometheus text format (e.g. for node_exporter textfile collector)')
+    parser.add_argument('--report-interval', type=float,
+                        help='Time (in seconds) between writing reports during import; default: 10')
     parser.add_argument('--ca', type=str, help='Path to certificate file for given DB server')
     parser.add_argument('--logfile', type=str, default=None, help='File to which todb')
     parser.add_argument('--debug', action='store_true', help='Increases logging verbosity')
     return parser.parse_args()
 
 
-def todb(params: InputParams) -> Tuple[int, int]:
+def todb(params: InputParams) -> Tuple[int, int, int]:
     logger = get_logger()
     columns, pkey, file_config = parse_model_file(params.model_path)
     logger.debug("Parsed model columns: {}".format(columns))
 
-    executor = ParallelExecutor(params, file_config, columns, pkey, params.table_name, params.fail_output_path)
-    csv_rows, db_rows = executor.start(params.input_path)
-    return csv_rows, db_rows
+    executor = ParallelExecutor(params, file_config, columns, pkey, params.table_name)
+    return executor.start(params.input_paths)
 
 
 def cli_main() -> None:
@@ -58,17 +105,20 @@ def main(params: InputParams) -> None:
     try:
         try:
             start_time = datetime.utcnow()
-            csv_rows, db_rows = todb(params)
+            csv_rows, db_rows, skipped_rows = todb(params)
             took_seconds = seconds_between(start_time)
-            velocity_kBps, velocity_rows_sec = (path.getsize(
-                params.input_path) / 1000) / took_seconds, csv_rows / took_seconds
-            success_percentage = db_rows * 100 / csv_rows
+            input_size_kB = sum([path.getsize(f) for f in params.input_paths]) / 1000
+            velocity_kBps, velocity_rows_sec = input_size_kB / took_seconds, csv_rows / took_seconds
+            success_percentage = db_rows * 100 / csv_rows if csv_rows else 100.0
+            inserted = "Inserted or updated" if params.on_conflict == ON_CONFLICT_UPDATE else "Inserted"
             logger.info(
-                "Inserted {} / {} ({:.1f}%) rows in {:.2f}s ({:.1f} kB/s, {:.1f} rows/s)".format(db_rows, csv_rows,
-                                                                                                 success_percentage,
-                                                                                                 took_seconds,
-                                                                                                 velocity_kBps,
-                                                                                                 velocity_rows_sec))
+                "{} {} / {} ({:.1f}%) rows in {:.2f}s ({:.1f} kB/s, {:.1f} rows/s)".format(inserted, db_rows, csv_rows,
+                                                                                           success_percentage,
+                                                                                           took_seconds,
+                                                                                           velocity_kBps,
+                                                                                           velocity_rows_sec))
+            if params.on_conflict != ON_CONFLICT_FAIL:
+                logger.info("Skipped {} rows conflicting with already existing ones".format(skipped_rows))
             exit(EXIT_CODE_OK)
         except Exception as e:
             logger.error("Error: {} ()".format(e))
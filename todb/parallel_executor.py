@@ -1,110 +1,496 @@
 import multiprocessing as mp
-from typing import List, Tuple
+import queue
+from collections import Counter, OrderedDict
+from time import perf_counter
+from typing import List, Tuple, Union, Callable, Iterator, Dict, Optional
 
-from todb.fail_row_handler import FailRowHandler
-from todb.importer import Importer
+from todb.abstract import Model
+from todb.checkpoint import CheckpointJournal
+from todb.chunk import Rows
+from todb.chunk_sizing import ChunkSizer, ChunkTiming
+from todb.fail_row_handler import FailRowHandler, FailedRowsBatch, FailureReason, encode_failed_rows, \
+    DEFAULT_FLUSH_INTERVAL_SEC, MAX_OPEN_HANDLERS
+from todb.db_client import DbClient, ON_CONFLICT_UPDATE
+from todb.importer import Importer, FailedRow, CastRows
 from todb.logger import get_logger
-from todb.params import InputParams
-from todb.data_model import ConfColumn, InputFileConfig, PrimaryKeyConf
+from todb.params import InputParams, LOADER_COPY
+from todb.data_model import ConfColumn, InputFileConfig, PrimaryKeyConf, PKEY_UUID, GENERATED_PKEY_COLUMN
+from todb.columnar import ColumnarEntityBuilder
 from todb.entity_builder import EntityBuilder
-from todb.parsing import CsvParser
+from todb.parsing import CsvParser, ByteRange
+from todb.pg_copy_client import PgCopyClient
+from todb.shm_transport import ShmChunk, ShmRingBuffer, ShmReader, TRANSPORT_SHM
 from todb.sql_client import SqlClient
+from todb.stats import StatsCollector, StatsSender, RunReport, get_stats, reset_stats, format_stages_summary, \
+    STAGE_QUEUE_PUT, STAGE_QUEUE_GET, STAGE_PARSE, STAGE_CAST, MAXIMUM_PEAK_RSS_kB
+from todb.util import interleave
 
 POISON_PILL = None
 QUEUE_SIZE_PER_PROCESS = 2
+SHM_RING_CHUNKS_PER_PROCESS = 2 * (QUEUE_SIZE_PER_PROCESS + 1)  # queued and processed chunks, with room for wrapping
+
+# byte range of input file, possibly with its parsed rows or raw bytes placed in shared memory
+Task = Union[ByteRange, Tuple[ByteRange, Rows], ShmChunk]
+
+
+def task_byte_range(task: Task) -> ByteRange:
+    if isinstance(task, ByteRange):
+        return task
+    elif isinstance(task, ShmChunk):
+        return task.byte_range
+    return task[0]
+
+
+def read_task_rows(parser: CsvParser, shm_reader: Optional[ShmReader], task: Task) -> Tuple[ByteRange, Rows]:
+    """Returns byte range of task and its rows, reading and parsing them unless task already carries them; rows
+    which can not be read or parsed (e.g. can not be decoded) are logged and left out, as when main process parses"""
+    if isinstance(task, ByteRange):
+        try:
+            return task, parser.read_rows_in_range(task)
+        except Exception as e:
+            get_logger().error("Error on parsing CSV: {}".format(e))
+            return task, []
+    elif isinstance(task, ShmChunk):
+        if shm_reader is None:
+            raise ValueError("Got chunk placed in shared memory, but shared memory transport is not used")
+        with shm_reader.chunk_bytes(task) as chunk_bytes:
+            try:
+                return task.byte_range, parser.bytes_to_rows(chunk_bytes)
+            except Exception as e:
+                get_logger().error("Error on parsing CSV: {}".format(e))
+                return task.byte_range, []
+    return task
+
+
+class CastChunk(Model):
+    """Rows of a chunk cast by cast worker process, passed to writer process; rows and cast rows are pickled
+    together, so that cast rows still refer to the same row objects after unpickling"""
+
+    def __init__(self, byte_range: ByteRange, rows: List[List[str]], cast_rows: CastRows, seconds: float) -> None:
+        self.byte_range = byte_range
+        self.rows = rows
+        self.cast_rows = cast_rows
+        self.seconds = seconds  # spent reading, parsing and casting rows
 
 
 class ParallelExecutor(object):
     def __init__(self, params: InputParams, input_file_config: InputFileConfig, columns: List[ConfColumn],
-                 pkey: PrimaryKeyConf, table_name: str, failed_rows_file: str) -> None:
+                 pkey: PrimaryKeyConf, table_name: str) -> None:
         self.pkey = pkey
         self.params = params
         self.input_file_config = input_file_config
         self.columns = columns
         self.table_name = table_name
-        self.failed_rows_file = failed_rows_file
+        self.journal = CheckpointJournal(params.journal_path())
+        self.task_workers = params.cast_workers if params.pipelined else params.processes
+        self.writers = params.writers if params.pipelined else params.processes
+        self.chunk_sizer = ChunkSizer(params.chunk_size_kB, samples_per_step=self.writers) \
+            if params.adaptive_chunk_size else None  # type: Optional[ChunkSizer]
         self.logger = get_logger()
 
-    def start(self, input_file_name: str) -> Tuple[int, int]:
-        db_client = SqlClient(self.params.sql_db, EntityBuilder(self.columns))
-        db_client.init_table(self.table_name, self.columns, self.pkey)
-        initial_row_count = db_client.count(self.table_name)
+    def start(self, input_file_names: List[str]) -> Tuple[int, int, int]:
+        """Imports given files into one table, interleaving their chunks; returns numbers of rows in files, rows
+        inserted into DB and rows skipped as conflicting with already existing ones, as counted by worker processes
+        from row counts reported by DB driver"""
+        db_client = self._new_db_client()
+        table_created = db_client.init_table(self.table_name, self.columns, self.pkey,
+                                             defer_indexes=self.params.defer_indexes)
+        initial_row_count = db_client.count(self.table_name) if self.params.verify_count else 0
+        db_client.close()  # don't let worker processes inherit connections
+        if self.params.resume:
+            self.logger.info("Resuming import; {} committed byte range(s) found in checkpoint journal {}".format(
+                self.journal.load(), self.journal.journal_path))
+        else:
+            self.journal.reset()
 
         unsuccessful_rows_queue = mp.JoinableQueue(  # type: ignore
             maxsize=QUEUE_SIZE_PER_PROCESS * self.params.processes)
-        fail_row_handler = FailRowHandler(self.input_file_config, self.failed_rows_file)
-        failure_handling_worker = UnsuccessfulRowsHandlingWorker(unsuccessful_rows_queue, fail_row_handler)
+        results_queue = mp.Queue()  # type: ignore
+        report = RunReport(self.params.report_path, self.params.prometheus_path,
+                           details={"table": self.table_name, "inputs": input_file_names})
+        stats_collector = StatsCollector(results_queue, report, interval_sec=self.params.report_interval_sec,
+                                         chunk_timing_handler=self.chunk_sizer.add_timing if self.chunk_sizer else None)
+        stats_collector.start()
+        fail_row_handlers = {f: FailRowHandler(self.input_file_config, self.params.fail_output_path_for(f))
+                             for f in input_file_names}
+        failure_handling_worker = UnsuccessfulRowsHandlingWorker(unsuccessful_rows_queue, results_queue,
+                                                                 fail_row_handlers, self.journal,
+                                                                 self.params.report_interval_sec)
         failure_handling_worker.start()
 
-        tasks_queue = mp.JoinableQueue(maxsize=QUEUE_SIZE_PER_PROCESS * self.params.processes)  # type: ignore
+        tasks_queue = mp.JoinableQueue(maxsize=QUEUE_SIZE_PER_PROCESS * self.task_workers)  # type: ignore
+        parser = CsvParser(self.input_file_config, self.params.chunk_size_kB, max_cells=self._max_cells())
+        if self.chunk_sizer is not None:
+            parser.chunk_size_kB = self.chunk_sizer.chunk_size_kB()
+        if self.params.transport == TRANSPORT_SHM:
+            acks_queue = mp.Queue()  # type: Optional[mp.Queue]
+            ring_capacity = SHM_RING_CHUNKS_PER_PROCESS * self.task_workers * round(parser.chunk_size_kB * 1000)
+            ring_buffer = ShmRingBuffer(ring_capacity, acks_queue)  # type: Optional[ShmRingBuffer]
+        else:
+            acks_queue, ring_buffer = None, None
+        if self.params.pipelined:
+            writer_tasks_queue = mp.JoinableQueue(maxsize=QUEUE_SIZE_PER_PROCESS * self.writers)  # type: ignore
+            cast_workers = [CastWorker(tasks_queue, writer_tasks_queue, results_queue, self._new_entity_builder(),
+                                       parser, self.params.report_interval_sec, acks_queue)
+                            for _ in range(self.task_workers)]  # type: List[CastWorker]
+            self.logger.info("Casting rows in {} process(es), inserting them in {} process(es)".format(
+                len(cast_workers), self.writers))
+        else:
+            writer_tasks_queue, cast_workers = tasks_queue, []
         parser_workers = [
-            ParsingWorker(tasks_queue, unsuccessful_rows_queue,
-                          Importer(SqlClient(self.params.sql_db, EntityBuilder(self.columns))),
-                          self.table_name)
-            for _ in range(self.params.processes)
+            ParsingWorker(writer_tasks_queue, unsuccessful_rows_queue, results_queue,
+                          self._new_db_client, parser, self.table_name, self.params.report_interval_sec,
+                          send_chunk_timings=self.chunk_sizer is not None, acks_queue=acks_queue)
+            for _ in range(self.writers)
         ]
-        for w in parser_workers:
+        for w in cast_workers + parser_workers:
             w.start()
 
-        self.logger.debug("Inserting data into SQL...")
-        parser = CsvParser(self.input_file_config, self.params.chunk_size_kB)
+        self.logger.debug("Inserting data from {} file(s) into SQL...".format(len(input_file_names)))
+        skipped_ranges = []  # type: List[ByteRange]
+
+        def is_committed(byte_range: ByteRange) -> bool:
+            committed = self.params.resume and self.journal.is_committed(byte_range)
+            if committed:
+                skipped_ranges.append(byte_range)
+            return committed
+
+        file_tasks = (self._read_tasks(parser, f, is_committed, ring_buffer) for f in input_file_names)
         row_counter = 0
-        for cells_in_rows in parser.read_rows_in_chunks(input_file_name):
-            if cells_in_rows:
-                row_counter += len(cells_in_rows)
-                self.logger.info("Parsed {} rows ({} so far)...".format(len(cells_in_rows), row_counter))
-                tasks_queue.put(cells_in_rows)
+        stats = get_stats()
+        for task in interleave(file_tasks, window=self.task_workers):
+            byte_range = task_byte_range(task)
+            if isinstance(task, tuple):
+                row_counter += len(task[1])
+                self.logger.info("Parsed {} rows ({} so far)...".format(len(task[1]), row_counter))
+            else:
+                self.logger.debug("Scheduling {} bytes at offset {} of {}...".format(
+                    byte_range.length, byte_range.offset, byte_range.file_path))
+            if self.chunk_sizer is not None:
+                self.chunk_sizer.issue(byte_range, parser.chunk_size_kB)
+                parser.chunk_size_kB = self.chunk_sizer.chunk_size_kB()  # used to cut the next chunk
+            with stats.timed(STAGE_QUEUE_PUT):
+                tasks_queue.put(task)
+        if skipped_ranges:
+            self.logger.info("Skipped {} byte range(s) ({} bytes) already committed by previous import".format(
+                len(skipped_ranges), sum([r.length for r in skipped_ranges])))
         self.logger.info("Waiting till values will be stored in DB...")
-        [tasks_queue.put(POISON_PILL) for _ in parser_workers]
-        tasks_queue.join()
+        if cast_workers:
+            for _ in cast_workers:
+                tasks_queue.put(POISON_PILL)
+            tasks_queue.join()
+            for w in cast_workers:
+                w.join()  # exiting process flushes its queues, so writers get poison pills after all cast chunks
+        for _ in parser_workers:
+            writer_tasks_queue.put(POISON_PILL)
+        writer_tasks_queue.join()
+        rows_per_file, inserted_rows, skipped_rows = Counter(), 0, 0  # type: Counter, int, int
+        for worker_rows_per_file, worker_inserted_rows, worker_skipped_rows in stats_collector.wait_for_results(
+                len(parser_workers)):
+            rows_per_file.update(worker_rows_per_file)
+            inserted_rows += worker_inserted_rows
+            skipped_rows += worker_skipped_rows
+        for w in parser_workers:
+            w.join()  # exiting process flushes its queues, so failed rows and committed ranges come before poison pill
 
         self.logger.info("Waiting till failed rows will be stored in file...")
         unsuccessful_rows_queue.put(POISON_PILL)
         unsuccessful_rows_queue.join()
+        failed_rows_per_file, failed_rows_write_errors = stats_collector.wait_for_results(1)[0]
+        if ring_buffer is not None:
+            ring_buffer.close()
+        stats_snapshot = stats_collector.finish()
+        self.logger.info("Time spent in stages by all processes: {}".format(format_stages_summary(stats_snapshot)))
+        if MAXIMUM_PEAK_RSS_kB in stats_snapshot["maxima"]:
+            self.logger.info("Peak memory usage (RSS) of a process: {} kB".format(
+                stats_snapshot["maxima"][MAXIMUM_PEAK_RSS_kB]))
+        if len(input_file_names) > 1:
+            for f in input_file_names:
+                self.logger.info("Imported {}: {} rows, {} of them failed".format(f, rows_per_file[f],
+                                                                                  failed_rows_per_file.get(f, 0)))
+
+        duplicates = {}  # type: Dict[str, int]
+        if table_created and self.params.defer_indexes:
+            self.logger.info("Creating deferred indexes...")
+            duplicates = db_client.create_deferred_indexes(self.table_name, self.columns,
+                                                           parallelism=self.params.processes)
+        if self.params.verify_count:
+            self._verify_count(db_client, inserted_rows, db_client.count(self.table_name) - initial_row_count)
+        if failed_rows_write_errors:
+            raise Exception("Could not store failed rows in file(s) {} time(s); see log for rows which were not "
+                            "stored".format(failed_rows_write_errors))
+        if duplicates:
+            raise Exception("Rows violating unique constraint were loaded into table {}, so it has no unique index on "
+                            "column(s): {}; remove duplicated values and create unique index(es) manually or import "
+                            "again without --defer-indexes, failing such rows".format(
+                                self.table_name, ", ".join("{} ({} duplicated value(s))".format(c, n)
+                                                           for c, n in sorted(duplicates.items()))))
+        return sum(rows_per_file.values()), inserted_rows, skipped_rows
+
+    def _verify_count(self, db_client: DbClient, inserted_rows: int, counted_rows: int) -> None:
+        if inserted_rows == counted_rows:
+            self.logger.info("Verified number of inserted rows: {} rows were added to table".format(counted_rows))
+        elif self.params.on_conflict == ON_CONFLICT_UPDATE:
+            self.logger.info("{} rows were added to table; {} rows were inserted or updated".format(counted_rows,
+                                                                                                inserted_rows))
+        else:
+            self.logger.warning("Number of inserted rows reported by DB ({}) differs from number of rows added to "
+                                "table ({}); was table modified by other client?".format(inserted_rows, counted_rows))
+
+    def _read_tasks(self, parser: CsvParser, input_file_name: str, is_committed: Callable[[ByteRange], bool],
+                    ring_buffer: Optional[ShmRingBuffer]) -> Iterator[Task]:
+        """Yields byte ranges (or, if main process reads input, byte ranges with their rows or, if ring buffer is
+        given, their bytes placed in it) of given file; compressed file is always decompressed by main process"""
+        if self.params.parse_in_workers and not parser.is_compressed(input_file_name):
+            for byte_range in parser.read_byte_ranges(input_file_name):
+                if not is_committed(byte_range):
+                    yield byte_range
+        elif ring_buffer is not None:
+            for byte_range, rows_bytes in parser.read_ranges_with_bytes(input_file_name, skip_range=is_committed):
+                yield ring_buffer.put(byte_range, rows_bytes)
+        else:
+            yield from parser.read_ranges_with_rows(input_file_name, skip_range=is_committed)
+
+    def _max_cells(self) -> Optional[int]:
+        """Returns number of cells a row needs to be split into: leading cells which columns are built from and one
+        more, holding the rest of the row, which no column reads"""
+        col_indexes = [c.col_index for c in self.columns if c.col_index is not None]
+        return max(col_indexes) + 2 if col_indexes else None
+
+    def _new_entity_builder(self) -> EntityBuilder:
+        uuid_key_column = GENERATED_PKEY_COLUMN if self.pkey.mode == PKEY_UUID else None
+        builder_class = ColumnarEntityBuilder if self.params.columnar else EntityBuilder
+        return builder_class(self.columns, uuid_key_column)
+
+    def _new_db_client(self) -> SqlClient:
+        client_class = PgCopyClient if self.params.loader == LOADER_COPY else SqlClient
+        return client_class(self.params.sql_db, self._new_entity_builder(),
+                            ca_file=self.params.ca_file, pool_size=self.params.pool_size,
+                            pool_recycle_sec=self.params.pool_recycle_sec, pool_pre_ping=self.params.pool_pre_ping,
+                            commit_every_chunks=self.params.commit_every_chunks,
+                            commit_every_sec=self.params.commit_every_sec, on_conflict=self.params.on_conflict)
+
+
+class CastWorker(mp.Process):
+    """Casts rows of tasks being either parsed rows (with byte range they come from) or byte ranges of input file,
+    which worker reads and parses itself, and passes them to writer processes (ParsingWorkers) as CastChunks; does
+    not connect to DB"""
 
-        return row_counter, db_client.count(self.table_name) - initial_row_count
+    def __init__(self, task_queue: mp.Queue, cast_queue: mp.Queue, results_queue: mp.Queue,
+                 entity_builder: EntityBuilder, parser: CsvParser, stats_interval_sec: float,
+                 acks_queue: Optional[mp.Queue] = None) -> None:
+        super(CastWorker, self).__init__()
+        self.acks_queue = acks_queue
+        self.task_queue = task_queue
+        self.cast_queue = cast_queue
+        self.results_queue = results_queue
+        self.entity_builder = entity_builder
+        self.parser = parser
+        self.stats_interval_sec = stats_interval_sec
+        self.logger = get_logger()
+
+    def run(self):
+        self.logger.debug("{} | CastWorker starting!".format(self.name))
+        reset_stats()
+        stats, stats_sender = get_stats(), StatsSender(self.results_queue, self.stats_interval_sec)
+        shm_reader = ShmReader(self.acks_queue) if self.acks_queue is not None else None
+        while True:
+            with stats.timed(STAGE_QUEUE_GET):
+                task = self.task_queue.get()  # type: Optional[Task]
+            if task is None:
+                self.logger.debug("{} | CastWorker exiting!".format(self.name))  # Poison pill means shutdown
+                if shm_reader is not None:
+                    shm_reader.close()
+                stats_sender.send(force=True)
+                self.task_queue.task_done()
+                break
+            start = perf_counter()
+            byte_range, chunk_rows = read_task_rows(self.parser, shm_reader, task)
+            with stats.timed(STAGE_PARSE):
+                rows = list(chunk_rows)  # rows are pickled once, together with cast rows referring to them
+            with stats.timed(STAGE_CAST):
+                cast_rows = self.entity_builder.build_entities(rows)
+            chunk = CastChunk(byte_range, rows, cast_rows, perf_counter() - start)
+            with stats.timed(STAGE_QUEUE_PUT):
+                self.cast_queue.put(chunk)
+            stats_sender.send()
+            self.task_queue.task_done()
 
 
 class ParsingWorker(mp.Process):
-    def __init__(self, task_queue: mp.Queue, unsuccessful_rows_queue: mp.Queue,
-                 importer: Importer, table_name: str) -> None:
+    """Imports tasks being either parsed rows (with byte range they come from), byte ranges of input file, which
+    worker reads and parses itself, or chunks already cast by CastWorker; passes committed byte ranges, after failed
+    rows of their chunks, to process storing failed rows, which records them in checkpoint journal; on shutdown,
+    reports numbers of rows it has processed (per input file), inserted and skipped as conflicting through results
+    queue, which is also used to periodically send stats of the worker and, if needed for adaptive chunk sizing, timing
+    of each chunk"""
+
+    def __init__(self, task_queue: mp.Queue, unsuccessful_rows_queue: mp.Queue, results_queue: mp.Queue,
+                 db_client_factory: Callable[[], DbClient], parser: CsvParser, table_name: str,
+                 stats_interval_sec: float, send_chunk_timings: bool = False,
+                 acks_queue: Optional[mp.Queue] = None) -> None:
         super(ParsingWorker, self).__init__()
+        self.acks_queue = acks_queue
+        self.send_chunk_timings = send_chunk_timings
         self.table_name = table_name
-        self.importer = importer
+        self.stats_interval_sec = stats_interval_sec
+        self.db_client_factory = db_client_factory
+        self.parser = parser
         self.task_queue = task_queue
         self.unsuccessful_rows_queue = unsuccessful_rows_queue
+        self.results_queue = results_queue
         self.logger = get_logger()
 
     def run(self):
         self.logger.debug("{} | ParsingWorker starting!".format(self.name))
+        reset_stats()
+        stats, stats_sender = get_stats(), StatsSender(self.results_queue, self.stats_interval_sec)
+        importer = Importer(self.db_client_factory())  # DB engine and connections are created after fork
+        shm_reader = ShmReader(self.acks_queue) if self.acks_queue is not None else None
+        rows_per_file = Counter()  # type: Counter
         while True:
-            rows = self.task_queue.get()
-            if rows is None:
+            with stats.timed(STAGE_QUEUE_GET):
+                task = self.task_queue.get()  # type: Union[None, Task, CastChunk]
+            if task is None:
                 self.logger.debug("{} | ParsingWorker exiting!".format(self.name))  # Poison pill means shutdown
+                if shm_reader is not None:
+                    shm_reader.close()
+                importer.close()
+                self._queue_failed_chunks(importer)
+                self._queue_committed_chunks(importer)
+                stats_sender.send_result((dict(rows_per_file), importer.inserted_rows, importer.skipped_rows))
                 self.task_queue.task_done()
-                self.importer.close()
                 break
-            unsuccessful_rows = self.importer.parse_and_import(self.table_name, rows)
-            if unsuccessful_rows:
-                self.unsuccessful_rows_queue.put(unsuccessful_rows)
+            start, retry_round_trips = perf_counter(), importer.retry_round_trips
+            cast_rows, cast_seconds = None, 0.  # type: Optional[CastRows], float
+            if isinstance(task, CastChunk):
+                byte_range, rows, cast_rows, cast_seconds = task.byte_range, task.rows, task.cast_rows, task.seconds
+            else:
+                byte_range, rows = read_task_rows(self.parser, shm_reader, task)
+            rows_per_file[byte_range.file_path] += len(rows)
+            failed_rows = importer.import_chunk(self.table_name, rows, chunk_id=byte_range, cast_rows=cast_rows)
+            if self.send_chunk_timings:
+                stats_sender.send_chunk_timing(ChunkTiming(byte_range.file_path, byte_range.offset, byte_range.length,
+                                                           len(rows), perf_counter() - start + cast_seconds,
+                                                           importer.retry_round_trips - retry_round_trips))
+            if failed_rows:
+                batch = self._failed_rows_batch(byte_range, failed_rows)
+                with stats.timed(STAGE_QUEUE_PUT):
+                    self.unsuccessful_rows_queue.put(batch)
+            self._queue_failed_chunks(importer)
+            self._queue_committed_chunks(importer)
+            stats_sender.send()
             self.task_queue.task_done()
 
+    def _queue_failed_chunks(self, importer: Importer) -> None:
+        """Queues rows of earlier chunks which were lost because their transaction failed to commit"""
+        for byte_range, failed_rows in importer.pop_failed_chunks():
+            if byte_range is None:  # chunks are always imported with their byte range as id
+                continue
+            with get_stats().timed(STAGE_QUEUE_PUT):
+                self.unsuccessful_rows_queue.put(self._failed_rows_batch(byte_range, failed_rows))
+
+    def _queue_committed_chunks(self, importer: Importer) -> None:
+        """Queues byte ranges committed since last call to be journaled; they're queued after failed rows of their
+        chunks, so these are stored before ranges are journaled and skipped on resume"""
+        committed_ranges = importer.committed_chunks()
+        if committed_ranges:
+            with get_stats().timed(STAGE_QUEUE_PUT):
+                self.unsuccessful_rows_queue.put(CommittedRanges(committed_ranges, self.name))
+
+    def _failed_rows_batch(self, byte_range: ByteRange, failed_rows: List[FailedRow]) -> FailedRowsBatch:
+        """Encodes failed rows and finds their positions in input file here, so that single process storing them
+        only writes bytes"""
+        positions = self.parser.locate_rows(byte_range, [i for i, _, _ in failed_rows])
+        reasons = [(positions[n][0], positions[n][1], reason) if positions else (None, None, reason)
+                   for n, (_, reason, _) in enumerate(failed_rows)]  # type: List[FailureReason]
+        rows_bytes = encode_failed_rows(self.parser.input_file_config, [cells for _, _, cells in failed_rows])
+        return FailedRowsBatch(byte_range.file_path, rows_bytes, reasons)
+
+
+class CommittedRanges(Model):
+    """Byte ranges committed by writer process, passed to process storing failed rows to be journaled"""
+
+    def __init__(self, byte_ranges: List[ByteRange], worker_name: str) -> None:
+        self.byte_ranges = byte_ranges
+        self.worker_name = worker_name
+
 
 class UnsuccessfulRowsHandlingWorker(mp.Process):
-    def __init__(self, unsuccessful_rows_queue: mp.Queue, handler: FailRowHandler) -> None:
+    """Stores batches of failed rows of each input file with its handler, flushing handlers' buffers when there's
+    nothing to store and keeping files of at most MAX_OPEN_HANDLERS (least recently written to) handlers open; records
+    committed byte ranges in checkpoint journal as soon as they come, after flushing (and syncing) failed rows buffered
+    so far, as failed rows of their chunks are queued before them; on shutdown, reports numbers of failed rows per
+    input file and of errors on storing them through results queue"""
+
+    def __init__(self, unsuccessful_rows_queue: mp.Queue, results_queue: mp.Queue,
+                 handlers: Dict[str, FailRowHandler], journal: CheckpointJournal, stats_interval_sec: float) -> None:
         super(UnsuccessfulRowsHandlingWorker, self).__init__()
+        self.journal = journal
+        self.stats_interval_sec = stats_interval_sec
+        self.flush_interval_sec = min(h.flush_interval_sec for h in handlers.values()) if handlers \
+            else DEFAULT_FLUSH_INTERVAL_SEC
         self.unsuccessful_rows_queue = unsuccessful_rows_queue
-        self.handler = handler
+        self.results_queue = results_queue
+        self.handlers = handlers
         self.logger = get_logger()
+        self._open_handlers = OrderedDict()  # type: OrderedDict
+        self._write_errors = 0
 
     def run(self):
         self.logger.debug("{} | UnsuccessfulRowsHandlingWorker starting!".format(self.name))
+        reset_stats()
+        stats_sender = StatsSender(self.results_queue, self.stats_interval_sec)
+        failed_rows_per_file = Counter()  # type: Counter
         while True:
-            rows = self.unsuccessful_rows_queue.get()
-            if rows is None:
+            try:
+                batch = self.unsuccessful_rows_queue.get(timeout=self.flush_interval_sec)
+            except queue.Empty:
+                self._flush()
+                continue
+            if batch is None:
                 self.logger.debug(
                     "{} | UnsuccessfulRowsHandlingWorker exiting!".format(self.name))  # Poison pill means shutdown
+                self._close()
+                self.journal.close()
+                stats_sender.send_result((dict(failed_rows_per_file), self._write_errors))
                 self.unsuccessful_rows_queue.task_done()
                 break
-            self.handler.handle_failed_rows(rows)
+            if isinstance(batch, CommittedRanges):
+                self._flush()
+                self.journal.record(batch.byte_ranges, batch.worker_name)
+            else:
+                failed_rows_per_file[batch.file_path] += batch.rows_count()
+                self._write(batch)
+            stats_sender.send()
             self.unsuccessful_rows_queue.task_done()
+
+    def _write(self, batch: FailedRowsBatch) -> None:
+        handler = self.handlers[batch.file_path]
+        self._open_handlers.pop(batch.file_path, None)
+        self._open_handlers[batch.file_path] = handler  # most recently written to comes last
+        while len(self._open_handlers) > MAX_OPEN_HANDLERS:
+            _, least_recent_handler = self._open_handlers.popitem(last=False)
+            self._try(least_recent_handler.close_files, least_recent_handler)
+        try:
+            handler.write_batch(batch)
+        except Exception:
+            self._write_errors += 1  # rows are logged by handler
+
+    def _flush(self) -> None:
+        for handler in self._open_handlers.values():
+            self._try(handler.flush, handler)
+
+    def _close(self) -> None:
+        for handler in self.handlers.values():
+            self._try(handler.close, handler)
+        self._open_handlers.clear()
+
+    def _try(self, handler_method: Callable[[], None], handler: FailRowHandler) -> None:
+        """Calls method of handler, logging and counting error instead of raising it, so that import goes on (and
+        fails on its end)"""
+        try:
+            handler_method()
+        except Exception as e:
+            self.logger.error("Could not store failed rows in file {}: {}".format(handler.output_file_path, e))
+            self._write_errors += 1
@@ -1,13 +1,22 @@
+import glob
 import multiprocessing
+import os
 from argparse import Namespace
 from datetime import datetime
 from os import path
-from typing import Optional
+from typing import Optional, List, Set
 
 from todb.abstract import Model
+from todb.checkpoint import JOURNAL_FILE_SUFFIX
+from todb.db_client import ON_CONFLICT_FAIL, ON_CONFLICT_MODES
+from todb.fail_row_handler import FAILURE_REASONS_FILE_SUFFIX
+from todb.parsing import COMPRESSION_EXTENSIONS
+from todb.shm_transport import TRANSPORT_PICKLE, TRANSPORT_SHM, TRANSPORTS, shm_available
+from todb.stats import DEFAULT_REPORT_INTERVAL_SEC
 from todb.util import limit_or_default
 
 DEFAULT_CHUNK_SIZE_kB = 512
+CHUNK_SIZE_AUTO = "auto"
 MIN_CHUNK_SIZE_kB = 1
 MAX_CHUNK_SIZE_kB = 64000
 
@@ -15,49 +24,189 @@ MIN_PROCESSES = 1
 DEFAULT_PROCESSES = multiprocessing.cpu_count()
 MAX_PROCESSES = 128
 
+MIN_POOL_SIZE = 0
+DEFAULT_POOL_SIZE = 1
+MAX_POOL_SIZE = 64
+DEFAULT_POOL_RECYCLE_SEC = -1
+
+DEFAULT_COMMIT_EVERY_CHUNKS = 1
+MIN_COMMIT_EVERY_CHUNKS = 1
+MAX_COMMIT_EVERY_CHUNKS = 100000
+
+LOADER_INSERT = "insert"
+LOADER_COPY = "copy"
+LOADERS = [LOADER_INSERT, LOADER_COPY]
+
+ON_CONFLICT_DIALECTS = ["postgres", "sqlite"]
+
+_GLOB_CHARS_TO_UNDERSCORE = str.maketrans({c: "_" for c in "*?[]"})
+
+
+def generate_fail_file_name(input_path: str) -> str:
+    input_file_name = path.basename(input_path)
+    just_name, extension = path.splitext(input_file_name)
+    if extension.lower() in COMPRESSION_EXTENSIONS:
+        input_file_name = just_name  # failed rows are stored uncompressed
+    input_file_dir = path.dirname(input_path)
+    just_name, dot, extension = input_file_name.rpartition(".")
+    return path.join(input_file_dir, "{}_failed{}{}".format(just_name, dot, extension))
+
+
+def resolve_input_paths(input_path: str) -> List[str]:
+    """Returns sorted paths of files to import: given file, files in given directory or files matching given glob
+    pattern; failed rows files, their failure reasons files and checkpoint journals written by previous imports next
+    to input files are left out of the latter two"""
+    if path.isfile(input_path):
+        return [input_path]
+    elif path.isdir(input_path):
+        files = [path.join(input_path, f) for f in os.listdir(input_path)]
+    else:
+        files = glob.glob(input_path, recursive=True)
+    return _without_files_of_previous_imports([f for f in files if path.isfile(f)])
+
+
+def _without_files_of_previous_imports(files: List[str]) -> List[str]:
+    generated_files = set()  # type: Set[str]
+    for file_dir in {path.dirname(f) for f in files}:
+        failed_rows_files = [generate_fail_file_name(path.join(file_dir, f)) for f in os.listdir(file_dir or ".")]
+        generated_files.update(failed_rows_files)
+        generated_files.update(f + FAILURE_REASONS_FILE_SUFFIX for f in failed_rows_files)
+    return sorted(f for f in files if f not in generated_files and not f.endswith(JOURNAL_FILE_SUFFIX))
+
 
 class InputParams(Model):
     @classmethod
     def from_args(cls, args: Namespace):
         return InputParams(model_path=args.model, input_path=args.input, fail_output_path=args.failures,
                            sql_db=args.sql_db, cass_db=None, table_name=args.table, processes=args.proc,
-                           chunk_size_kB=args.chunk, ca_file=args.ca)
+                           cast_workers=args.cast_workers, writers=args.writers, transport=args.transport,
+                           chunk_size_kB=None if args.chunk == CHUNK_SIZE_AUTO else args.chunk,
+                           adaptive_chunk_size=args.chunk == CHUNK_SIZE_AUTO, ca_file=args.ca, loader=args.loader,
+                           parse_in_workers=args.parse_in_workers, columnar=args.columnar, pool_size=args.pool_size,
+                           pool_recycle_sec=args.pool_recycle, pool_pre_ping=args.pool_pre_ping,
+                           commit_every_chunks=args.commit_chunks, commit_every_sec=args.commit_interval,
+                           defer_indexes=args.defer_indexes, on_conflict=args.on_conflict, resume=args.resume,
+                           report_path=args.report, prometheus_path=args.prometheus_textfile,
+                           report_interval_sec=args.report_interval, verify_count=args.verify_count)
 
     def __init__(self, model_path: str, input_path: str, fail_output_path: Optional[str],
                  sql_db: str, cass_db: Optional[str], table_name: Optional[str] = None,
                  processes: Optional[int] = None, chunk_size_kB: Optional[int] = None,
-                 ca_file: Optional[str] = None) -> None:
+                 ca_file: Optional[str] = None, loader: Optional[str] = None,
+                 parse_in_workers: bool = False, pool_size: Optional[int] = None,
+                 pool_recycle_sec: Optional[int] = None, pool_pre_ping: bool = False,
+                 commit_every_chunks: Optional[int] = None, commit_every_sec: Optional[float] = None,
+                 defer_indexes: bool = False, on_conflict: Optional[str] = None, resume: bool = False,
+                 report_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                 report_interval_sec: Optional[float] = None, adaptive_chunk_size: bool = False,
+                 verify_count: bool = False, columnar: bool = False, cast_workers: Optional[int] = None,
+                 writers: Optional[int] = None, transport: Optional[str] = None) -> None:
+        if resume and table_name is None:
+            raise ValueError("Resuming import requires name of table it was importing into!")
         self.model_path = model_path
         self.input_path = input_path
+        self.input_paths = resolve_input_paths(input_path)
         self.sql_db = sql_db
         self.cass_db = cass_db
         self.ca_file = ca_file
-        self.fail_output_path = fail_output_path or self._generate_fail_file_name(self.input_path)
+        self.loader = loader or LOADER_INSERT
+        self.parse_in_workers = parse_in_workers
+        self.transport = transport or TRANSPORT_PICKLE
+        self.columnar = columnar
+        if self.is_multi_file():
+            self.fail_output_path = fail_output_path  # type: Optional[str]  # directory for failed rows files
+        else:
+            self.fail_output_path = fail_output_path or generate_fail_file_name(self.input_path)
         self.table_name = table_name or self._generate_table_name(datetime.utcnow())
         self.chunk_size_kB = limit_or_default(value=chunk_size_kB, default=DEFAULT_CHUNK_SIZE_kB,
                                               lower_bound=MIN_CHUNK_SIZE_kB, upper_bound=MAX_CHUNK_SIZE_kB)
+        self.adaptive_chunk_size = adaptive_chunk_size  # chunk_size_kB is then just the initial one
         self.processes = limit_or_default(value=processes, default=DEFAULT_PROCESSES,
                                           lower_bound=MIN_PROCESSES, upper_bound=MAX_PROCESSES)
+        self.pipelined = cast_workers is not None or writers is not None  # separate processes cast and insert rows
+        self.cast_workers = limit_or_default(value=cast_workers, default=self.processes,
+                                             lower_bound=MIN_PROCESSES, upper_bound=MAX_PROCESSES)
+        self.writers = limit_or_default(value=writers, default=self.processes,
+                                        lower_bound=MIN_PROCESSES, upper_bound=MAX_PROCESSES)
+        self.pool_size = limit_or_default(value=pool_size, default=DEFAULT_POOL_SIZE,
+                                          lower_bound=MIN_POOL_SIZE, upper_bound=MAX_POOL_SIZE)
+        self.pool_recycle_sec = pool_recycle_sec if pool_recycle_sec is not None else DEFAULT_POOL_RECYCLE_SEC
+        self.pool_pre_ping = pool_pre_ping
+        self.commit_every_sec = commit_every_sec
+        self.defer_indexes = defer_indexes
+        self.on_conflict = on_conflict or ON_CONFLICT_FAIL
+        self.resume = resume
+        self.verify_count = verify_count
+        self.report_path = report_path
+        self.prometheus_path = prometheus_path
+        self.report_interval_sec = report_interval_sec or DEFAULT_REPORT_INTERVAL_SEC
+        if commit_every_chunks is None and commit_every_sec is not None:
+            self.commit_every_chunks = None  # type: Optional[int]
+        else:
+            self.commit_every_chunks = limit_or_default(value=commit_every_chunks, default=DEFAULT_COMMIT_EVERY_CHUNKS,
+                                                        lower_bound=MIN_COMMIT_EVERY_CHUNKS,
+                                                        upper_bound=MAX_COMMIT_EVERY_CHUNKS)
         self.validate()
 
+    def is_multi_file(self) -> bool:
+        return len(self.input_paths) != 1 or self.input_paths[0] != self.input_path
+
+    def fail_output_path_for(self, input_file: str) -> str:
+        """Returns path of file rows of given input file that failed to import are stored into"""
+        if not self.is_multi_file():
+            return self.fail_output_path or generate_fail_file_name(input_file)
+        elif self.fail_output_path is not None:
+            return path.join(self.fail_output_path, path.basename(generate_fail_file_name(input_file)))
+        else:
+            return generate_fail_file_name(input_file)
+
+    def journal_path(self) -> str:
+        if not self.is_multi_file():
+            return self.fail_output_path_for(self.input_path) + JOURNAL_FILE_SUFFIX
+        journal_dir = self.fail_output_path or (self.input_path if path.isdir(self.input_path)
+                                                else path.dirname(self.input_paths[0]))
+        return path.join(journal_dir, self.table_name + JOURNAL_FILE_SUFFIX)
+
     def _generate_table_name(self, date_time: datetime) -> str:
-        return "{}_{}".format(path.basename(self.input_path)[:48],
+        input_name = path.basename(self.input_path.rstrip(os.sep)).translate(_GLOB_CHARS_TO_UNDERSCORE)
+        return "{}_{}".format(input_name[:48],
                               date_time.replace(microsecond=0).time().isoformat()).replace(":", "_").replace(".", "_")
 
     def validate(self):
-        self._validate_path_exists(self.input_path, "Input file path of {} is invalid")
+        if not self.input_paths:
+            raise ValueError("Input path of {} is invalid or does not match any file".format(self.input_path))
+        if self.is_multi_file() and self.fail_output_path is not None and not path.isdir(self.fail_output_path):
+            raise ValueError("Path for failed rows files {} must be a directory when importing many files".format(
+                self.fail_output_path))
         self._validate_path_exists(self.model_path, "Model file path of {} is invalid")
         if not self.sql_db and not self.cass_db:
             raise ValueError("Did not provide any DB credentials!")
         if self.ca_file is not None and not path.exists(self.ca_file):
             raise ValueError("CA file {} does not exist!".format(self.ca_file))
+        if self.commit_every_sec is not None and self.commit_every_sec <= 0:
+            raise ValueError("Commit interval must be positive, got {}".format(self.commit_every_sec))
+        if self.adaptive_chunk_size and self.resume:
+            raise ValueError("Resuming import requires the same fixed chunk size as the interrupted import used")
+        if self.report_interval_sec <= 0:
+            raise ValueError("Report interval must be positive, got {}".format(self.report_interval_sec))
+        if self.transport not in TRANSPORTS:
+            raise ValueError("Unknown transport {} (available transports: {})".format(self.transport, TRANSPORTS))
+        if self.transport == TRANSPORT_SHM and not shm_available():
+            raise ValueError("Transport {} requires Python 3.8 or newer".format(self.transport))
+        if self.loader not in LOADERS:
+            raise ValueError("Unknown loader {} (available loaders: {})".format(self.loader, LOADERS))
+        if self.loader == LOADER_COPY and not self.sql_db.startswith("postgres"):
+            raise ValueError("Loader {} is supported only for PostgreSQL databases!".format(self.loader))
+        if self.on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError("Unknown conflict handling {} (available: {})".format(self.on_conflict, ON_CONFLICT_MODES))
+        if self.on_conflict != ON_CONFLICT_FAIL:
+            if self.loader == LOADER_COPY:
+                raise ValueError("Conflict handling {} can not be used with loader {}".format(self.on_conflict,
+                                                                                             self.loader))
+            if not any(self.sql_db.startswith(dialect) for dialect in ON_CONFLICT_DIALECTS):
+                raise ValueError("Conflict handling {} is supported only for {} databases!".format(
+                    self.on_conflict, ON_CONFLICT_DIALECTS))
 
     def _validate_path_exists(self, the_path: str, err_msg_fmt: str) -> None:
         if the_path is None or not path.exists(path.abspath(the_path)):
             raise ValueError(err_msg_fmt.format(the_path))
-
-    def _generate_fail_file_name(self, input_path: str):
-        input_file_name = path.basename(input_path)
-        input_file_dir = path.dirname(input_path)
-        just_name, dot, extension = input_file_name.rpartition(".")
-        return path.join(input_file_dir, "{}_failed{}{}".format(just_name, dot, extension))
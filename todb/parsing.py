@@ -1,36 +1,339 @@
-from typing import Iterator, List
+import bz2
+import csv
+import gzip
+import lzma
+import mmap
+import queue
+import re
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+from io import StringIO
+from os import path
+from threading import Thread, Event
+from typing import Iterator, List, Optional, Tuple, Callable, Union, Any, Dict
 
+from todb.abstract import Model
+from todb.chunk import Chunk, Rows
 from todb.data_model import InputFileConfig
 from todb.logger import get_logger
+from todb.stats import get_stats, STAGE_READ, STAGE_PARSE
+
+QUOTED_ROW_DELIMITERS = ["\n", "\r\n"]
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_BZ2 = "bz2"
+COMPRESSION_XZ = "xz"
+_COMPRESSION_MAGIC_BYTES = [
+    (b"\x1f\x8b", COMPRESSION_GZIP),
+    (b"BZh", COMPRESSION_BZ2),
+    (b"\xfd7zXZ\x00", COMPRESSION_XZ)
+]
+COMPRESSION_EXTENSIONS = {".gz": COMPRESSION_GZIP, ".bz2": COMPRESSION_BZ2, ".xz": COMPRESSION_XZ}
+_COMPRESSION_OPENERS = {
+    COMPRESSION_GZIP: gzip.open,
+    COMPRESSION_BZ2: bz2.open,
+    COMPRESSION_XZ: lzma.open
+}  # type: Dict[str, Callable[..., Any]]
+DECOMPRESSED_BLOCK_SIZE = 256 * 1024
+DECOMPRESSED_BLOCKS_QUEUE_SIZE = 16
+LINE_COUNTING_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class ByteRange(Model):
+    """Part of input file consisting of complete rows"""
+
+    def __init__(self, file_path: str, offset: int, length: int) -> None:
+        self.file_path = file_path
+        self.offset = offset
+        self.length = length
+
+
+def detect_compression(file_path: str) -> Optional[str]:
+    """Returns compression of given file recognized by its first bytes or, if it's empty, by its extension"""
+    with open(file_path, "rb") as input_file:
+        first_bytes = input_file.read(6)
+    for magic_bytes, compression in _COMPRESSION_MAGIC_BYTES:
+        if first_bytes.startswith(magic_bytes):
+            return compression
+    if not first_bytes:
+        return COMPRESSION_EXTENSIONS.get(path.splitext(file_path)[1].lower())
+    return None
+
+
+def read_decompressed_blocks(file_path: str, compression: str,
+                             block_size: int = DECOMPRESSED_BLOCK_SIZE) -> Iterator[bytes]:
+    """Yields blocks of decompressed file content; decompression runs in separate thread (zlib, bz2 and lzma
+    release GIL while decompressing), so it overlaps with processing of already yielded blocks"""
+    blocks = queue.Queue(maxsize=DECOMPRESSED_BLOCKS_QUEUE_SIZE)  # type: queue.Queue
+    stopped = Event()
+
+    def put(item: Union[bytes, Exception]) -> None:
+        while not stopped.is_set():
+            try:
+                return blocks.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+
+    def decompress() -> None:
+        try:
+            with _COMPRESSION_OPENERS[compression](file_path, "rb") as compressed_file:
+                block = compressed_file.read(block_size)
+                while block and not stopped.is_set():
+                    put(block)
+                    block = compressed_file.read(block_size)
+            put(b"")
+        except Exception as e:
+            put(e)
+
+    decompressing_thread = Thread(target=decompress, name="decompress-{}".format(path.basename(file_path)),
+                                  daemon=True)
+    decompressing_thread.start()
+    stats = get_stats()
+    try:
+        while True:
+            with stats.timed(STAGE_READ):
+                item = blocks.get()
+            if isinstance(item, Exception):
+                raise item
+            elif not item:
+                return
+            yield item
+    finally:
+        stopped.set()  # lets decompressing thread finish if reading was stopped early
+
+
+def count_occurrences(data: Union[bytes, bytearray, mmap.mmap], sub: bytes, start: int, end: int) -> int:
+    """Counts sub between start and end offsets of data without copying that part of it"""
+    if isinstance(data, mmap.mmap):  # mmap has no count(); matching it with regex reads mapped bytes in place
+        return len(re.compile(re.escape(sub)).findall(data, start, end))
+    return data.count(sub, start, end)
+
+
+def count_quotes(data: Union[bytes, bytearray, mmap.mmap], quote_char: bytes, escape_char: Optional[bytes],
+                 start: int, end: int) -> int:
+    quotes = count_occurrences(data, quote_char, start, end)
+    if escape_char is not None and escape_char != quote_char:
+        quotes -= count_occurrences(data, escape_char + quote_char, start, end)
+    return quotes
 
 
 class CsvParser(object):
-    def __init__(self, input_file_config: InputFileConfig, chunk_size_kB: int) -> None:
-        self.chunk_size_kB = chunk_size_kB
+    def __init__(self, input_file_config: InputFileConfig, chunk_size_kB: float,
+                 max_cells: Optional[int] = None) -> None:
+        self.chunk_size_kB = chunk_size_kB  # may be changed while reading; next chunk is cut with new size
         self.input_file_config = input_file_config
+        self.max_cells = max_cells  # cells of unquoted rows are split only up to it; the rest stays in the last one
         self.logger = get_logger()
+        self._line_checkpoints = {}  # type: Dict[str, List[Tuple[int, int]]]
+        self._compressions = {}  # type: Dict[str, Optional[str]]
+        if input_file_config.quote_char() is not None and \
+                input_file_config.row_delimiter() not in QUOTED_ROW_DELIMITERS:
+            raise ValueError("Parsing quoted cells supports only row delimiters: {}".format(QUOTED_ROW_DELIMITERS))
+
+    def read_rows_in_chunks(self, file_path: str) -> Iterator[Rows]:
+        """Yields rows in chunks of approximately chunk size, decoding each chunk directly from memory-mapped file"""
+        for _, rows in self.read_ranges_with_rows(file_path):
+            yield rows
+
+    def read_ranges_with_rows(self, file_path: str, skip_range: Optional[Callable[[ByteRange], bool]] = None
+                              ) -> Iterator[Tuple[ByteRange, Rows]]:
+        """Yields chunks of rows together with byte ranges they were read from; ranges for which skip_range returns
+        True are not decoded nor yielded; ranges of compressed file are ranges of its decompressed content"""
+        for byte_range, rows_bytes in self.read_ranges_with_bytes(file_path, skip_range):
+            try:
+                rows = self.bytes_to_rows(rows_bytes)
+            except Exception as e:
+                self.logger.error("Error on parsing CSV: {}".format(e))
+                rows = []
+            yield byte_range, rows
 
-    def read_rows_in_chunks(self, file_path: str) -> Iterator[List[List[str]]]:
-        buffer_size_bytes = round(self.chunk_size_kB * 1000, ndigits=None)
-        cached_last_line = ""
-        has_header_row = self.input_file_config.has_header_row()
-        with open(file_path, "rb") as input_file:
-            while True:
-                data = input_file.read(buffer_size_bytes)
-                if not data:
+    def read_ranges_with_bytes(self, file_path: str, skip_range: Optional[Callable[[ByteRange], bool]] = None
+                               ) -> Iterator[Tuple[ByteRange, Union[bytearray, memoryview]]]:
+        """Same as read_ranges_with_rows, but yields (decompressed) bytes of chunks instead of rows; bytes of
+        uncompressed file are view of memory-mapped file, valid only until next chunk is read"""
+        compression = self._compression(file_path)
+        if compression is not None:
+            yield from self._read_compressed_ranges_with_bytes(file_path, compression, skip_range)
+            return
+        with self._mapped_file(file_path) as mm:
+            if mm is None:
+                return
+            for byte_range in self._iter_byte_ranges(mm, file_path):
+                if skip_range is not None and skip_range(byte_range):
+                    continue
+                with memoryview(mm)[byte_range.offset:byte_range.offset + byte_range.length] as range_view:
+                    yield byte_range, range_view
+                self._release_pages(mm, byte_range)
+
+    def is_compressed(self, file_path: str) -> bool:
+        return self._compression(file_path) is not None
+
+    def read_byte_ranges(self, file_path: str) -> Iterator[ByteRange]:
+        """Yields ranges of complete rows of approximately chunk size, skipping header row; does not decode the file,
+        which can not be compressed"""
+        if self.is_compressed(file_path):
+            raise ValueError("Can not read byte ranges of compressed file {}".format(file_path))
+        with self._mapped_file(file_path) as mm:
+            if mm is not None:
+                yield from self._iter_byte_ranges(mm, file_path)
+
+    def read_rows_in_range(self, byte_range: ByteRange) -> Rows:
+        """Reads (with mmap), decodes and splits rows from given range of a file"""
+        with self._mapped_file(byte_range.file_path) as mm:
+            return self._read_rows_from_mapped_file(mm, byte_range) if mm is not None else []
+
+    def locate_rows(self, byte_range: ByteRange, row_indexes: List[int]) -> List[Tuple[int, int]]:
+        """Returns (line number, byte offset) in input file of rows of given indexes within rows read from given range;
+        positions can not be found for compressed file, so empty list is returned for it"""
+        if not row_indexes or self.is_compressed(byte_range.file_path):
+            return []
+        with self._mapped_file(byte_range.file_path) as mm:
+            if mm is None:
+                return []
+            row_offsets = self._row_offsets(mm, byte_range, max(row_indexes))
+            offsets = [row_offsets[min(i, len(row_offsets) - 1)] for i in row_indexes]
+            return [(self._line_number(mm, byte_range.file_path, offset), offset) for offset in offsets]
+
+    def _compression(self, file_path: str) -> Optional[str]:
+        """Returns compression of given file, detected once per file (e.g. not on each batch of failed rows)"""
+        if file_path not in self._compressions:
+            self._compressions[file_path] = detect_compression(file_path)
+        return self._compressions[file_path]
+
+    def _row_offsets(self, mm: mmap.mmap, byte_range: ByteRange, last_row_index: int) -> List[int]:
+        """Returns offsets of rows of given range, up to given row; empty rows are skipped, same as when parsing
+        quoted cells"""
+        delimiter = self._encoded(self.input_file_config.row_delimiter())
+        skip_empty_rows = self.input_file_config.quote_char() is not None
+        range_end = byte_range.offset + byte_range.length
+        offsets, position = [], byte_range.offset  # type: List[int], int
+        while position < range_end and len(offsets) <= last_row_index:
+            row_end = self._find_row_end(mm, position, position, delimiter)
+            row_end = range_end if row_end < 0 or row_end > range_end else row_end
+            if row_end > position or not skip_empty_rows:
+                offsets.append(position)
+            position = row_end + len(delimiter)
+        return offsets or [byte_range.offset]
+
+    def _line_number(self, mm: mmap.mmap, file_path: str, offset: int) -> int:
+        """Returns 1-based number of line starting at given offset; counts newlines from the nearest offset line
+        number of which is already known, so locating rows of subsequent chunks does not scan the file again"""
+        checkpoints = self._line_checkpoints.setdefault(file_path, [(0, 1)])
+        known_offset, line = checkpoints[bisect_right(checkpoints, (offset, float("inf"))) - 1]
+        newline = self._encoded("\n")
+        for block_start in range(known_offset, offset, LINE_COUNTING_BLOCK_SIZE):
+            line += bytes(mm[block_start:min(block_start + LINE_COUNTING_BLOCK_SIZE, offset)]).count(newline)
+        if known_offset != offset:
+            insort(checkpoints, (offset, line))
+        return line
+
+    @contextmanager
+    def _mapped_file(self, file_path: str) -> Iterator[Optional[mmap.mmap]]:
+        if path.getsize(file_path) == 0:
+            yield None  # empty file can not be memory-mapped
+        else:
+            with open(file_path, "rb") as input_file, \
+                    mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+
+    def _read_compressed_ranges_with_bytes(self, file_path: str, compression: str,
+                                           skip_range: Optional[Callable[[ByteRange], bool]]
+                                           ) -> Iterator[Tuple[ByteRange, bytearray]]:
+        delimiter = self._encoded(self.input_file_config.row_delimiter())
+        skip_header = self.input_file_config.has_header_row()
+        buffer, offset = bytearray(), 0
+        for block in read_decompressed_blocks(file_path, compression, DECOMPRESSED_BLOCK_SIZE):
+            buffer += block
+            if skip_header:
+                header_end = self._find_row_end(buffer, 0, 0, delimiter)
+                if header_end < 0:
+                    continue
+                offset = header_end + len(delimiter)
+                del buffer[:offset]
+                skip_header = False
+            while len(buffer) >= self._chunk_size_bytes():
+                row_end = self._find_row_end(buffer, 0, self._chunk_size_bytes(), delimiter)
+                if row_end < 0:
                     break
-                try:
-                    one_line = cached_last_line + data.decode(self.input_file_config.file_encoding())
-                    rows = one_line.split(self.input_file_config.row_delimiter())
-                    cached_last_line = rows.pop(-1)  # last line may not be complete up to row delimiter!
-                    if has_header_row:
-                        rows.pop(0)  # remove first row as header and don't remove it again
-                        has_header_row = False
-                    cells_in_rows = [r.split(self.input_file_config.cell_delimiter()) for r in rows]
-                    yield cells_in_rows
-                except Exception as e:
-                    self.logger.error("Error on parsing CSV: {}".format(e))
-                    cached_last_line = ""
-                    yield []
-            # don't forget last cached line
-            yield [cached_last_line.split(self.input_file_config.cell_delimiter())] if cached_last_line else []
+                end = row_end + len(delimiter)
+                byte_range = ByteRange(file_path, offset, end)
+                if skip_range is None or not skip_range(byte_range):
+                    yield byte_range, buffer[:end]
+                del buffer[:end]
+                offset += end
+        if buffer and not skip_header:
+            byte_range = ByteRange(file_path, offset, len(buffer))
+            if skip_range is None or not skip_range(byte_range):
+                yield byte_range, buffer
+
+    def _iter_byte_ranges(self, mm: mmap.mmap, file_path: str) -> Iterator[ByteRange]:
+        delimiter = self._encoded(self.input_file_config.row_delimiter())
+        file_size = len(mm)
+        start = 0
+        if self.input_file_config.has_header_row():
+            header_end = self._find_row_end(mm, start, start, delimiter)
+            start = file_size if header_end < 0 else header_end + len(delimiter)
+        stats = get_stats()
+        while start < file_size:
+            with stats.timed(STAGE_READ):
+                row_end = self._find_row_end(mm, start, start + self._chunk_size_bytes(), delimiter)
+            end = file_size if row_end < 0 else row_end + len(delimiter)
+            yield ByteRange(file_path, start, end - start)
+            start = end
+
+    def _chunk_size_bytes(self) -> int:
+        return max(round(self.chunk_size_kB * 1000, ndigits=None), 1)
+
+    def _read_rows_from_mapped_file(self, mm: mmap.mmap, byte_range: ByteRange) -> Rows:
+        if byte_range.length <= 0:
+            return []
+        with memoryview(mm) as file_view, file_view[byte_range.offset:byte_range.offset + byte_range.length] as view:
+            rows = self.bytes_to_rows(view)  # views are released even if decoding fails, so mmap can be closed
+        self._release_pages(mm, byte_range)
+        return rows
+
+    def bytes_to_rows(self, rows_bytes: Union[bytes, bytearray, memoryview]) -> Rows:
+        """Decodes and splits rows (or, without quoted cells, wraps them in Chunk splitting them on access); for
+        memory-mapped file, this is also when it's actually read from disk"""
+        with get_stats().timed(STAGE_PARSE):
+            text = str(rows_bytes, self.input_file_config.file_encoding())
+            row_delimiter = self.input_file_config.row_delimiter()
+            if text.endswith(row_delimiter):
+                text = text[:-len(row_delimiter)]
+            return self._split_rows(text) if text else []
+
+    def _release_pages(self, mm: mmap.mmap, byte_range: ByteRange) -> None:
+        """Advises kernel that pages of already decoded range are not needed, keeping RSS flat on large files"""
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+            first_page_offset = byte_range.offset - byte_range.offset % mmap.PAGESIZE
+            mm.madvise(mmap.MADV_DONTNEED, first_page_offset, byte_range.offset + byte_range.length - first_page_offset)
+
+    def _find_row_end(self, mm: Union[mmap.mmap, bytearray], start: int, position: int, delimiter: bytes) -> int:
+        """Returns position of first row delimiter at or after given position which is not inside of a quoted cell"""
+        quote_char = self.input_file_config.quote_char()
+        if quote_char is None or position >= len(mm):
+            return mm.find(delimiter, position)
+        quote, escape_char = self._encoded(quote_char), self.input_file_config.escape_char()
+        escape = self._encoded(escape_char) if escape_char is not None else None
+        quotes = count_quotes(mm, quote, escape, start, position)
+        row_end = mm.find(delimiter, position)
+        while row_end >= 0:
+            quotes += count_quotes(mm, quote, escape, position, row_end)
+            if quotes % 2 == 0:
+                return row_end
+            position = row_end
+            row_end = mm.find(delimiter, row_end + len(delimiter))
+        return -1
+
+    def _encoded(self, text: str) -> bytes:
+        return text.encode(self.input_file_config.file_encoding())
+
+    def _split_rows(self, rows_text: str) -> Rows:
+        if self.input_file_config.quote_char() is None:
+            return Chunk(rows_text, self.input_file_config.row_delimiter(), self.input_file_config.cell_delimiter(),
+                         self.max_cells)
+        else:
+            reader = csv.reader(StringIO(rows_text, newline=""), delimiter=self.input_file_config.cell_delimiter(),
+                                quotechar=self.input_file_config.quote_char(),
+                                escapechar=self.input_file_config.escape_char(), strict=False)
+            return [cells for cells in reader if cells]
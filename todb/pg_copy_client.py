@@ -0,0 +1,58 @@
+from datetime import datetime, date, time
+from io import StringIO
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy.engine import Connection
+
+from todb.sql_client import SqlClient
+
+COPY_NULL = "\\N"
+COPY_CELL_DELIMITER = "\t"
+COPY_ROW_DELIMITER = "\n"
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def to_copy_value(value: Optional[Any]) -> str:
+    if value is None:
+        return COPY_NULL
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    elif isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    elif isinstance(value, float):
+        return repr(value)
+    else:
+        return str(value)
+
+
+def to_copy_text(list_of_model_dicts: List[Dict[str, Any]], column_names: List[str]) -> str:
+    """Serializes entities into PostgreSQL COPY text format, with columns in given order"""
+    lines = [COPY_CELL_DELIMITER.join([to_copy_value(entity[c]) for c in column_names])
+             for entity in list_of_model_dicts]
+    lines.append("")
+    return COPY_ROW_DELIMITER.join(lines)
+
+
+class PgCopyClient(SqlClient):
+    """SqlClient loading batches with PostgreSQL's COPY ... FROM STDIN; single rows are still INSERTed"""
+
+    def _bulk_insert_entities(self, list_of_model_dicts: List[Dict[str, Any]], table_name: str) -> Connection:
+        db_connection = self._get_connection()
+        table = self._get_table(table_name)
+        if table is None:
+            raise Exception("There's not table named {} in {}".format(table_name, self.db_url))
+        column_names = list(list_of_model_dicts[0].keys())
+        preparer = self._get_db_engine().dialect.identifier_preparer
+        copy_sql = "COPY {} ({}) FROM STDIN".format(preparer.format_table(table),
+                                                     ", ".join([preparer.quote(c) for c in column_names]))
+        copy_buffer = StringIO(to_copy_text(list_of_model_dicts, column_names))
+        with self._savepoint(db_connection):
+            cursor = db_connection.connection.cursor()
+            try:
+                cursor.copy_expert(copy_sql, copy_buffer)
+            finally:
+                cursor.close()
+        self._count_written_rows(len(list_of_model_dicts), len(list_of_model_dicts))  # COPY loads all rows or none
+        return db_connection
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Union, Set
+
+from todb.abstract import Model
+from todb.logger import get_logger
+from todb.parsing import ByteRange
+from todb.stats import get_stats, STAGE_SHM_WAIT, COUNTER_SHM_BYTES, COUNTER_INLINE_BYTES, MAXIMUM_SHM_USED_BYTES
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None  # type: ignore
+
+TRANSPORT_PICKLE = "pickle"
+TRANSPORT_SHM = "shm"
+TRANSPORTS = [TRANSPORT_PICKLE, TRANSPORT_SHM]
+
+MIN_RING_CAPACITY_BYTES = 1024 * 1024
+
+
+def shm_available() -> bool:
+    return shared_memory is not None
+
+
+class ShmChunk(Model):
+    """Raw bytes of a chunk of input file passed to worker process: location of them in shared memory segment or,
+    if they did not fit in it, the bytes themselves"""
+
+    def __init__(self, byte_range: ByteRange, segment_name: Optional[str], offset: int, length: int,
+                 inline_bytes: Optional[bytes] = None) -> None:
+        self.byte_range = byte_range
+        self.segment_name = segment_name
+        self.offset = offset
+        self.length = length
+        self.inline_bytes = inline_bytes
+
+
+class ShmRingBuffer(object):
+    """Shared memory segment which producer process places chunks in one after another, wrapping around to its
+    beginning; space of a chunk is reclaimed once worker acknowledges (through acks queue) it has read the chunk, in
+    any order; chunks larger than the segment are passed inline"""
+
+    def __init__(self, capacity_bytes: int, acks_queue: Any) -> None:
+        if shared_memory is None:
+            raise ValueError("Shared memory transport requires Python 3.8 or newer")
+        self.capacity_bytes = max(capacity_bytes, MIN_RING_CAPACITY_BYTES)
+        self.acks_queue = acks_queue
+        self.logger = get_logger()
+        self.stats = get_stats()
+        self._segment = shared_memory.SharedMemory(create=True, size=self.capacity_bytes)  # type: Any
+        self._head = 0
+        self._used_bytes = 0
+        self._unacknowledged = OrderedDict()  # type: OrderedDict[int, int]  # offset -> length, in order of placing
+        self._acknowledged = set()  # type: Set[int]
+
+    @property
+    def segment_name(self) -> str:
+        return self._segment.name
+
+    def put(self, byte_range: ByteRange, data: Union[bytes, bytearray, memoryview]) -> ShmChunk:
+        """Copies data into the segment, waiting for acknowledgements until there is enough space for it"""
+        length = len(data)
+        if length > self.capacity_bytes:
+            self.logger.debug("Chunk of {} bytes does not fit in shared memory segment of {} bytes; passing it inline"
+                              .format(length, self.capacity_bytes))
+            self.stats.increment(COUNTER_INLINE_BYTES, length)
+            return ShmChunk(byte_range, None, 0, length, inline_bytes=bytes(data))
+        offset = self._free_offset(length)
+        if offset is None:
+            with self.stats.timed(STAGE_SHM_WAIT):
+                while offset is None:
+                    self._acknowledge(self.acks_queue.get())
+                    offset = self._free_offset(length)
+        self._segment.buf[offset:offset + length] = data
+        self._unacknowledged[offset] = length
+        self._head = offset + length
+        self._used_bytes += length
+        self.stats.increment(COUNTER_SHM_BYTES, length)
+        self.stats.record_max(MAXIMUM_SHM_USED_BYTES, self._used_bytes)
+        return ShmChunk(byte_range, self.segment_name, offset, length)
+
+    def close(self) -> None:
+        self._segment.close()
+        self._segment.unlink()
+
+    def _free_offset(self, length: int) -> Optional[int]:
+        """Returns offset of free space for given number of bytes right after the last placed chunk or, if there is
+        not enough of it before end of segment, at its beginning"""
+        while not self.acks_queue.empty():
+            self._acknowledge(self.acks_queue.get())
+        if not self._unacknowledged:
+            self._head = 0
+            return 0
+        tail = next(iter(self._unacknowledged))  # offset of the oldest chunk not acknowledged yet
+        if self._head > tail:
+            if self.capacity_bytes - self._head >= length:
+                return self._head
+            return 0 if tail >= length else None
+        return self._head if tail - self._head >= length else None
+
+    def _acknowledge(self, offset: int) -> None:
+        self._acknowledged.add(offset)
+        while self._unacknowledged and next(iter(self._unacknowledged)) in self._acknowledged:
+            oldest_offset, length = self._unacknowledged.popitem(last=False)
+            self._acknowledged.remove(oldest_offset)
+            self._used_bytes -= length
+
+
+class ShmReader(object):
+    """Reads chunks placed in shared memory by ShmRingBuffer of producer process and acknowledges them"""
+
+    def __init__(self, acks_queue: Any) -> None:
+        self.acks_queue = acks_queue
+        self._segments = {}  # type: Dict[str, Any]
+
+    @contextmanager
+    def chunk_bytes(self, chunk: ShmChunk) -> Iterator[Union[bytes, memoryview]]:
+        """Yields view of bytes of the chunk, which must not be used afterwards: space of the chunk is then
+        acknowledged to be free"""
+        if chunk.segment_name is None:
+            yield chunk.inline_bytes or b""
+            return
+        segment = self._segments.get(chunk.segment_name)  # type: Any
+        if segment is None:
+            segment = self._segments[chunk.segment_name] = shared_memory.SharedMemory(name=chunk.segment_name)
+        try:
+            with segment.buf[chunk.offset:chunk.offset + chunk.length] as chunk_view:
+                yield chunk_view
+        finally:
+            self.acks_queue.put(chunk.offset)
+
+    def close(self) -> None:
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
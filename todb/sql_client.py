@@ -1,39 +1,151 @@
-from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Set, Iterable
 
-from sqlalchemy import MetaData, Column, Table, select, func, Integer
-from sqlalchemy.engine import Engine, create_engine, Connection
-from sqlalchemy.pool import NullPool
+from sqlalchemy import MetaData, Column, Table, select, func, Integer, event, UniqueConstraint, SmallInteger, \
+    BigInteger, Index, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine, create_engine, Connection, Transaction
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Insert
+from sqlalchemy.pool import NullPool, QueuePool
 
-from todb.data_model import ConfColumn, PrimaryKeyConf, PKEY_AUTOINC
-from todb.db_client import DbClient
+from todb.data_model import ConfColumn, PrimaryKeyConf, PKEY_AUTOINC, PKEY_UUID, GENERATED_PKEY_COLUMN
+from todb.db_client import DbClient, RowWithEntity, ON_CONFLICT_FAIL, ON_CONFLICT_SKIP, ON_CONFLICT_UPDATE
 from todb.entity_builder import EntityBuilder
 from todb.logger import get_logger
+from todb.util import seconds_between
 
 INSERT_ONE_BY_ONE_THRESHOLD = 8
+UUID_LENGTH = 36
+SQLITE_UPSERT_MIN_VERSION = (3, 24, 0)
+PARALLEL_INDEX_DIALECTS = ["postgresql"]
+LENGTH_ENFORCING_DIALECTS = ["postgresql", "mysql"]  # SQLite stores strings of any length in VARCHAR columns
+DUPLICATES_REPORT_LIMIT = 10
+
+
+def enable_sqlite_savepoints(engine: Engine) -> None:
+    """Makes pysqlite driver leave transaction handling to sqlalchemy, so that SAVEPOINTs work as expected; see
+    https://docs.sqlalchemy.org/en/13/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl"""
+
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(connection):
+        connection.execute("BEGIN")
+
+
+class SqliteUpsert(Insert):
+    """INSERT statement with SQLite (3.24+) upsert clause: rows conflicting on given columns update given ones (or,
+    with no columns to update, are skipped, as are rows conflicting on any unique key if no conflict target is given);
+    unlike INSERT OR REPLACE / IGNORE, existing rows are updated in place and other constraint violations still fail"""
+
+    def __init__(self, table: Table, conflict_target: Optional[Tuple[str, ...]] = None,
+                 updated_columns: Optional[List[str]] = None) -> None:
+        super(SqliteUpsert, self).__init__(table)
+        self.conflict_target = conflict_target
+        self.updated_columns = updated_columns or []
+
+
+@compiles(SqliteUpsert, "sqlite")
+def compile_sqlite_upsert(upsert: SqliteUpsert, compiler: Any, **kwargs: Any) -> str:
+    quote = compiler.preparer.quote
+    target = " ({})".format(", ".join(map(quote, upsert.conflict_target))) if upsert.conflict_target else ""
+    if not upsert.updated_columns:
+        action = "NOTHING"
+    else:
+        action = "UPDATE SET " + ", ".join("{0} = excluded.{0}".format(quote(c)) for c in upsert.updated_columns)
+    return "{} ON CONFLICT{} DO {}".format(compiler.visit_insert(upsert, **kwargs), target, action)
 
 
 class SqlClient(DbClient):
     def __init__(self, db_url: str, entity_builder: EntityBuilder, db_engine: Optional[Engine] = None,
-                 ca_file: Optional[str] = None) -> None:
+                 ca_file: Optional[str] = None, pool_size: int = 0, pool_recycle_sec: int = -1,
+                 pool_pre_ping: bool = False, commit_every_chunks: Optional[int] = 1,
+                 commit_every_sec: Optional[float] = None, on_conflict: str = ON_CONFLICT_FAIL) -> None:
+        """Engine is created lazily on first use, so client can be created before forking a process using it;
+        pool_size of 0 means no connection pooling; transaction is committed after given number of chunks or seconds,
+        whichever comes first, while each insert within it is wrapped in SAVEPOINT; on_conflict tells whether rows
+        with already existing keys fail, are skipped or update existing ones (PostgreSQL and SQLite only)"""
         self.db_url = db_url
+        self.on_conflict = on_conflict
+        self.commit_every_chunks = commit_every_chunks
+        self.commit_every_sec = commit_every_sec
         self.ca_file = ca_file
+        self.pool_size = pool_size
+        self.pool_recycle_sec = pool_recycle_sec
+        self.pool_pre_ping = pool_pre_ping
         self.entity_builder = entity_builder
         self._db_engine = db_engine
+        self._owns_db_engine = db_engine is None
         self.logger = get_logger()
         self._conn = None  # type: Optional[Connection]
+        self._tables = {}  # type: Dict[str, Table]
+        self.reflection_count = 0
+        self._transaction = None  # type: Optional[Transaction]
+        self._transaction_start = None  # type: Optional[datetime]
+        self._chunks_in_transaction = 0
+        self._uncommitted_chunk_ids = []  # type: List[Any]
+        self._committed_chunk_ids = []  # type: List[Any]
+        self.inserted_count = 0
+        self.skipped_count = 0
+        self._uncommitted_inserted_count = 0
+        self._uncommitted_skipped_count = 0
 
-    def init_table(self, name: str, columns: List[ConfColumn], pkey: PrimaryKeyConf) -> None:
+    def init_table(self, name: str, columns: List[ConfColumn], pkey: PrimaryKeyConf,
+                   defer_indexes: bool = False) -> bool:
+        self.commit()
         meta = MetaData()
         table = self._get_table(name)
         if table is None:
-            self.logger.info("Creating table named {}...".format(name))
-            table = self._sql_table_from_columns(meta, name, columns, pkey)
+            self.logger.info("Creating table named {}{}...".format(name, " without indexes" if defer_indexes else ""))
+            table = self._sql_table_from_columns(meta, name, columns, pkey, with_indexes=not defer_indexes)
             meta.create_all(self._get_db_engine(), tables=[table])
+            self._invalidate_table(name)
+            return True
+        return False
+
+    def create_deferred_indexes(self, table_name: str, columns: List[ConfColumn],
+                                parallelism: int = 1) -> Dict[str, int]:
+        """Creates indexes and unique constraints (as unique indexes) skipped by init_table with defer_indexes;
+        unique indexes are named uq_ (table, column) and others ix_; unique index is not created on column with
+        duplicated values; returns number of such values per column"""
+        self.commit()
+        table = self._get_table(table_name)
+        if table is None:
+            raise Exception("There's not table named {} in {}".format(table_name, self.db_url))
+        duplicates = {}  # type: Dict[str, int]
+        indexes = []
+        for c in columns:
+            if c.unique:
+                duplicates[c.name] = self._report_duplicates(table, c.name)
+            unique = c.unique and duplicates[c.name] == 0
+            if unique or c.indexed:
+                index_name = "{}_{}_{}".format("uq" if unique else "ix", table_name, c.name)
+                indexes.append(Index(index_name, table.c[c.name], unique=unique))
+        engine = self._get_db_engine()
+        start_time = datetime.utcnow()
+        if engine.dialect.name in PARALLEL_INDEX_DIALECTS and parallelism > 1 and len(indexes) > 1:
+            with ThreadPoolExecutor(max_workers=min(parallelism, len(indexes))) as executor:
+                list(executor.map(lambda index: index.create(bind=engine), indexes))
+        else:
+            for index in indexes:
+                index.create(bind=engine)
+        self.logger.info("Created {} deferred index(es) on table {} in {:.2f}s".format(len(indexes), table_name,
+                                                                                      seconds_between(start_time)))
+        self._invalidate_table(table_name)
+        return {column: count for column, count in duplicates.items() if count > 0}
 
     def drop_table(self, name: str) -> None:
+        self.commit()
         the_table = self._get_table(name)
         if the_table is not None:
             the_table.drop(bind=self._get_db_engine())
+            self._invalidate_table(name)
 
     def count(self, table_name: str) -> int:
         try:
@@ -47,60 +159,264 @@ class SqlClient(DbClient):
         return count
 
     def insert_in_batch(self, table_name: str, rows: List[List[str]]) -> Tuple[bool, List[List[str]]]:
-        list_of_model_dicts, failed_rows = self._build_entities_from_rows(rows)
-        if list_of_model_dicts:
+        rows_with_entities, failed_rows = self.build_entities(rows)
+        return self.insert_entities_in_batch(table_name, rows_with_entities), failed_rows
+
+    def insert_one_by_one(self, table_name: str, rows: List[List[str]]) -> List[List[str]]:
+        rows_with_entities, failed_rows = self.build_entities(rows)
+        return failed_rows + self.insert_entities_one_by_one(table_name, rows_with_entities)
+
+    def build_entities(self, rows: List[List[str]]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        return self.entity_builder.build_entities(rows)
+
+    def validate_entities(self, table_name: str,
+                          rows_with_entities: List[RowWithEntity]) -> Tuple[List[RowWithEntity], List[List[str]]]:
+        table = self._get_table(table_name)
+        if table is None or not rows_with_entities:
+            return rows_with_entities, []
+        entity_keys = set(rows_with_entities[0][1].keys())
+        not_null_columns = [c.name for c in table.columns if not c.nullable and c.name in entity_keys]
+        max_lengths = [(c.name, c.type.length) for c in table.columns
+                       if getattr(c.type, "length", None) and c.name in entity_keys] \
+            if self._get_db_engine().dialect.name in LENGTH_ENFORCING_DIALECTS else []
+        int_ranges = [(c.name, self._int_range(c.type)) for c in table.columns
+                      if isinstance(c.type, Integer) and c.name in entity_keys]
+        unique_keys = [key for key in self._unique_keys(table) if all(c in entity_keys for c in key)]
+        if self.on_conflict == ON_CONFLICT_UPDATE:
+            conflict_target = self._conflict_target(table, entity_keys)
+            unique_keys = [key for key in unique_keys if key != conflict_target]  # later row updates earlier one
+        seen_keys = [set() for _ in unique_keys]  # type: List[Set[Tuple[Any, ...]]]
+        valid, invalid_rows = [], []
+        for row, entity in rows_with_entities:
+            problem = self._find_constraint_violation(entity, not_null_columns, max_lengths, int_ranges)
+            if problem is None:
+                problem = self._find_duplicated_key(entity, unique_keys, seen_keys)
+                if problem is not None and self.on_conflict == ON_CONFLICT_SKIP:
+                    self._uncommitted_skipped_count += 1
+                    continue
+            if problem is None:
+                valid.append((row, entity))
+            else:
+                self.logger.debug("Row {} violates constraint: {}".format(row, problem))
+                invalid_rows.append(row)
+        return valid, invalid_rows
+
+    def insert_entities_in_batch(self, table_name: str, rows_with_entities: List[RowWithEntity]) -> bool:
+        if rows_with_entities:
             try:
-                self._insert_entities(list_of_model_dicts, table_name)
-                return True, failed_rows
+                self._bulk_insert_entities([entity for _, entity in rows_with_entities], table_name)
             except Exception as e:
-                self.logger.debug("Failed to insert {} objects in batch: {}".format(len(list_of_model_dicts), e))
-                return False, failed_rows
-        else:
-            return True, failed_rows
+                self.logger.debug("Failed to insert {} objects in batch: {}".format(len(rows_with_entities), e))
+                return False
+        return True
 
-    def insert_one_by_one(self, table_name: str, rows: List[List[str]]) -> List[List[str]]:
-        all_failed_rows = []
-        for row in rows:
-            list_of_entities, failed_rows = self._build_entities_from_rows([row])
-            all_failed_rows.extend(failed_rows)
-            if list_of_entities:
-                try:
-                    self._insert_entities(list_of_entities, table_name)
-                except Exception:
-                    all_failed_rows.append(row)
-        return all_failed_rows
+    def insert_entities_one_by_one(self, table_name: str, rows_with_entities: List[RowWithEntity]) -> List[List[str]]:
+        failed_rows = []
+        for row, entity in rows_with_entities:
+            try:
+                self._insert_entities([entity], table_name)
+            except Exception:
+                failed_rows.append(row)
+        return failed_rows
+
+    def end_chunk(self, chunk_id: Optional[Any] = None) -> bool:
+        self._chunks_in_transaction += 1
+        if chunk_id is not None:
+            self._uncommitted_chunk_ids.append(chunk_id)
+        if self._is_commit_due():
+            return self.commit()
+        return False
+
+    def inserted_rows_count(self) -> int:
+        return self.inserted_count
+
+    def skipped_rows_count(self) -> int:
+        return self.skipped_count
+
+    def pop_committed_chunk_ids(self) -> List[Any]:
+        chunk_ids, self._committed_chunk_ids = self._committed_chunk_ids, []
+        return chunk_ids
+
+    def commit(self) -> bool:
+        """Commits pending transaction, if any; returns whether it (or chunks ended since last commit) was committed;
+        rows inserted and skipped within it are counted only once it's committed; if committing fails, transaction
+        is rolled back and error is raised"""
+        chunk_ids, self._uncommitted_chunk_ids = self._uncommitted_chunk_ids, []
+        inserted, skipped = self._uncommitted_inserted_count, self._uncommitted_skipped_count
+        self._uncommitted_inserted_count, self._uncommitted_skipped_count = 0, 0
+        if self._transaction is None:
+            self._committed_chunk_ids.extend(chunk_ids)  # nothing was written for these chunks
+            self.skipped_count += skipped  # rows duplicated within them
+            return bool(chunk_ids)
+        transaction, chunks = self._transaction, self._chunks_in_transaction
+        self._transaction, self._transaction_start, self._chunks_in_transaction = None, None, 0
+        try:
+            transaction.commit()
+            self._committed_chunk_ids.extend(chunk_ids)
+            self.inserted_count += inserted
+            self.skipped_count += skipped
+            self.logger.debug("Committed transaction of {} chunk(s)".format(chunks))
+            return True
+        except Exception as e:
+            self.logger.error("Could not commit transaction of {} chunk(s): {}".format(chunks, e))
+            with suppress(Exception):
+                transaction.rollback()
+            raise
 
     def close(self) -> None:
-        if self._conn is not None and not self._conn.closed:
-            self._conn.close()
+        try:
+            self.commit()
+        finally:
+            self.logger.debug("Closing SQL client after {} table reflection(s)".format(self.reflection_count))
+            if self._conn is not None and not self._conn.closed:
+                self._conn.close()
+            if self._owns_db_engine and self._db_engine is not None:
+                self._db_engine.dispose()
+                self._db_engine = None
 
-    def _build_entities_from_rows(self, rows: List[List[str]]) -> Tuple[List[Dict[str, Any]], List[List[str]]]:
-        list_of_model_dicts = []
-        failed_rows = []
-        for row_cells in rows:
-            entity = self.entity_builder.to_entity(row_cells)
-            if entity is not None:
-                list_of_model_dicts.append(entity)
-            else:
-                failed_rows.append(row_cells)
-        return list_of_model_dicts, failed_rows
+    def _report_duplicates(self, table: Table, column_name: str) -> int:
+        column = table.c[column_name]
+        duplicated_values = self._get_connection().execute(
+            select([column, func.count()]).where(column.isnot(None)).group_by(column).having(func.count() > 1)
+        ).fetchall()
+        if duplicated_values:
+            self.logger.warning("Can not create unique index on column {} of table {}: {} value(s) are duplicated, "
+                                "e.g. (value, rows): {}".format(column_name, table.name, len(duplicated_values),
+                                                                duplicated_values[:DUPLICATES_REPORT_LIMIT]))
+        return len(duplicated_values)
+
+    def _int_range(self, int_type: Integer) -> Tuple[int, int]:
+        if isinstance(int_type, SmallInteger):
+            bits = 16
+        elif isinstance(int_type, BigInteger) or self._get_db_engine().dialect.name == "sqlite":
+            bits = 64
+        else:
+            bits = 32
+        return -2 ** (bits - 1), 2 ** (bits - 1) - 1
+
+    def _unique_keys(self, table: Table) -> List[Tuple[str, ...]]:
+        """Returns column names of primary key and all unique constraints and indexes of given table"""
+        keys = [tuple(c.name for c in table.primary_key.columns)]
+        keys.extend(tuple(c.name for c in constraint.columns) for constraint in table.constraints
+                    if isinstance(constraint, UniqueConstraint))
+        keys.extend(tuple(c.name for c in index.columns) for index in table.indexes if index.unique)
+        return [k for k in set(keys) if k]
+
+    def _conflict_target(self, table: Table, entity_keys: Set[str]) -> Optional[Tuple[str, ...]]:
+        """Returns columns of primary key or, if it's not provided in entities (e.g. autoincremented), of first
+        unique constraint or index, on which conflicting rows update existing ones"""
+        primary_key = tuple(c.name for c in table.primary_key.columns)
+        if primary_key and all(c in entity_keys for c in primary_key):
+            return primary_key
+        unique_keys = sorted(key for key in self._unique_keys(table) if all(c in entity_keys for c in key))
+        return unique_keys[0] if unique_keys else None
+
+    def _find_constraint_violation(self, entity: Dict[str, Any], not_null_columns: List[str],
+                                   max_lengths: List[Tuple[str, int]],
+                                   int_ranges: List[Tuple[str, Tuple[int, int]]]) -> Optional[str]:
+        for column_name in not_null_columns:
+            if entity[column_name] is None:
+                return "NULL value in NOT NULL column {}".format(column_name)
+        for column_name, max_length in max_lengths:
+            value = entity[column_name]
+            if isinstance(value, str) and len(value) > max_length:
+                return "value of column {} longer than {}".format(column_name, max_length)
+        for column_name, (min_value, max_value) in int_ranges:
+            value = entity[column_name]
+            if value is not None and not min_value <= value <= max_value:
+                return "value of column {} out of range: {}".format(column_name, value)
+        return None
+
+    def _find_duplicated_key(self, entity: Dict[str, Any], unique_keys: List[Tuple[str, ...]],
+                             seen_keys: List[Set[Tuple[Any, ...]]]) -> Optional[str]:
+        keys = [tuple(entity[c] for c in unique_key) for unique_key in unique_keys]
+        for unique_key, key, seen in zip(unique_keys, keys, seen_keys):
+            if None not in key and key in seen:
+                return "duplicated value of unique key {}: {}".format(unique_key, key)
+        for key, seen in zip(keys, seen_keys):
+            seen.add(key)
+        return None
+
+    def _bulk_insert_entities(self, list_of_model_dicts: List[Dict[str, Any]], table_name: str) -> Connection:
+        return self._insert_entities(list_of_model_dicts, table_name)
 
     def _insert_entities(self, list_of_model_dicts: List[Dict[str, Any]], table_name: str) -> Connection:
         db_connection = self._get_connection()
         table = self._get_table(table_name)
         if table is None:
             raise Exception("There's not table named {} in {}".format(table_name, self.db_url))
-        db_connection.execute(table.insert(), list_of_model_dicts)
+        with self._savepoint(db_connection):
+            result = db_connection.execute(self._insert_statement(table, list_of_model_dicts[0].keys()),
+                                           list_of_model_dicts)
+        self._count_written_rows(len(list_of_model_dicts), result.rowcount)
         return db_connection
 
+    def _count_written_rows(self, rows: int, rowcount: int) -> None:
+        """Counts rows of successful statement by row count reported by DB driver (-1 if it does not know it), so that
+        inserted rows need not be counted in table; in update mode, updated rows are counted as inserted"""
+        inserted = rowcount if 0 <= rowcount <= rows else rows
+        self._uncommitted_inserted_count += inserted
+        self._uncommitted_skipped_count += rows - inserted
+
+    def _insert_statement(self, table: Table, column_names: Iterable[str]) -> Insert:
+        """Returns INSERT statement handling rows conflicting with existing ones according to on_conflict mode"""
+        if self.on_conflict == ON_CONFLICT_FAIL:
+            return table.insert()
+        dialect = self._get_db_engine().dialect
+        if dialect.name not in ("sqlite", "postgresql"):
+            raise ValueError("Handling conflicts is not supported for {} databases".format(dialect.name))
+        conflict_target = self._conflict_target(table, set(column_names))
+        updated_columns = []  # type: List[str]
+        if self.on_conflict == ON_CONFLICT_SKIP:
+            conflict_target = None  # rows conflicting on any unique key are skipped
+        elif conflict_target is not None:
+            updated_columns = [c for c in column_names if c not in conflict_target]
+        if dialect.name == "sqlite":
+            if dialect.dbapi.sqlite_version_info < SQLITE_UPSERT_MIN_VERSION:
+                raise ValueError("Handling conflicts requires SQLite {} or newer".format(
+                    ".".join(map(str, SQLITE_UPSERT_MIN_VERSION))))
+            return SqliteUpsert(table, conflict_target, updated_columns)
+        statement = pg_insert(table)
+        if conflict_target is None:
+            return statement.on_conflict_do_nothing()
+        if not updated_columns:
+            return statement.on_conflict_do_nothing(index_elements=list(conflict_target))
+        return statement.on_conflict_do_update(index_elements=list(conflict_target),
+                                               set_={c: statement.excluded[c] for c in updated_columns})
+
+    @contextmanager
+    def _savepoint(self, db_connection: Connection) -> Iterator[None]:
+        """Begins transaction if there's none pending and wraps statements in SAVEPOINT, so that on error only they
+        are rolled back"""
+        if self._transaction is None:
+            self._transaction = db_connection.begin()
+            self._transaction_start = datetime.utcnow()
+        with db_connection.begin_nested():
+            yield
+
+    def _is_commit_due(self) -> bool:
+        if self.commit_every_chunks is not None and self._chunks_in_transaction >= self.commit_every_chunks:
+            return True
+        return self.commit_every_sec is not None and self._transaction_start is not None and \
+            seconds_between(self._transaction_start) >= self.commit_every_sec
+
     def _get_table(self, name: str) -> Optional[Table]:
-        meta = MetaData()
-        meta.reflect(bind=self._get_db_engine())
-        try:
-            return meta.tables[name]
-        except KeyError as e:
-            self.logger.debug("Could not find DB table named {}: {}".format(name, e))
-            return None
+        """Returns table metadata, reflecting only given table from DB on first call; cached afterwards"""
+        table = self._tables.get(name)
+        if table is None:
+            meta = MetaData()
+            self.reflection_count += 1
+            try:
+                meta.reflect(bind=self._get_db_engine(), only=[name])
+                table = meta.tables[name]
+            except (InvalidRequestError, KeyError) as e:
+                self.logger.debug("Could not find DB table named {}: {}".format(name, e))
+                return None
+            self._tables[name] = table
+        return table
+
+    def _invalidate_table(self, name: str) -> None:
+        self._tables.pop(name, None)
 
     def _get_connection(self) -> Connection:
         if self._conn is None or self._conn.closed:
@@ -110,19 +426,28 @@ class SqlClient(DbClient):
     def _get_db_engine(self) -> Engine:
         if self._db_engine is None:
             self.logger.debug("Connecting to DB with connection {}".format(self.db_url))
-            if self.ca_file is not None:
-                ssl_args = {'ssl': {'cert': self.ca_file}}
-                self._db_engine = create_engine(self.db_url, echo=False, poolclass=NullPool, connect_args=ssl_args)
+            engine_args = {"echo": False}  # type: Dict[str, Any]
+            if self.pool_size > 0:
+                engine_args.update({"poolclass": QueuePool, "pool_size": self.pool_size,
+                                    "pool_recycle": self.pool_recycle_sec, "pool_pre_ping": self.pool_pre_ping})
             else:
-                self._db_engine = create_engine(self.db_url, echo=False, poolclass=NullPool)
+                engine_args.update({"poolclass": NullPool})
+            if self.ca_file is not None:
+                engine_args.update({"connect_args": {'ssl': {'cert': self.ca_file}}})
+            self._db_engine = create_engine(self.db_url, **engine_args)
+            if self._db_engine.dialect.name == "sqlite":
+                enable_sqlite_savepoints(self._db_engine)
         return self._db_engine
 
     def _sql_table_from_columns(self, sql_metadata: MetaData, table_name: str, columns: List[ConfColumn],
-                                pkey: PrimaryKeyConf) -> Table:
-        sql_columns = {c.name: Column(c.name, c.sql_type, primary_key=c.name in pkey.columns,
-                                      nullable=c.nullable, index=c.indexed, unique=c.unique)
+                                pkey: PrimaryKeyConf, with_indexes: bool = True) -> Table:
+        sql_columns = {c.name: Column(c.name, c.sql_type, primary_key=c.name in pkey.columns, nullable=c.nullable,
+                                      index=c.indexed and with_indexes, unique=c.unique and with_indexes)
                        for c in columns}
         if pkey.mode == PKEY_AUTOINC:
-            id_column = Column("ID", Integer, primary_key=True, autoincrement=True)
+            id_column = Column(GENERATED_PKEY_COLUMN, Integer, primary_key=True, autoincrement=True)
+            sql_columns.update({"id": id_column})
+        elif pkey.mode == PKEY_UUID:
+            id_column = Column(GENERATED_PKEY_COLUMN, String(UUID_LENGTH), primary_key=True)
             sql_columns.update({"id": id_column})
         return Table(table_name, sql_metadata, *sql_columns.values())
@@ -0,0 +1,313 @@
+import json
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from threading import Thread, Lock, Event
+from typing import Dict, Any, List, Optional, Iterator, Callable
+
+from todb.logger import get_logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory is then not reported
+    resource = None  # type: ignore
+
+STAGE_READ = "read"
+STAGE_PARSE = "parse"
+STAGE_CAST = "cast"
+STAGE_VALIDATE = "validate"
+STAGE_INSERT = "insert"
+STAGE_RETRY = "retry"
+STAGE_COMMIT = "commit"
+STAGE_QUEUE_PUT = "queue_put"
+STAGE_QUEUE_GET = "queue_get"
+STAGE_FAILED_ROWS_WRITE = "failed_rows_write"
+STAGE_SHM_WAIT = "shm_wait"
+
+COUNTER_ROWS = "rows"
+COUNTER_CHUNKS = "chunks"
+COUNTER_FAILED_ROWS = "failed_rows"
+COUNTER_SHM_BYTES = "shm_bytes"
+COUNTER_INLINE_BYTES = "inline_bytes"
+
+MAXIMUM_PEAK_RSS_kB = "peak_rss_kB"
+MAXIMUM_SHM_USED_BYTES = "shm_used_bytes"
+
+HISTOGRAM_BUCKETS_SEC = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0]
+DEFAULT_REPORT_INTERVAL_SEC = 10.0
+
+MESSAGE_STATS = "stats"
+MESSAGE_RESULT = "result"
+MESSAGE_CHUNK_TIMING = "chunk_timing"
+
+GLOBAL_STATS = None
+
+
+class StageTimer(object):
+    """Number, total and maximal duration of runs of a stage, with histogram of durations"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_sec = 0.
+        self.max_sec = 0.
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_SEC) + 1)  # last bucket counts runs longer than all bounds
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total_sec += seconds
+        self.max_sec = max(self.max_sec, seconds)
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_SEC):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, timer_dict: Dict[str, Any]) -> None:
+        self.count += timer_dict["count"]
+        self.total_sec += timer_dict["total_sec"]
+        self.max_sec = max(self.max_sec, timer_dict["max_sec"])
+        self.buckets = [a + b for a, b in zip(self.buckets, timer_dict["buckets"])]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "total_sec": self.total_sec, "max_sec": self.max_sec,
+                "buckets": list(self.buckets)}
+
+
+def peak_rss_kB() -> Optional[int]:
+    """Returns peak resident set size of this process (if it can be measured)"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss  # macOS reports bytes, Linux kilobytes
+
+
+class Stats(object):
+    """Per-stage timers, counters and maxima (e.g. of memory usage) of a process; thread-safe, so that they can be
+    reported while being collected"""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._timers = {}  # type: Dict[str, StageTimer]
+        self._counters = {}  # type: Dict[str, int]
+        self._maxima = {}  # type: Dict[str, int]
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            timer = self._timers.get(stage)
+            if timer is None:
+                timer = self._timers[stage] = StageTimer()
+            timer.add(seconds)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def record_max(self, name: str, value: int) -> None:
+        with self._lock:
+            self._maxima[name] = max(self._maxima.get(name, value), value)
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Adds timers and counters of snapshot (e.g. sent by other process) to these; maxima are maxima of both"""
+        with self._lock:
+            for stage, timer_dict in snapshot["stages"].items():
+                self._timers.setdefault(stage, StageTimer()).merge(timer_dict)
+            for counter, value in snapshot["counters"].items():
+                self._counters[counter] = self._counters.get(counter, 0) + value
+            for name, value in snapshot.get("maxima", {}).items():
+                self._maxima[name] = max(self._maxima.get(name, value), value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"stages": {stage: t.to_dict() for stage, t in self._timers.items()},
+                    "counters": dict(self._counters), "maxima": dict(self._maxima)}
+
+    def pop_snapshot(self) -> Dict[str, Any]:
+        """Returns snapshot and resets timers, counters and maxima, so that next snapshot contains only what came
+        later"""
+        with self._lock:
+            snapshot = {"stages": {stage: t.to_dict() for stage, t in self._timers.items()},
+                        "counters": dict(self._counters), "maxima": dict(self._maxima)}
+            self._timers, self._counters, self._maxima = {}, {}, {}
+        return snapshot
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._timers and not self._counters and not self._maxima
+
+    def record_peak_rss(self) -> None:
+        peak_rss = peak_rss_kB()
+        if peak_rss is not None:
+            self.record_max(MAXIMUM_PEAK_RSS_kB, peak_rss)
+
+
+def get_stats() -> Stats:
+    global GLOBAL_STATS
+    if GLOBAL_STATS is None:
+        GLOBAL_STATS = Stats()
+    return GLOBAL_STATS
+
+
+def reset_stats() -> None:
+    """Forgets stats collected so far; to be called in a forked process, which inherits stats of its parent"""
+    global GLOBAL_STATS
+    GLOBAL_STATS = Stats()
+
+
+def merged_snapshot(*snapshots: Dict[str, Any]) -> Dict[str, Any]:
+    stats = Stats()
+    for snapshot in snapshots:
+        stats.merge(snapshot)
+    return stats.snapshot()
+
+
+def to_prometheus_text(snapshot: Dict[str, Any], prefix: str = "todb") -> str:
+    """Formats snapshot in Prometheus text exposition format: stage timers as histograms, counters as counters"""
+    lines = ["# TYPE {}_stage_seconds histogram".format(prefix)]
+    for stage, timer in sorted(snapshot["stages"].items()):
+        cumulative = 0
+        for bound, count in zip(HISTOGRAM_BUCKETS_SEC, timer["buckets"]):
+            cumulative += count
+            lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(prefix, stage, bound, cumulative))
+        lines.append('{}_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(prefix, stage, timer["count"]))
+        lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(prefix, stage, timer["total_sec"]))
+        lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, stage, timer["count"]))
+    for counter, value in sorted(snapshot["counters"].items()):
+        lines.append("# TYPE {}_{}_total counter".format(prefix, counter))
+        lines.append("{}_{}_total {}".format(prefix, counter, value))
+    for name, value in sorted(snapshot.get("maxima", {}).items()):
+        lines.append("# TYPE {}_{}_max gauge".format(prefix, name))
+        lines.append("{}_{}_max {}".format(prefix, name, value))
+    return "\n".join(lines) + "\n"
+
+
+def write_atomically(file_path: str, content: str) -> None:
+    """Writes file by renaming temporary one, so that readers (e.g. node_exporter) never see it half-written"""
+    tmp_path = "{}.tmp{}".format(file_path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_path, file_path)
+
+
+class RunReport(object):
+    """Writes stats of an import run as JSON report and, optionally, Prometheus textfile"""
+
+    def __init__(self, report_path: Optional[str], prometheus_path: Optional[str],
+                 details: Optional[Dict[str, Any]] = None) -> None:
+        self.report_path = report_path
+        self.prometheus_path = prometheus_path
+        self.details = details or {}
+        self.start_time = time.time()
+
+    def write(self, snapshot: Dict[str, Any], finished: bool) -> None:
+        if self.report_path is not None:
+            report = dict(self.details)
+            report.update({"finished": finished, "elapsed_sec": round(time.time() - self.start_time, 3),
+                           "bucket_bounds_sec": HISTOGRAM_BUCKETS_SEC})
+            report.update(snapshot)
+            write_atomically(self.report_path, json.dumps(report, indent=2, sort_keys=True))
+        if self.prometheus_path is not None:
+            write_atomically(self.prometheus_path, to_prometheus_text(snapshot))
+
+
+class StatsCollector(Thread):
+    """Consumes messages sent by worker processes: merges stats snapshots and keeps results; periodically writes
+    report of merged stats together with stats of this process; chunk timings are passed to given handler"""
+
+    def __init__(self, messages_queue: Any, report: RunReport,
+                 interval_sec: float = DEFAULT_REPORT_INTERVAL_SEC,
+                 chunk_timing_handler: Optional[Callable[[Any], None]] = None) -> None:
+        super(StatsCollector, self).__init__(name="stats-collector", daemon=True)
+        self.messages_queue = messages_queue
+        self.report = report
+        self.interval_sec = interval_sec
+        self.chunk_timing_handler = chunk_timing_handler
+        self.stats = Stats()
+        self.logger = get_logger()
+        self._results = queue.Queue()  # type: queue.Queue
+        self._stopped = Event()
+
+    def run(self) -> None:
+        next_report = time.time() + self.interval_sec
+        while not self._stopped.is_set():
+            try:
+                self._handle(self.messages_queue.get(timeout=min(1., self.interval_sec)))
+            except queue.Empty:
+                pass
+            if time.time() >= next_report:
+                self._write_report(finished=False)
+                next_report = time.time() + self.interval_sec
+
+    def wait_for_results(self, count: int) -> List[Any]:
+        """Returns given number of results sent by workers, waiting for them if needed"""
+        return [self._results.get() for _ in range(count)]
+
+    def finish(self) -> Dict[str, Any]:
+        """Stops collecting, writes final report and returns merged stats of all processes"""
+        self._stopped.set()
+        self.join()
+        while True:
+            try:
+                self._handle(self.messages_queue.get_nowait())
+            except queue.Empty:
+                break
+        return self._write_report(finished=True)
+
+    def _handle(self, message: Any) -> None:
+        kind, payload = message
+        if kind == MESSAGE_STATS:
+            self.stats.merge(payload)
+        elif kind == MESSAGE_CHUNK_TIMING:
+            if self.chunk_timing_handler is not None:
+                self.chunk_timing_handler(payload)
+        else:
+            self._results.put(payload)
+
+    def _write_report(self, finished: bool) -> Dict[str, Any]:
+        get_stats().record_peak_rss()
+        snapshot = merged_snapshot(self.stats.snapshot(), get_stats().snapshot())
+        try:
+            self.report.write(snapshot, finished)
+        except Exception as e:
+            self.logger.error("Could not write run report: {}".format(e))
+        return snapshot
+
+
+def format_stages_summary(snapshot: Dict[str, Any]) -> str:
+    stages = sorted(snapshot["stages"].items(), key=lambda s: s[1]["total_sec"], reverse=True)
+    return ", ".join(["{}: {:.2f}s in {} run(s)".format(stage, t["total_sec"], t["count"]) for stage, t in stages])
+
+
+class StatsSender(object):
+    """Sends stats collected in a process to StatsCollector of parent process, at most once per interval"""
+
+    def __init__(self, messages_queue: Any, interval_sec: float = DEFAULT_REPORT_INTERVAL_SEC) -> None:
+        self.messages_queue = messages_queue
+        self.interval_sec = interval_sec
+        self._last_sent = time.time()
+
+    def send(self, force: bool = False) -> None:
+        """Sends stats collected since last sending, if interval has passed or sending is forced"""
+        if force or time.time() - self._last_sent >= self.interval_sec:
+            stats = get_stats()
+            stats.record_peak_rss()
+            if not stats.is_empty():
+                self.messages_queue.put((MESSAGE_STATS, stats.pop_snapshot()))
+            self._last_sent = time.time()
+
+    def send_chunk_timing(self, timing: Any) -> None:
+        self.messages_queue.put((MESSAGE_CHUNK_TIMING, timing))
+
+    def send_result(self, result: Any) -> None:
+        """Sends remaining stats and result of process' work"""
+        self.send(force=True)
+        self.messages_queue.put((MESSAGE_RESULT, result))
@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import Callable, Any, List, Tuple, Dict, Optional
+
+from dateutil.parser import parse
+
+from todb.logger import get_logger
+
+FORMAT_INFERENCE_SAMPLES = 16
+PARSED_VALUES_CACHE_SIZE = 4096
+ISO_FORMAT = "ISO-8601"
+
+CANDIDATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d %H:%M",
+    "%Y/%m/%d",
+    "%d %b %Y %H:%M:%S",
+    "%d %b %Y %H:%M",
+    "%d %b %Y",
+    "%b %d %Y %H:%M:%S",
+    "%b %d %Y",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+    "%H:%M:%S.%f",
+    "%H:%M:%S",
+    "%H:%M"
+]
+
+
+def _strptime_parser(time_format: str) -> Callable[[str], datetime]:
+    def parse_with_format(value: str) -> datetime:
+        return datetime.strptime(value, time_format)
+
+    return parse_with_format
+
+
+def _candidate_parsers() -> List[Tuple[str, Callable[[str], datetime]]]:
+    parsers = [(f, _strptime_parser(f)) for f in CANDIDATE_FORMATS]
+    if hasattr(datetime, "fromisoformat"):
+        parsers.insert(0, (ISO_FORMAT, datetime.fromisoformat))  # type: ignore
+    return parsers
+
+
+class TemporalParser(object):
+    """Casts strings to datetime, date or time (depending on convert function) with dateutil until it learns column's
+    format from first values; afterwards uses the learned format and falls back to dateutil only for non-matching ones"""
+
+    def __init__(self, convert: Callable[[datetime], Any], sample_size: int = FORMAT_INFERENCE_SAMPLES,
+                 cache_size: int = PARSED_VALUES_CACHE_SIZE) -> None:
+        self.convert = convert
+        self.sample_size = sample_size
+        self.cache_size = cache_size
+        self.learned_format = None  # type: Optional[str]
+        self.logger = get_logger()
+        self._samples = []  # type: Optional[List[Tuple[str, Any]]]
+        self._fast_parse = None  # type: Optional[Callable[[str], datetime]]
+        self._cache = {}  # type: Dict[str, Any]
+
+    def __call__(self, value: str) -> Any:
+        parsed = self._cache.get(value)
+        if parsed is None:
+            parsed = self._parse(value)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[value] = parsed
+        return parsed
+
+    def _parse(self, value: str) -> Any:
+        if self._fast_parse is not None:
+            try:
+                return self.convert(self._fast_parse(value))
+            except ValueError:
+                return self.convert(parse(value))
+        parsed = self.convert(parse(value))
+        if self._samples is not None:
+            self._samples.append((value, parsed))
+            if len(self._samples) >= self.sample_size:
+                self._learn_format()
+        return parsed
+
+    def _learn_format(self) -> None:
+        samples, self._samples = self._samples or [], None
+        for time_format, fast_parse in _candidate_parsers():
+            if all(self._parses_same(fast_parse, value, expected) for value, expected in samples):
+                self.learned_format, self._fast_parse = time_format, fast_parse
+                self.logger.debug("Learned time format {} from values: {}".format(time_format, [v for v, _ in samples]))
+                return
+        self.logger.debug("Could not learn time format from values: {}".format([v for v, _ in samples]))
+
+    def _parses_same(self, fast_parse: Callable[[str], datetime], value: str, expected: Any) -> bool:
+        try:
+            return self.convert(fast_parse(value)) == expected
+        except ValueError:
+            return False
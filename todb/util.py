@@ -1,9 +1,14 @@
+import hashlib
 from datetime import datetime
 from os import path
-from typing import Optional, Any, List, Dict, Tuple
+from typing import Optional, Any, List, Dict, Tuple, Iterator, Iterable, TypeVar
 from uuid import UUID, uuid5
 
+T = TypeVar("T")
+_EXHAUSTED = object()
+
 SEED_TEXT = UUID(int=1248789574)
+_UUID_VARIANT_DIGITS = {d: "89ab"[int(d, 16) & 0x3] for d in "0123456789abcdef"}  # RFC 4122 variant bits
 
 
 def seconds_between(start: datetime, end: datetime = None, precision: int = 3) -> float:
@@ -40,6 +45,40 @@ def gen_uuid(content: str) -> str:
     return str(uuid5(SEED_TEXT, str(content)))
 
 
+def gen_uuids(contents: List[str]) -> List[str]:
+    """Returns the same values as gen_uuid for each of contents, but skips building UUID objects: hashes contents
+    starting from precomputed hash state of seed and formats version 5 UUID directly from SHA-1 hex digest"""
+    seed_hash = hashlib.sha1(SEED_TEXT.bytes)
+    uuids = []
+    for content in contents:
+        content_hash = seed_hash.copy()
+        content_hash.update(content.encode("utf-8"))
+        d = content_hash.hexdigest()
+        uuids.append(d[:8] + "-" + d[8:12] + "-5" + d[13:16] + "-" + _UUID_VARIANT_DIGITS[d[16]] + d[17:20] + "-" +
+                     d[20:32])
+    return uuids
+
+
 def split_in_half(values: List[Any]) -> Tuple[List[Any], List[Any]]:
     half = len(values) // 2
     return values[:half], values[half:]
+
+
+def interleave(iterators: Iterable[Iterator[T]], window: int) -> Iterator[T]:
+    """Yields items of given iterators in round-robin order, keeping at most window of them started at once"""
+    pending = iter(iterators)
+    active = []  # type: List[Iterator[T]]
+    while True:
+        while len(active) < window:
+            next_iterator = next(pending, None)
+            if next_iterator is None:
+                break
+            active.append(next_iterator)
+        if not active:
+            return
+        for iterator in list(active):
+            item = next(iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                active.remove(iterator)
+            else:
+                yield item  # type: ignore